@@ -1,9 +1,14 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import math
-from scipy.signal import butter, filtfilt
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pipeline"))
+from signal_filters import lowpass
+from gait_normalize import normalize_trials, percent_axis
 
 
 # -------------------------------------------------
@@ -44,16 +49,6 @@ def get_all_muscle_columns(df):
     return [c for c in df.columns if c.lower() != 'time']
 
 
-# -------------------------------------------------
-# Butterworth low-pass filter (zero-phase)
-# -------------------------------------------------
-def butter_lowpass_filter(data, cutoff, fs, order=4):
-    nyq = 0.5 * fs
-    wn = cutoff / nyq
-    b, a = butter(order, wn, btype='low')
-    return filtfilt(b, a, data, axis=0)
-
-
 # -------------------------------------------------
 # Main processing + plotting function
 # -------------------------------------------------
@@ -81,16 +76,13 @@ def plot_all_muscles_filtered_0_100(
     dt = np.mean(np.diff(time))
     fs = 1.0 / dt
 
-    # ---- Normalize time to 0–100% ----
-    percent = 100 * (time - time[0]) / (time[-1] - time[0])
-
     # ---- Detect muscle columns ----
     muscle_cols = get_all_muscle_columns(df)
     print(f"Found {len(muscle_cols)} muscles")
 
     # ---- Filter muscle forces only ----
     muscle_data = df[muscle_cols].values
-    muscle_filt = butter_lowpass_filter(
+    muscle_filt = lowpass(
         muscle_data,
         cutoff=cutoff,
         fs=fs,
@@ -101,6 +93,10 @@ def plot_all_muscles_filtered_0_100(
     df_filt = df.copy()
     df_filt.loc[:, muscle_cols] = muscle_filt
 
+    # ---- Normalize to 0–100% (operator cached per file length) ----
+    percent = percent_axis()
+    muscle_norm = normalize_trials([muscle_filt])[0]
+
     # ---- Optional: save filtered .sto ----
     if out_path is not None:
         with open(out_path, 'w', newline='\n') as f:
@@ -133,8 +129,8 @@ def plot_all_muscles_filtered_0_100(
 
         axes = np.atleast_1d(axes).ravel()
 
-        for ax, muscle in zip(axes, muscle_cols):
-            ax.plot(percent, df_filt[muscle].values, linewidth=1)
+        for k, (ax, muscle) in enumerate(zip(axes, muscle_cols)):
+            ax.plot(percent, muscle_norm[:, k], linewidth=1)
             ax.set_title(muscle, fontsize=9)
             ax.set_ylabel('Force (N)')
             ax.set_xlim(0, 100)              # ✅ force 0–100%
@@ -0,0 +1,52 @@
+"""
+Shared runner for the per-trial batch tools.
+
+Every batch module (c3d_ingest, event_table, leg_assignment, leg_ensemble,
+stw_phases, preflight, marker_errors, marker_weight_sweep) maps one worker
+over a list of job tuples and logs a "[done/total] ..." line per result.
+run_jobs does that in a spawn-context process pool when cores > 1 - spawn,
+not fork, so OpenSim/Qt state is never inherited - and in this process
+otherwise.  The worker must be a module-level function so it can be
+pickled; it gets one job and returns one row.
+"""
+
+import logging
+from typing import Any, Callable, Iterable, List, Optional
+
+
+def run_jobs(
+    worker: Callable[[Any], Any],
+    jobs: Iterable[Any],
+    cores: int = 1,
+    log_row: Optional[Callable[[logging.Logger, int, int, Any], None]] = None,
+    logger: Optional[logging.Logger] = None,
+    key: Optional[Callable[[Any], Any]] = None,
+    chunksize: int = 1,
+) -> List[Any]:
+    """
+    worker(job) for every job, in a process pool when cores > 1 and there
+    is more than one job.  log_row(logger, done, total, row) is called as
+    each row arrives; the rows are returned sorted by key (or in the order
+    they finished).
+    """
+    jobs = list(jobs)
+    logger = logger or logging.getLogger("pipeline")
+    rows: List[Any] = []
+    total = len(jobs)
+
+    if cores > 1 and total > 1:
+        import multiprocessing as mp
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(processes=min(cores, total)) as pool:
+            for done, row in enumerate(pool.imap_unordered(worker, jobs, chunksize=chunksize), 1):
+                if log_row is not None:
+                    log_row(logger, done, total, row)
+                rows.append(row)
+    else:
+        for done, job in enumerate(jobs, 1):
+            row = worker(job)
+            if log_row is not None:
+                log_row(logger, done, total, row)
+            rows.append(row)
+
+    return sorted(rows, key=key) if key is not None else rows
@@ -0,0 +1,393 @@
+"""
+Headless, rules-driven mapping of a whole dataset to pipeline inputs.
+
+map_file(all)-main.py learns the layout from S01 with input() prompts and
+matches setup XMLs to trials by comparing every XML with every trial.  Its
+subjects_trials.json is not what pipeline_cli reads either.  This module
+does the same job without prompts:
+
+  * a rules file gives one root-relative glob per input ({subject} is the
+    subject folder name, e.g. S01); patterns are evaluated against the
+    FileInventory, so nothing is walked twice
+  * every file name is reduced to a trial key: lower-case tokens with the
+    subject id (S01, subject01, 01), role words (ik, setup, grf, ...) and
+    leading zeros removed, so ik_setup_STW1.xml, id_setup_S01_stw1.xml and
+    S01_stw1_grf.xml all key to "stw1"
+  * per subject and role the candidates are indexed by key once; each trial
+    is then a dict lookup (falling back to the one candidate whose tokens
+    contain all of the trial's), so matching is linear in the number of files
+  * ambiguous or missing matches are left empty and reported, never guessed
+
+Outputs, both ready for pipeline_cli (nothing is written, and the exit
+status is 1, when no trial of any subject could be mapped):
+
+  <root>/manifest.json       every subject with its own explicit paths
+                             (pipeline_cli.py --manifest)
+  <root>/template_map.json   the first subject's mapping
+                             (pipeline_cli.py --template, gui_pipeline)
+
+Rules (JSON; missing keys take the defaults below, which match the
+Sxx/Sxx/Mocap + IK/ID/SO/scale layout of this project, as written by
+c3d_ingest and read by template_map.json):
+
+    {"model": "model/*.osim",
+     "static_trc": "{subject}/{subject}/Mocap/trcResults/*static*.trc",
+     "scale_xml": "{subject}/scale/*[Ss]cale*.xml",
+     "trial_trc": "{subject}/{subject}/Mocap/trcResults/*.trc",
+     "trial_mot": "{subject}/{subject}/Mocap/grfResults/*.mot*",
+     "ik_xml": "{subject}/IK/*.xml",
+     "id_xml": "{subject}/ID/*.xml",
+     "so_xml": "{subject}/SO/*.xml",
+     "grf_xml": "{subject}/ID/grf/*.xml",
+     "exclude_trials": ["*static*"],
+     "ignore_tokens": ["ik", "id", "so", "grf", "setup", "scale", "subject"],
+     "required": ["ik_xml"],
+     "targets": {"grf_xml": "{subject}/ID/grf/{subject}_{trial}_grf.xml",
+                 "id_xml": "{subject}/ID/id_setup_{subject}_{trial}.xml",
+                 "so_xml": "{subject}/SO/so_setup_{subject}_{trial}.xml"}}
+
+"targets" are the paths of setups the pipeline generates itself: a trial
+with no (unambiguous) match for such a field gets its target instead of an
+empty path, so a fresh dataset still maps to a runnable manifest.
+
+Usage:
+    python bulk_map.py --root D:/RESEARCH/STW_dataset/Extracted [--rules rules.json]
+                       [--subjects 01,02] [--manifest-out manifest.json]
+                       [--template-out template_map.json]
+    python "map_file(all)-main.py" --rules rules.json D:/RESEARCH/STW_dataset/Extracted
+"""
+
+import re
+import sys
+import json
+import fnmatch
+import logging
+import argparse
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from file_inventory import FileInventory
+from manifest import (
+    DEFAULT_MANIFEST_NAME,
+    MANIFEST_VERSION,
+    TRIAL_FIELDS,
+    compile_subject,
+    validate_manifest,
+    write_manifest,
+)
+from opensim_io import plain_name
+
+
+DEFAULT_TEMPLATE_NAME = "template_map.json"
+
+DEFAULT_RULES: Dict[str, Any] = {
+    "model": "model/*.osim",
+    "static_trc": "{subject}/{subject}/Mocap/trcResults/*static*.trc",
+    "scale_xml": "{subject}/scale/*[Ss]cale*.xml",
+    "trial_trc": "{subject}/{subject}/Mocap/trcResults/*.trc",
+    "trial_mot": "{subject}/{subject}/Mocap/grfResults/*.mot*",
+    "ik_xml": "{subject}/IK/*.xml",
+    "id_xml": "{subject}/ID/*.xml",
+    "so_xml": "{subject}/SO/*.xml",
+    "grf_xml": "{subject}/ID/grf/*.xml",
+    "exclude_trials": ["*static*"],
+    "ignore_tokens": ["ik", "id", "so", "grf", "setup", "scale", "subject"],
+    "required": ["ik_xml"],
+    "targets": {
+        "grf_xml": "{subject}/ID/grf/{subject}_{trial}_grf.xml",
+        "id_xml": "{subject}/ID/id_setup_{subject}_{trial}.xml",
+        "so_xml": "{subject}/SO/so_setup_{subject}_{trial}.xml",
+    },
+}
+
+# Per-trial inputs matched by key; trial_trc defines the trials themselves
+MATCHED_FIELDS = tuple(f for f in TRIAL_FIELDS if f != "trial_trc")
+
+
+# ---------------------------------------------------------------------------
+# Rules
+# ---------------------------------------------------------------------------
+
+def load_rules(path: Optional[Path]) -> Dict[str, Any]:
+    """
+    Defaults overlaid with a rules JSON file.
+
+    Raises:
+        ValueError: unknown keys (most likely a typo that would silently fall back)
+    """
+    rules = dict(DEFAULT_RULES)
+    if path is None:
+        return rules
+    with open(path, "r") as fh:
+        user = json.load(fh)
+    unknown = set(user) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError(f"Unknown rule key(s) in {path}: {sorted(unknown)}")
+    rules.update(user)
+    return rules
+
+
+def expand(pattern: str, subject_dir: str, trial: str = "") -> str:
+    return pattern.replace("{subject}", subject_dir).replace("{trial}", trial) if pattern else ""
+
+
+# ---------------------------------------------------------------------------
+# Trial keys and the token index
+# ---------------------------------------------------------------------------
+
+def trial_tokens(name: str, subject_num: str, ignore: Iterable[str]) -> Tuple[str, ...]:
+    """
+    Tokens identifying the trial a file belongs to:
+    'id_setup_S01_stw01.xml' with subject '01' -> ('stw1',).
+    """
+    stem = Path(plain_name(name)).stem.lower()
+    ignore = set(ignore)
+    subject = int(subject_num) if subject_num.isdigit() else None
+    out = []
+    for tok in re.split(r"[^a-z0-9]+", stem):
+        if not tok or tok in ignore:
+            continue
+        tok = re.sub(r"\d+", lambda m: str(int(m.group())), tok)
+        m = re.fullmatch(r"(?:s|sub|subject)?(\d+)", tok)
+        if m and subject is not None and int(m.group(1)) == subject:
+            continue
+        out.append(tok)
+    return tuple(out)
+
+
+class TokenIndex:
+    """Candidates of one role for one subject, indexed by trial key and by token."""
+
+    def __init__(self, paths: Iterable[Path], subject_num: str, ignore: Iterable[str]):
+        self.by_key: Dict[Tuple[str, ...], List[Path]] = defaultdict(list)
+        self.by_token: Dict[str, set] = defaultdict(set)
+        self.tokens: Dict[Path, Tuple[str, ...]] = {}
+        for p in paths:
+            toks = trial_tokens(p.name, subject_num, ignore)
+            self.tokens[p] = toks
+            self.by_key[toks].append(p)
+            for tok in toks:
+                self.by_token[tok].add(p)
+
+    def match(self, key: Tuple[str, ...]) -> Tuple[Optional[Path], str]:
+        """(path, "") on a unique match, else (None, reason)."""
+        exact = self.by_key.get(key, [])
+        if len(exact) == 1:
+            return exact[0], ""
+        if len(exact) > 1:
+            return None, "ambiguous: " + ", ".join(p.name for p in exact)
+        if not key or any(tok not in self.by_token for tok in key):
+            return None, "no match"
+        # Every candidate carrying all of the trial's tokens; keep the tightest one
+        found = set.intersection(*(self.by_token[tok] for tok in key))
+        if not found:
+            return None, "no match"
+        fewest = min(len(self.tokens[p]) for p in found)
+        best = [p for p in found if len(self.tokens[p]) == fewest]
+        if len(best) > 1:
+            return None, "ambiguous: " + ", ".join(sorted(p.name for p in best))
+        return best[0], ""
+
+
+# ---------------------------------------------------------------------------
+# Mapping
+# ---------------------------------------------------------------------------
+
+def _single(paths: List[Path]) -> Tuple[Optional[Path], str]:
+    if len(paths) == 1:
+        return paths[0], ""
+    if not paths:
+        return None, "not found"
+    return None, "ambiguous: " + ", ".join(p.name for p in paths)
+
+
+def map_subject(
+    inventory: FileInventory,
+    subject_dir: Path,
+    rules: Dict[str, Any],
+    model: Optional[Path],
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    The template-shaped mapping of one subject and the problems found.
+
+    Trials missing one of rules["required"] are left out (and reported);
+    unmatched fields with a rules["targets"] pattern get that target path.
+    """
+    subject_num = subject_dir.name.lstrip("Ss")
+    name = subject_dir.name
+    ignore = rules["ignore_tokens"]
+    targets = rules["targets"]
+    problems: List[str] = []
+
+    static_trc, why = _single(inventory.glob(expand(rules["static_trc"], name)))
+    if why and rules["static_trc"]:
+        problems.append(f"static_trc {why}")
+    scale_xml, why = _single(inventory.glob(expand(rules["scale_xml"], name)))
+    if why and rules["scale_xml"]:
+        problems.append(f"scale_xml {why}")
+
+    excluded = [p.lower() for p in rules["exclude_trials"]]
+    trials = [
+        p for p in inventory.glob(expand(rules["trial_trc"], name))
+        if p != static_trc and not any(fnmatch.fnmatchcase(p.name.lower(), e) for e in excluded)
+    ]
+    indexes = {
+        field: TokenIndex(inventory.glob(expand(rules[field], name)), subject_num, ignore)
+        for field in MATCHED_FIELDS if rules.get(field)
+    }
+    for field in [f for f, index in indexes.items() if not index.tokens]:
+        if field not in targets:
+            problems.append(f"{field}: nothing matches {expand(rules[field], name)}")
+        del indexes[field]
+
+    mapped = []
+    for trc in trials:
+        key = trial_tokens(trc.name, subject_num, ignore)
+        trial = {"trial_trc": str(trc)}
+        for field in MATCHED_FIELDS:
+            path, why = indexes[field].match(key) if field in indexes else (None, "")
+            if path is None and targets.get(field) and not why.startswith("ambiguous"):
+                # Generated by the pipeline: give it a place instead of an empty path
+                path, why = inventory.root / expand(targets[field], name, Path(plain_name(trc)).stem), ""
+            trial[field] = str(path) if path else ""
+            if why:
+                problems.append(f"{trc.stem}: {field} {why}")
+        missing = [f for f in rules["required"] if not trial.get(f)]
+        if missing:
+            problems.append(f"{trc.stem}: dropped, no {', '.join(missing)}")
+            continue
+        mapped.append(trial)
+
+    return {
+        "subject": str(subject_dir),
+        "root_dir": str(inventory.root),
+        "model": str(model) if model else "",
+        "static_trc": str(static_trc) if static_trc else "",
+        "scale_xml": str(scale_xml) if scale_xml else "",
+        "mapped_trials": mapped,
+    }, problems
+
+
+def map_dataset(
+    inventory: FileInventory,
+    subjects: List[str],
+    rules: Dict[str, Any],
+    logger: logging.Logger,
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Map every subject.  Returns (manifest, {subject: template-shaped mapping}).
+
+    Raises:
+        ValueError: the model pattern is ambiguous or the manifest fails validation
+    """
+    model = None
+    if rules["model"] and "{subject}" not in rules["model"]:
+        model, why = _single(inventory.glob(rules["model"]))
+        if why == "not found":
+            logger.warning("No model matches %r", rules["model"])
+        elif why:
+            raise ValueError(f"Model pattern {rules['model']!r} is {why}")
+
+    templates: Dict[str, Dict[str, Any]] = {}
+    entries = []
+    for idx, subject_num in enumerate(subjects, 1):
+        subject_dir = inventory.root / f"S{subject_num}"
+        subject_model = model
+        if rules["model"] and "{subject}" in rules["model"]:
+            subject_model, _ = _single(inventory.glob(expand(rules["model"], subject_dir.name)))
+        template, problems = map_subject(inventory, subject_dir, rules, subject_model)
+        templates[subject_num] = template
+        entries.append(compile_subject(template, subject_num))
+
+        log = logger.warning if problems else logger.info
+        log("[%d/%d] S%s  %d trial(s) mapped%s", idx, len(subjects), subject_num,
+            len(template["mapped_trials"]), f", {len(problems)} problem(s)" if problems else "")
+        for problem in problems:
+            logger.warning("    S%s %s", subject_num, problem)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "root_dir": str(inventory.root),
+        "template_subject": subjects[0] if subjects else "",
+        "subjects": entries,
+    }
+    problems = validate_manifest(manifest)
+    if problems:
+        raise ValueError("Invalid manifest:\n  " + "\n  ".join(problems))
+    return manifest, templates
+
+
+def write_template(template: Dict[str, Any], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(template, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Map a dataset to a pipeline_cli manifest and template without prompts",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--rules", default="", help="Rules JSON (default: built-in project layout)")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--manifest-out", default="",
+                        help=f"Manifest JSON (default: <root>/{DEFAULT_MANIFEST_NAME})")
+    parser.add_argument("--template-out", default="",
+                        help=f"Template JSON of the first subject (default: <root>/{DEFAULT_TEMPLATE_NAME})")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    from pipeline_cli import discover_subjects, setup_logging
+
+    args = build_parser().parse_args(argv)
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root).expanduser().resolve()
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+    try:
+        rules = load_rules(Path(args.rules) if args.rules else None)
+    except (OSError, ValueError) as exc:
+        logger.error("%s", exc)
+        sys.exit(1)
+
+    inventory = FileInventory.open(root_dir, logger=logger)
+    subjects = ([s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()]
+                or discover_subjects(root_dir, inventory))
+    if not subjects:
+        logger.error("No subjects found under %s", root_dir)
+        sys.exit(1)
+
+    try:
+        manifest, templates = map_dataset(inventory, subjects, rules, logger)
+    except ValueError as exc:
+        logger.error("%s", exc)
+        sys.exit(1)
+    if not any(e["mapped_trials"] for e in manifest["subjects"]):
+        logger.error("No trial mapped for any of %d subject(s); check the rules against the layout under %s",
+                     len(subjects), root_dir)
+        sys.exit(1)
+
+    manifest_path = Path(args.manifest_out or root_dir / DEFAULT_MANIFEST_NAME)
+    write_manifest(manifest, manifest_path)
+    template_path = Path(args.template_out or root_dir / DEFAULT_TEMPLATE_NAME)
+    write_template(templates[subjects[0]], template_path)
+
+    logger.info("%d subject(s), %d trial job(s) written to %s", len(manifest["subjects"]),
+                sum(len(e["mapped_trials"]) for e in manifest["subjects"]), manifest_path)
+    logger.info("Template (S%s) written to %s", subjects[0], template_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+C3D ingestion stage: raw capture -> pipeline-ready TRC and GRF .mot.
+
+Each C3D is read exactly once with ezc3d.  From that single parse the trial's
+marker .trc and ground-reaction .mot (forces, centre of pressure and free
+moments per plate) are written directly, and the marker-based gait event
+detector runs on the same arrays.  Trials whose outputs are newer than the
+C3D are skipped, so re-running on a capture session only touches new trials.
+
+Expected layout (same as the rest of the pipeline):
+    <root>/S01/S01/Mocap/stw1.c3d
+    <root>/S01/S01/Mocap/trcResults/stw1.trc
+    <root>/S01/S01/Mocap/grfResults/stw1.mot
+
+Usage:
+    python c3d_ingest.py --root D:/RESEARCH/STW_dataset/Extracted [--subjects 01,02] [--cores N] [--force]
+                         [--compress gz|zst]
+"""
+
+import sys
+import csv
+import logging
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from batch_runner import run_jobs
+from opensim_io import resolve_path, write_storage, write_trc
+
+
+# ---------------------------------------------------------------------------
+# Conventions
+# ---------------------------------------------------------------------------
+
+# Lab frame (Z up, Y left) -> OpenSim frame (Y up, Z right)
+LAB_TO_OPENSIM = np.array([
+    [1.0, 0.0, 0.0],
+    [0.0, 0.0, 1.0],
+    [0.0, -1.0, 0.0],
+])
+
+# Plates report the load applied *to* the plate; OpenSim wants the reaction
+REACTION_SIGN = -1.0
+
+# Below this vertical force a plate is considered unloaded (COP undefined)
+FORCE_THRESHOLD_N = 10.0
+
+_UNIT_SCALE = {"mm": 1e-3, "cm": 1e-2, "m": 1.0, "nmm": 1e-3, "nm": 1.0}
+
+
+def _scale(unit: str) -> float:
+    return _UNIT_SCALE.get(str(unit).strip().lower(), 1.0)
+
+
+# ---------------------------------------------------------------------------
+# Path helpers
+# ---------------------------------------------------------------------------
+
+def output_paths(c3d_path: Path) -> Dict[str, Path]:
+    """TRC / MOT locations for a C3D, following the dataset layout."""
+    mocap = c3d_path.parent
+    return {
+        "trc": mocap / "trcResults" / f"{c3d_path.stem}.trc",
+        "mot": mocap / "grfResults" / f"{c3d_path.stem}.mot",
+    }
+
+
+def is_up_to_date(c3d_path: Path) -> bool:
+    """True when both outputs (plain or compressed) exist and are newer than the C3D."""
+    src_mtime = c3d_path.stat().st_mtime
+    for out in output_paths(c3d_path).values():
+        out = resolve_path(out)
+        if not out.exists() or out.stat().st_mtime < src_mtime:
+            return False
+    return True
+
+
+def discover_c3d_files(
+    root_dir: Path,
+    subjects: Optional[List[str]] = None,
+    inventory=None,
+) -> List[Path]:
+    """
+    All trial C3Ds under <root>/Sxx/Sxx/Mocap, optionally limited to subjects.
+    With an inventory the files come from its cached listing, not a glob.
+    """
+    pattern = "S*/S*/Mocap/*.c3d"
+    files = []
+    for c3d_path in (inventory.glob(pattern) if inventory else sorted(root_dir.glob(pattern))):
+        subject = c3d_path.parents[2].name.replace("S", "")
+        if subjects and subject not in subjects:
+            continue
+        files.append(c3d_path)
+    return files
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+def read_c3d(c3d_path: Path) -> dict:
+    """
+    Read a C3D once and return everything downstream stages need.
+
+    Returns dict with:
+        labels        marker labels
+        points_raw    (3, N_markers, N_frames) in C3D units (event detector layout)
+        marker_rate   Hz
+        marker_units  e.g. 'mm'
+        platforms     list of ezc3d platform dicts (force, moment, COP, Tz)
+        analog_rate   Hz
+    """
+    from ezc3d import c3d  # type: ignore
+
+    c = c3d(str(c3d_path), extract_forceplat_data=True)
+    params = c["parameters"]
+    return {
+        "labels": [l.strip() for l in params["POINT"]["LABELS"]["value"]],
+        "points_raw": c["data"]["points"][:3, :, :],
+        "marker_rate": float(params["POINT"]["RATE"]["value"][0]),
+        "marker_units": params["POINT"]["UNITS"]["value"][0],
+        "platforms": c["data"]["platform"],
+        "analog_rate": float(params["ANALOG"]["RATE"]["value"][0]),
+    }
+
+
+def markers_to_opensim(parsed: dict) -> np.ndarray:
+    """(3, M, N) lab-frame markers -> (N, M, 3) OpenSim-frame metres."""
+    xyz = np.transpose(parsed["points_raw"], (2, 1, 0)) * _scale(parsed["marker_units"])
+    return xyz @ LAB_TO_OPENSIM.T
+
+
+def platforms_to_grf(parsed: dict) -> tuple:
+    """
+    Build the GRF .mot block from the parsed force plates.
+
+    Returns:
+        (columns, data) with data shaped (analog_frames, 1 + 9 * n_plates)
+    """
+    platforms = parsed["platforms"]
+    n_frames = platforms[0]["force"].shape[1] if platforms else 0
+    columns = ["time"]
+    blocks = [np.arange(n_frames, dtype=float)[:, None] / parsed["analog_rate"]]
+
+    for i, pf in enumerate(platforms, start=1):
+        force = REACTION_SIGN * pf["force"].T @ LAB_TO_OPENSIM.T
+        cop = (pf["center_of_pressure"].T * _scale(pf.get("unit_position", "mm"))) @ LAB_TO_OPENSIM.T
+        torque = (REACTION_SIGN * pf["Tz"].T * _scale(pf.get("unit_moment", "Nmm"))) @ LAB_TO_OPENSIM.T
+
+        unloaded = (force[:, 1] < FORCE_THRESHOLD_N) | ~np.isfinite(cop).all(axis=1)
+        force[unloaded] = 0.0
+        cop[unloaded] = 0.0
+        torque[unloaded] = 0.0
+
+        columns += [f"ground_force_{i}_v{a}" for a in "xyz"]
+        columns += [f"ground_force_{i}_p{a}" for a in "xyz"]
+        columns += [f"ground_moment_{i}_m{a}" for a in "xyz"]
+        blocks += [force, cop, torque]
+
+    return columns, np.hstack(blocks)
+
+
+# ---------------------------------------------------------------------------
+# Per-trial worker
+# ---------------------------------------------------------------------------
+
+def ingest_trial(args: tuple) -> dict:
+    """
+    Convert one C3D.  Returns a summary row (status, outputs, events, error).
+    """
+    c3d_path_str, force, detect, compress = args
+    c3d_path = Path(c3d_path_str)
+    row = {
+        "subject": c3d_path.parents[2].name,
+        "trial": c3d_path.stem,
+        "c3d": str(c3d_path),
+        "status": "",
+        "error": "",
+    }
+    outs = output_paths(c3d_path)
+    row.update({k: str(v) for k, v in outs.items()})
+
+    if not force and is_up_to_date(c3d_path):
+        row["status"] = "skipped"
+        return row
+
+    try:
+        parsed = read_c3d(c3d_path)
+
+        xyz = markers_to_opensim(parsed)
+        n_frames = xyz.shape[0]
+        marker_time = np.arange(n_frames, dtype=float) / parsed["marker_rate"]
+        write_trc(outs["trc"], parsed["labels"], marker_time, xyz, parsed["marker_rate"],
+                  compress=compress)
+
+        columns, grf = platforms_to_grf(parsed)
+        write_storage(outs["mot"], columns, grf, compress=compress)
+
+        if detect:
+            # Same parse, no second read of the C3D; frames stay in recording
+            # order for trials moving towards the negative axis too
+            from markerbased_HS_TO_events import detect_all_events_from_markers
+            try:
+                events = detect_all_events_from_markers(
+                    parsed["points_raw"], parsed["labels"], fs=parsed["marker_rate"]
+                )
+                # First heel strike and last toe off per side, as detect_events reports them
+                row.update(axis=events["axis"],
+                           left_hs=events["left_hs"][0], right_hs=events["right_hs"][0],
+                           left_to=events["left_to"][-1], right_to=events["right_to"][-1])
+            except (ValueError, IndexError) as exc:
+                row["error"] = f"event detection: {exc}"
+
+        row["status"] = "written"
+    except Exception as exc:
+        row["status"] = "failed"
+        row["error"] = str(exc)
+    return row
+
+
+# ---------------------------------------------------------------------------
+# Batch runner
+# ---------------------------------------------------------------------------
+
+def ingest_all(
+    c3d_files: List[Path],
+    cores: int = 1,
+    force: bool = False,
+    detect_events: bool = True,
+    compress: Optional[str] = None,
+    logger: Optional[logging.Logger] = None,
+) -> List[dict]:
+    """Ingest every C3D, in a spawn-context process pool when cores > 1."""
+    jobs = [(str(p), force, detect_events, compress) for p in c3d_files]
+    return run_jobs(ingest_trial, jobs, cores, _log_row, logger or logging.getLogger("c3d_ingest"),
+                    key=lambda r: (r["subject"], r["trial"]))
+
+
+def _log_row(logger: logging.Logger, done: int, total: int, row: dict) -> None:
+    if row["status"] == "failed":
+        logger.error("[%d/%d] %s %s  FAILED: %s", done, total, row["subject"], row["trial"], row["error"])
+    else:
+        logger.info("[%d/%d] %s %s  %s", done, total, row["subject"], row["trial"], row["status"])
+
+
+def write_summary(rows: List[dict], path: Path) -> None:
+    fields = sorted({k for r in rows for k in r}, key=lambda k: (k not in ("subject", "trial"), k))
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Batch C3D -> TRC / GRF .mot ingestion",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--cores", type=int, default=0, help="Worker processes (default: physical_cores - 1)")
+    parser.add_argument("--force", action="store_true", help="Rewrite outputs even if up to date")
+    parser.add_argument("--compress", default="none", choices=["none", "gz", "zst"],
+                        help="Write compressed .trc/.mot (default: none)")
+    parser.add_argument("--no-events", action="store_true", help="Skip marker-based event detection")
+    parser.add_argument("--summary", default="", help="Optional CSV path for the per-trial summary")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from file_inventory import FileInventory
+    from pipeline_cli import physical_core_count, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()] or None
+    c3d_files = discover_c3d_files(root_dir, subjects, FileInventory.open(root_dir, logger=logger))
+    if not c3d_files:
+        logger.error("No C3D files found under %s", root_dir)
+        sys.exit(1)
+
+    cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+    logger.info("Ingesting %d C3D file(s) on %d core(s)", len(c3d_files), cores)
+
+    t0 = time.monotonic()
+    rows = ingest_all(c3d_files, cores=cores, force=args.force,
+                      detect_events=not args.no_events,
+                      compress=None if args.compress == "none" else args.compress, logger=logger)
+    logger.info("Finished in %.1f s", time.monotonic() - t0)
+
+    if args.summary:
+        write_summary(rows, Path(args.summary))
+        logger.info("Summary written to %s", args.summary)
+
+    failed = [r for r in rows if r["status"] == "failed"]
+    if failed:
+        logger.error("Failed trials: %s", [f"{r['subject']}/{r['trial']}" for r in failed])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # Required on Windows with frozen/spawn executables
+    main()
@@ -0,0 +1,313 @@
+"""
+Cohort result cube: one memory-mappable array per stage for group analysis.
+
+Collects every per-trial IK (.mot), ID (.sto) and SO activation (.sto) output
+under root_dir, time-normalises each trial to 0-100 % and stores the result
+as subject x trial x variable x percent arrays (one .npy per stage, written
+subject by subject).  Subject metadata from 'Subject Details.csv' (sex, age,
+mass, height, dominant foot, age group) is stored alongside in meta.json.
+
+Cohort plots then become array slices:
+    store = CohortStore.open("D:/RESEARCH/STW_dataset/cohort")
+    older_f = store.subjects_where(age_group="older", sex="F")
+    knee = store.select("id", subjects=older_f, variables=["knee_angle_r_moment"])
+
+Usage:
+    python cohort_store.py --root D:/RESEARCH/STW_dataset/Extracted --out D:/RESEARCH/cohort [--float32] [--per-kg]
+"""
+
+import sys
+import json
+import re
+import fnmatch
+import itertools
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from gait_normalize import normalize_trials, percent_axis
+from opensim_io import plain_name, read_storage, read_storage_header
+from subject_registry import DEFAULT_SUBJECT_CSV, SubjectRegistry
+
+
+# stage -> (output directory relative to Sxx, filename glob)
+STAGE_OUTPUTS: Dict[str, Tuple[str, str]] = {
+    "ik": ("IK/results_stw", "ik_output_*.mot"),
+    "id": ("ID/results_id", "id_output_*.sto"),
+    "so": ("SO/result_SO", "*_StaticOptimization_activation.sto"),
+}
+
+
+# ---------------------------------------------------------------------------
+# Output discovery
+# ---------------------------------------------------------------------------
+
+def find_dir(base: Path, rel: str) -> Optional[Path]:
+    """Resolve a relative directory case-insensitively (results_id vs results_ID)."""
+    current = base
+    for part in Path(rel).parts:
+        if (current / part).is_dir():
+            current = current / part
+            continue
+        match = next(
+            (p for p in current.iterdir() if p.is_dir() and p.name.lower() == part.lower()),
+            None,
+        ) if current.is_dir() else None
+        if match is None:
+            return None
+        current = match
+    return current
+
+
+def trial_from_filename(name: str) -> Optional[str]:
+    """
+    Extract the trial name from an output filename.
+      ik_output_stw1_S01.mot                        -> stw1
+      id_output_S01_stw1.sto                        -> stw1
+      subjectS01_1_StaticOptimization_activation.sto -> stw1
+    """
+    m = re.search(r"stw_?(\d+)", name, re.IGNORECASE)
+    if m:
+        return f"stw{int(m.group(1))}"
+    m = re.search(r"_(\d+)_StaticOptimization", name)
+    if m:
+        return f"stw{int(m.group(1))}"
+    return None
+
+
+def iter_stage_outputs(
+    root_dir: Path, stages: Sequence[str] = tuple(STAGE_OUTPUTS)
+) -> Iterator[Tuple[str, str, str, Path]]:
+    """
+    Yield (subject, trial, stage, path) for every output file under root_dir.
+    Compressed outputs (.gz/.zst) are included; a plain copy wins if both exist.
+    """
+    for subj_dir in sorted(root_dir.glob("S*")):
+        if not (subj_dir.is_dir() and subj_dir.name[1:].isdigit()):
+            continue
+        for stage in stages:
+            rel, pattern = STAGE_OUTPUTS[stage]
+            out_dir = find_dir(subj_dir, rel)
+            if out_dir is None:
+                continue
+            seen = set()
+            for path in sorted(out_dir.glob(pattern + "*")):
+                name = plain_name(path).name
+                if name in seen or not fnmatch.fnmatch(name, pattern):
+                    continue
+                seen.add(name)
+                trial = trial_from_filename(name)
+                if trial:
+                    yield subj_dir.name, trial, stage, path
+
+
+# ---------------------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------------------
+
+def build_cube(
+    root_dir: Path,
+    out_dir: Path,
+    stages: Sequence[str] = tuple(STAGE_OUTPUTS),
+    n_points: int = 101,
+    float32: bool = False,
+    subject_csv: Path = DEFAULT_SUBJECT_CSV,
+    per_kg: bool = False,
+    logger: Optional[logging.Logger] = None,
+) -> Path:
+    """
+    Consolidate all outputs under root_dir into out_dir/{stage}.npy + meta.json.
+    With per_kg, ID moments/forces are divided by body mass from the subject
+    registry (trials of subjects missing from it are skipped for that stage).
+    Returns the meta.json path.
+    """
+    logger = logger or logging.getLogger("cohort_store")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    dtype = np.float32 if float32 else np.float64
+
+    registry = SubjectRegistry({})
+    if subject_csv and Path(subject_csv).is_file():
+        registry = SubjectRegistry.load(Path(subject_csv))
+    else:
+        logger.warning("Subject details CSV not found: %s", subject_csv)
+
+    outputs = list(iter_stage_outputs(root_dir, stages))
+    subjects = sorted({s for s, _, _, _ in outputs}, key=lambda s: int(s[1:]))
+    trials = sorted({t for _, t, _, _ in outputs}, key=lambda t: int(t[3:]))
+    s_idx = {s: i for i, s in enumerate(subjects)}
+    t_idx = {t: i for i, t in enumerate(trials)}
+
+    meta = {
+        "root_dir": str(root_dir),
+        "n_points": n_points,
+        "dtype": np.dtype(dtype).name,
+        "subjects": subjects,
+        "trials": trials,
+        "stages": {},
+        "subject_metadata": {s: registry.get(s) or {} for s in subjects},
+        "per_kg": bool(per_kg and "id" in stages),
+    }
+
+    for stage in stages:
+        files = [(s, t, p) for s, t, st, p in outputs if st == stage]
+        if not files:
+            logger.warning("No %s outputs found; stage skipped.", stage)
+            continue
+
+        # Variable axis = union of columns, first-seen order (reads headers only)
+        variables: List[str] = []
+        seen = set()
+        for _, _, path in files:
+            for col in read_storage_header(path)[1][1:]:
+                if col not in seen:
+                    seen.add(col)
+                    variables.append(col)
+        v_idx = {v: i for i, v in enumerate(variables)}
+
+        cube_path = out_dir / f"{stage}.npy"
+        cube = np.lib.format.open_memmap(
+            cube_path, mode="w+", dtype=dtype,
+            shape=(len(subjects), len(trials), len(variables), n_points),
+        )
+        cube[:] = np.nan
+
+        # One batched normalisation per subject (trials of equal length share an operator)
+        for subject, group in itertools.groupby(files, key=lambda f: f[0]):
+            blocks, targets = [], []
+            for _, trial, path in group:
+                try:
+                    sto = read_storage(path)
+                    if len(sto.time) < 2:
+                        raise ValueError("fewer than two rows")
+                    if per_kg and stage == "id":
+                        sto = registry.per_kg(subject, sto)
+                except Exception as exc:
+                    logger.error("Skipping %s: %s", path, exc)
+                    continue
+                blocks.append(sto.data[:, 1:])
+                targets.append((trial, [v_idx[c] for c in sto.columns[1:]]))
+            for (trial, cols), norm in zip(targets, normalize_trials(blocks, n_points)):
+                cube[s_idx[subject], t_idx[trial], cols, :] = norm.T
+            cube.flush()
+        del cube
+
+        meta["stages"][stage] = {"file": cube_path.name, "variables": variables}
+        logger.info("Stage %s: %d file(s), %d variable(s) -> %s",
+                    stage, len(files), len(variables), cube_path)
+
+    meta_path = out_dir / "meta.json"
+    meta_path.write_text(json.dumps(meta, indent=2))
+    return meta_path
+
+
+# ---------------------------------------------------------------------------
+# Read side
+# ---------------------------------------------------------------------------
+
+class CohortStore:
+    """Read-only view over a built cube directory (arrays are memory-mapped)."""
+
+    def __init__(self, path: Path, meta: dict):
+        self.path = path
+        self.meta = meta
+        self.subjects: List[str] = meta["subjects"]
+        self.trials: List[str] = meta["trials"]
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def open(cls, path) -> "CohortStore":
+        path = Path(path)
+        return cls(path, json.loads((path / "meta.json").read_text()))
+
+    @property
+    def percent(self) -> np.ndarray:
+        return percent_axis(self.meta["n_points"])
+
+    def variables(self, stage: str) -> List[str]:
+        return self.meta["stages"][stage]["variables"]
+
+    def array(self, stage: str) -> np.ndarray:
+        """Full (subject, trial, variable, percent) memmap for a stage."""
+        if stage not in self._arrays:
+            self._arrays[stage] = np.load(
+                self.path / self.meta["stages"][stage]["file"], mmap_mode="r"
+            )
+        return self._arrays[stage]
+
+    def subjects_where(self, **criteria) -> List[str]:
+        """Subjects whose metadata matches every criterion, e.g. sex='F', age_group='older'."""
+        md = self.meta.get("subject_metadata", {})
+        return [
+            s for s in self.subjects
+            if all(md.get(s, {}).get(k) == v for k, v in criteria.items())
+        ]
+
+    def select(
+        self,
+        stage: str,
+        subjects: Optional[Sequence[str]] = None,
+        trials: Optional[Sequence[str]] = None,
+        variables: Optional[Sequence[str]] = None,
+    ) -> np.ndarray:
+        """Slice a stage cube by labels; None keeps the whole axis."""
+        arr = self.array(stage)
+        si = [self.subjects.index(s) for s in subjects] if subjects is not None else slice(None)
+        ti = [self.trials.index(t) for t in trials] if trials is not None else slice(None)
+        vi = ([self.variables(stage).index(v) for v in variables]
+              if variables is not None else slice(None))
+        arr = arr[si] if not isinstance(si, slice) else arr
+        arr = arr[:, ti] if not isinstance(ti, slice) else arr
+        arr = arr[:, :, vi] if not isinstance(vi, slice) else arr
+        return np.asarray(arr)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Consolidate IK/ID/SO outputs into a cohort cube",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--out", required=True, help="Output directory for the cube")
+    parser.add_argument("--stages", default="ik,id,so", help="Comma-separated stages (default: ik,id,so)")
+    parser.add_argument("--points", type=int, default=101, help="Samples over 0-100 %% (default: 101)")
+    parser.add_argument("--float32", action="store_true", help="Store as float32 instead of float64")
+    parser.add_argument("--subject-csv", default=str(DEFAULT_SUBJECT_CSV), help="Subject Details CSV")
+    parser.add_argument("--per-kg", action="store_true", help="Divide ID moments/forces by body mass")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from pipeline_cli import setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    stages = [s.strip().lower() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGE_OUTPUTS)
+    if unknown:
+        logger.error("Unknown stage(s): %s", unknown)
+        sys.exit(1)
+
+    meta_path = build_cube(
+        root_dir, Path(args.out), stages=stages, n_points=args.points,
+        float32=args.float32, subject_csv=Path(args.subject_csv), per_kg=args.per_kg, logger=logger,
+    )
+    logger.info("Cohort cube written: %s", meta_path)
+
+
+if __name__ == "__main__":
+    main()
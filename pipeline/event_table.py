@@ -0,0 +1,282 @@
+"""
+Batch gait-event table: every heel strike, toe off and movement window for
+every (subject, trial) C3D in the dataset, in one CSV.
+
+Detection runs once per C3D in a spawn-context process pool (marker-based
+detector from markerbased_HS_TO_events, reading only the POINT block).  Each
+result is cached as JSON under <cache>/<sha1>.json, keyed by the C3D's content
+hash and DETECTOR_VERSION, so re-running after new captures only parses the
+new or changed files, and renamed/moved copies are not re-detected.
+
+The table is long-format, one row per event:
+
+    subject,trial,event,side,frame,time
+    S01,stw1,heel_strike,left,412,2.06
+    S01,stw1,movement_start,,35,0.175
+
+Notebooks and the pipeline read it back with load_event_table() / trial_events()
+instead of re-deriving events per plot.
+
+Usage:
+    python event_table.py --root D:/RESEARCH/STW_dataset/Extracted [--subjects 01,02] [--cores N]
+                          [--out events.csv] [--cache DIR] [--force]
+"""
+
+import sys
+import csv
+import json
+import logging
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from batch_runner import run_jobs
+from c3d_ingest import discover_c3d_files
+from results_catalog import file_sha1
+
+
+# Bump when detector parameters change so cached results are recomputed
+DETECTOR_VERSION = 2
+
+DEFAULT_TABLE_NAME = "events.csv"
+DEFAULT_CACHE_DIR = ".event_cache"
+
+TABLE_FIELDS = ["subject", "trial", "event", "side", "frame", "time"]
+
+# detector key -> (event, side)
+EVENT_KEYS = {
+    "left_hs": ("heel_strike", "left"),
+    "right_hs": ("heel_strike", "right"),
+    "left_to": ("toe_off", "left"),
+    "right_to": ("toe_off", "right"),
+    "movement_start": ("movement_start", ""),
+    "movement_end": ("movement_end", ""),
+}
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+def cache_path(cache_dir: Path, digest: str) -> Path:
+    return cache_dir / f"{digest}.json"
+
+
+def load_cached(cache_dir: Path, digest: str) -> Optional[dict]:
+    path = cache_path(cache_dir, digest)
+    if not path.is_file():
+        return None
+    try:
+        entry = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return entry if entry.get("version") == DETECTOR_VERSION else None
+
+
+def store_cached(cache_dir: Path, digest: str, entry: dict) -> None:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_path(cache_dir, digest)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(entry), encoding="utf-8")
+    tmp.replace(path)   # atomic, so concurrent workers never see half a file
+
+
+# ---------------------------------------------------------------------------
+# Detection
+# ---------------------------------------------------------------------------
+
+def read_markers(c3d_path: Path) -> tuple:
+    """(points (3, M, N) in C3D units, labels, marker rate) without force plates."""
+    from ezc3d import c3d  # type: ignore
+
+    c = c3d(str(c3d_path))
+    params = c["parameters"]["POINT"]
+    labels = [l.strip() for l in params["LABELS"]["value"]]
+    return c["data"]["points"][:3, :, :], labels, float(params["RATE"]["value"][0])
+
+
+def detect_trial(args: tuple) -> dict:
+    """
+    Events for one C3D, from the cache when its hash is known.
+
+    Returns dict with subject, trial, c3d, status ('cached', 'detected',
+    'failed'), error, rate and the detector output (frame index lists).
+    """
+    c3d_path_str, cache_dir_str, force = args
+    c3d_path = Path(c3d_path_str)
+    result = {
+        "subject": c3d_path.parents[2].name,
+        "trial": c3d_path.stem,
+        "c3d": str(c3d_path),
+        "status": "",
+        "error": "",
+    }
+    try:
+        digest = file_sha1(c3d_path)
+        cache_dir = Path(cache_dir_str) if cache_dir_str else None
+
+        entry = None if (force or cache_dir is None) else load_cached(cache_dir, digest)
+        if entry is not None:
+            result["status"] = "cached"
+        else:
+            from markerbased_HS_TO_events import detect_all_events_from_markers
+
+            points, labels, rate = read_markers(c3d_path)
+            entry = {
+                "version": DETECTOR_VERSION,
+                "sha1": digest,
+                "rate": rate,
+                "events": detect_all_events_from_markers(points, labels, fs=rate),
+            }
+            if cache_dir is not None:
+                store_cached(cache_dir, digest, entry)
+            result["status"] = "detected"
+
+        result["rate"] = entry["rate"]
+        result.update(entry["events"])
+    except Exception as exc:
+        result["status"] = "failed"
+        result["error"] = str(exc)
+    return result
+
+
+def detect_all(
+    c3d_files: List[Path],
+    cache_dir: Optional[Path] = None,
+    cores: int = 1,
+    force: bool = False,
+    logger: Optional[logging.Logger] = None,
+) -> List[dict]:
+    """Detect events for every C3D, in a spawn-context process pool when cores > 1."""
+    jobs = [(str(p), str(cache_dir) if cache_dir else "", force) for p in c3d_files]
+    return run_jobs(detect_trial, jobs, cores, _log_result, logger or logging.getLogger("event_table"),
+                    key=lambda r: (r["subject"], r["trial"]))
+
+
+def _log_result(logger: logging.Logger, done: int, total: int, result: dict) -> None:
+    if result["status"] == "failed":
+        logger.error("[%d/%d] %s %s  FAILED: %s", done, total, result["subject"], result["trial"], result["error"])
+    else:
+        logger.info("[%d/%d] %s %s  %s", done, total, result["subject"], result["trial"], result["status"])
+
+
+# ---------------------------------------------------------------------------
+# Table
+# ---------------------------------------------------------------------------
+
+def to_rows(results: List[dict]) -> List[dict]:
+    """Flatten detector results into long-format event rows, ordered by time."""
+    rows = []
+    for result in results:
+        if result["status"] == "failed":
+            continue
+        trial_rows = []
+        for key, (event, side) in EVENT_KEYS.items():
+            frames = result.get(key, [])
+            frames = frames if isinstance(frames, list) else [frames]
+            for frame in frames:
+                if frame < 0:
+                    continue
+                trial_rows.append({
+                    "subject": result["subject"],
+                    "trial": result["trial"],
+                    "event": event,
+                    "side": side,
+                    "frame": int(frame),
+                    "time": round(frame / result["rate"], 6),
+                })
+        rows += sorted(trial_rows, key=lambda r: (r["frame"], r["event"], r["side"]))
+    return rows
+
+
+def write_event_table(rows: List[dict], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=TABLE_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def load_event_table(path: Path):
+    """The event table as a pandas DataFrame."""
+    import pandas as pd
+
+    return pd.read_csv(path, dtype={"subject": str, "trial": str, "side": str},
+                       keep_default_na=False)
+
+
+def trial_events(table, subject: str, trial: str) -> Dict[str, List[int]]:
+    """
+    Frames of one trial's events, keyed like the detector output
+    ('left_hs', 'right_to', 'movement_start', ...).
+    """
+    subject = subject if str(subject).startswith("S") else f"S{str(subject).zfill(2)}"
+    sel = table[(table["subject"] == subject) & (table["trial"] == trial)]
+    events: Dict[str, List[int]] = {key: [] for key in EVENT_KEYS}
+    for key, (event, side) in EVENT_KEYS.items():
+        match = sel[(sel["event"] == event) & (sel["side"] == side)]
+        events[key] = [int(f) for f in match["frame"]]
+    return events
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Batch marker-based gait event detection into one table",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--cores", type=int, default=0, help="Worker processes (default: physical_cores - 1)")
+    parser.add_argument("--out", default="", help=f"Event table CSV (default: <root>/{DEFAULT_TABLE_NAME})")
+    parser.add_argument("--cache", default="", help=f"Per-C3D result cache (default: <root>/{DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the cache")
+    parser.add_argument("--force", action="store_true", help="Re-detect even when a cached result exists")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from file_inventory import FileInventory
+    from pipeline_cli import physical_core_count, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()] or None
+    c3d_files = discover_c3d_files(root_dir, subjects, FileInventory.open(root_dir, logger=logger))
+    if not c3d_files:
+        logger.error("No C3D files found under %s", root_dir)
+        sys.exit(1)
+
+    cache_dir = None if args.no_cache else Path(args.cache or root_dir / DEFAULT_CACHE_DIR)
+    out_path = Path(args.out or root_dir / DEFAULT_TABLE_NAME)
+    cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+    logger.info("Detecting events in %d C3D file(s) on %d core(s)", len(c3d_files), cores)
+
+    t0 = time.monotonic()
+    results = detect_all(c3d_files, cache_dir=cache_dir, cores=cores, force=args.force, logger=logger)
+    rows = to_rows(results)
+    write_event_table(rows, out_path)
+    logger.info("%d event(s) written to %s in %.1f s", len(rows), out_path, time.monotonic() - t0)
+
+    failed = [r for r in results if r["status"] == "failed"]
+    if failed:
+        logger.error("Failed trials: %s", [f"{r['subject']}/{r['trial']}" for r in failed])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # Required on Windows with frozen/spawn executables
+    main()
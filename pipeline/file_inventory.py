@@ -0,0 +1,351 @@
+"""
+Persistent inventory of every file under a dataset root.
+
+Mapping, subject/trial discovery, the GUI and pre-flight checks used to walk
+or stat the dataset on every call (rglob per subject, Path.exists per path
+per subject).  On a network drive with tens of thousands of files that takes
+minutes.  The inventory scans the tree once with os.scandir on a thread pool
+(one directory per task, level by level), keeps (size, mtime, kind) per file
+and persists the result as JSON under <root>/.file_inventory.json.
+
+Refreshing is incremental: every known directory is stat'ed (in parallel)
+and only directories whose mtime changed are listed again.  A directory's
+mtime changes when entries are added, removed or renamed in it, so files
+rewritten in place keep their old size/mtime until the next rebuild
+(--rebuild / refresh(full=True)).  Dot-directories (.event_cache, ...)
+are not indexed.
+
+    inv = FileInventory.open(root_dir)            # load + incremental refresh + save
+    inv.glob("S*/S*/Mocap/trcResults/*.trc")      # same semantics as Path.glob (no **)
+    inv.exists(trial["ik_xml"])
+    inv.files(kinds={"osim"})
+
+Paths outside the root fall back to the filesystem, so callers can use the
+inventory for every lookup.
+
+Usage:
+    python file_inventory.py --root D:/RESEARCH/STW_dataset/Extracted [--workers N] [--rebuild]
+"""
+
+import os
+import sys
+import json
+import time
+import fnmatch
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from opensim_io import COMPRESSION_SUFFIXES, PathLike, data_suffix
+
+
+INVENTORY_VERSION = 1
+INVENTORY_NAME = ".file_inventory.json"
+
+# Directory listings are I/O bound (network shares), so threads, not processes
+DEFAULT_WORKERS = 16
+
+# rel dir -> {"mtime": ns, "files": {name: [size, mtime_ns, kind]}, "dirs": [names]}
+DirRecord = Dict[str, object]
+
+
+def kind_of(name: str) -> str:
+    """'trc', 'mot', 'xml', 'osim', 'c3d', ... ignoring a .gz/.zst suffix."""
+    return data_suffix(name).lstrip(".")
+
+
+def _join(rel: str, name: str) -> str:
+    return f"{rel}/{name}" if rel else name
+
+
+def _key(rel: str) -> str:
+    return os.path.normcase(rel).replace("\\", "/")
+
+
+def _matches(name: str, pattern: str) -> bool:
+    """fnmatch with the platform's case rule (case-insensitive on Windows, like _key)."""
+    return fnmatch.fnmatchcase(os.path.normcase(name), os.path.normcase(pattern))
+
+
+class FileInventory:
+    """Index of files and directories below one root, persisted between runs."""
+
+    def __init__(self, root: PathLike, dirs: Optional[Dict[str, DirRecord]] = None):
+        self.root = Path(os.path.abspath(root))
+        self._dirs: Dict[str, DirRecord] = dirs or {}
+        self._file_index: Optional[Dict[str, Tuple[str, list]]] = None
+        self._dir_index: Optional[Dict[str, str]] = None
+
+    # ------------------------------------------------------------------
+    # Construction / persistence
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def load(cls, root: PathLike, path: Optional[PathLike] = None) -> "FileInventory":
+        """The persisted inventory of root (empty if missing, stale or unreadable)."""
+        inv = cls(root)
+        path = Path(path) if path else inv.root / INVENTORY_NAME
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return inv
+        if data.get("version") == INVENTORY_VERSION and data.get("root") == str(inv.root):
+            inv._dirs = data.get("dirs", {})
+        return inv
+
+    @classmethod
+    def open(
+        cls,
+        root: PathLike,
+        path: Optional[PathLike] = None,
+        refresh: bool = True,
+        full: bool = False,
+        workers: int = DEFAULT_WORKERS,
+        logger: Optional[logging.Logger] = None,
+    ) -> "FileInventory":
+        """Load the persisted inventory, bring it up to date and save it if anything changed."""
+        inv = cls.load(root, path)
+        if refresh:
+            if inv.refresh(workers=workers, full=full, logger=logger):
+                try:
+                    inv.save(path)
+                except OSError as exc:   # read-only dataset: the in-memory index still works
+                    (logger or logging.getLogger("file_inventory")).warning(
+                        "Could not save file inventory: %s", exc)
+        return inv
+
+    def save(self, path: Optional[PathLike] = None) -> Path:
+        path = Path(path) if path else self.root / INVENTORY_NAME
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(
+            json.dumps({"version": INVENTORY_VERSION, "root": str(self.root), "dirs": self._dirs}),
+            encoding="utf-8",
+        )
+        tmp.replace(path)   # atomic, so a concurrent reader never sees half a file
+        return path
+
+    # ------------------------------------------------------------------
+    # Scanning
+    # ------------------------------------------------------------------
+
+    def _visit(self, rel: str, full: bool) -> Tuple[str, Optional[DirRecord], bool]:
+        """(rel, record or None if gone, rescanned?) for one directory."""
+        abs_dir = os.path.join(self.root, rel) if rel else str(self.root)
+        try:
+            mtime = os.stat(abs_dir).st_mtime_ns
+        except OSError:
+            return rel, None, True
+        old = self._dirs.get(rel)
+        if old is not None and not full and old["mtime"] == mtime:
+            return rel, old, False
+
+        files: Dict[str, list] = {}
+        dirs: List[str] = []
+        try:
+            with os.scandir(abs_dir) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not entry.name.startswith("."):
+                                dirs.append(entry.name)
+                        elif entry.is_file() and entry.name != INVENTORY_NAME:
+                            st = entry.stat()
+                            files[entry.name] = [st.st_size, st.st_mtime_ns, kind_of(entry.name)]
+                    except OSError:
+                        continue
+        except OSError:
+            return rel, None, True
+        return rel, {"mtime": mtime, "files": files, "dirs": sorted(dirs)}, True
+
+    def refresh(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        full: bool = False,
+        logger: Optional[logging.Logger] = None,
+    ) -> int:
+        """
+        Re-list every directory whose mtime changed (all of them when full).
+
+        Returns:
+            Number of directories listed again or removed (0 = nothing changed)
+        """
+        logger = logger or logging.getLogger("file_inventory")
+        t0 = time.monotonic()
+        updated: Dict[str, DirRecord] = {}
+        changed = 0
+        pending = [""]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            while pending:
+                level = pool.map(lambda rel: self._visit(rel, full), pending)
+                pending = []
+                for rel, record, rescanned in level:
+                    changed += rescanned
+                    if record is None:
+                        continue
+                    updated[rel] = record
+                    pending += [_join(rel, d) for d in record["dirs"]]
+        changed += len(set(self._dirs) - set(updated) - {""})
+        self._dirs = updated
+        self._file_index = self._dir_index = None
+        logger.info("File inventory of %s: %d dir(s), %d file(s), %d dir(s) rescanned in %.2f s",
+                    self.root, len(updated), sum(len(r["files"]) for r in updated.values()),
+                    changed, time.monotonic() - t0)
+        return changed
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _files(self) -> Dict[str, Tuple[str, list]]:
+        """normcased rel path -> (rel path, [size, mtime_ns, kind])"""
+        if self._file_index is None:
+            self._file_index = {
+                _key(_join(rel, name)): (_join(rel, name), info)
+                for rel, record in self._dirs.items()
+                for name, info in record["files"].items()
+            }
+            self._dir_index = {_key(rel): rel for rel in self._dirs}
+        return self._file_index
+
+    def _dir(self, rel: str) -> Optional[str]:
+        """The indexed spelling of a rel directory, looked up by its normcased key."""
+        self._files()
+        return self._dir_index.get(_key(rel))
+
+    def _relative(self, path: PathLike) -> Optional[str]:
+        """Path relative to root with '/' separators, or None when outside root."""
+        try:
+            rel = os.path.relpath(os.path.abspath(path), self.root)
+        except ValueError:   # another drive on Windows
+            return None
+        if rel == os.curdir:
+            return ""
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            return None
+        return rel.replace(os.sep, "/")
+
+    def stat(self, path: PathLike) -> Optional[Tuple[int, int, str]]:
+        """(size, mtime_ns, kind) of an indexed file, or None."""
+        rel = self._relative(path)
+        if rel is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            return (st.st_size, st.st_mtime_ns, kind_of(str(path))) if os.path.isfile(path) else None
+        hit = self._files().get(_key(rel))
+        return tuple(hit[1]) if hit else None
+
+    def exists(self, path: PathLike) -> bool:
+        """True if the file is indexed (or, outside root, exists on disk)."""
+        if not path:
+            return False
+        rel = self._relative(path)
+        if rel is None:
+            return os.path.isfile(path)
+        return _key(rel) in self._files()
+
+    def is_dir(self, path: PathLike) -> bool:
+        rel = self._relative(path)
+        if rel is None:
+            return os.path.isdir(path)
+        return self._dir(rel) is not None
+
+    def resolve(self, path: PathLike) -> Path:
+        """Like opensim_io.resolve_path: the file or its first compressed sibling."""
+        path = Path(path)
+        if self.exists(path):
+            return path
+        for suffix in COMPRESSION_SUFFIXES.values():
+            candidate = path.with_name(path.name + suffix)
+            if self.exists(candidate):
+                return candidate
+        return path
+
+    def subdirs(self, path: Optional[PathLike] = None) -> List[Path]:
+        """Immediate subdirectories of root (or of path), sorted."""
+        rel = "" if path is None else self._relative(path)
+        if rel is None:
+            return sorted(p for p in Path(path).iterdir() if p.is_dir())
+        rel = self._dir(rel)
+        return [self.root / _join(rel, d) for d in self._dirs[rel]["dirs"]] if rel is not None else []
+
+    def files(self, under: Optional[PathLike] = None, kinds: Optional[Iterable[str]] = None) -> List[Path]:
+        """Every indexed file (below `under`), optionally only the given kinds, sorted."""
+        prefix = "" if under is None else self._relative(under)
+        if prefix is None:
+            return []
+        kinds = {k.lstrip(".").lower() for k in kinds} if kinds else None
+        prefix = _key(prefix)
+        out = []
+        for rel, record in self._dirs.items():
+            key = _key(rel)
+            if prefix and key != prefix and not key.startswith(prefix + "/"):
+                continue
+            for name, info in record["files"].items():
+                if kinds is None or info[2] in kinds:
+                    out.append(self.root / _join(rel, name))
+        return sorted(out)
+
+    def glob(self, pattern: str) -> List[Path]:
+        """
+        Files matching a root-relative Path.glob pattern (one component per '/',
+        no '**'), case-insensitively where the platform is (as exists() is).
+        """
+        parts = pattern.replace("\\", "/").split("/")
+        dirs = [""]
+        for part in parts[:-1]:
+            dirs = [
+                _join(rel, d) for rel in dirs if rel in self._dirs
+                for d in self._dirs[rel]["dirs"] if _matches(d, part)
+            ]
+        out = [
+            self.root / _join(rel, name) for rel in dirs if rel in self._dirs
+            for name in self._dirs[rel]["files"] if _matches(name, parts[-1])
+        ]
+        return sorted(out)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Build or refresh the persisted file inventory of a dataset",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--out", default="", help=f"Inventory JSON (default: <root>/{INVENTORY_NAME})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent directory listings")
+    parser.add_argument("--rebuild", action="store_true", help="List every directory again")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from pipeline_cli import setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    inv = FileInventory.open(root_dir, path=args.out or None, full=args.rebuild,
+                             workers=args.workers, logger=logger)
+    counts: Dict[str, int] = {}
+    for path in inv.files():
+        kind = kind_of(path.name) or "(none)"
+        counts[kind] = counts.get(kind, 0) + 1
+    for kind, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+        logger.info("  %-8s %d", kind, n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Time normalisation of movement cycles onto 0-100 %.
+
+Resampling a uniformly sampled curve of L frames onto P points is a fixed
+linear map, so it is built once per (L, P, kind) as a (P x L) operator and
+cached.  A whole (trials x frames x variables) stack is then normalised with
+one matrix product per distinct cycle length instead of one interp1d object
+per curve:
+
+    norm = normalize_stack(ik, starts=seat_off, ends=gait_end)   # (trials, 101, vars)
+    norm = normalize_trials([id_s01_stw1, id_s01_stw2, ...])     # ragged list
+
+kind='linear' matches np.interp; kind='cubic' matches
+interp1d(kind='cubic') (not-a-knot cubic spline) as used in graph.ipynb.
+"""
+
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+
+N_POINTS = 101
+
+
+# ---------------------------------------------------------------------------
+# Operators
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def percent_axis(n_points: int = N_POINTS) -> np.ndarray:
+    """0..100 % in n_points steps."""
+    return np.linspace(0.0, 100.0, n_points)
+
+
+@lru_cache(maxsize=None)
+def interpolation_operator(n_src: int, n_points: int = N_POINTS, kind: str = "linear") -> np.ndarray:
+    """
+    (n_points x n_src) matrix W such that W @ curve resamples a curve of
+    n_src uniformly spaced frames onto n_points uniformly spaced points.
+    """
+    if n_src < 2:
+        raise ValueError("A cycle needs at least two frames")
+    dst = np.linspace(0.0, n_src - 1.0, n_points)
+
+    if kind == "linear":
+        lo = np.minimum(np.floor(dst).astype(int), n_src - 2)
+        frac = dst - lo
+        op = np.zeros((n_points, n_src))
+        rows = np.arange(n_points)
+        op[rows, lo] = 1.0 - frac
+        op[rows, lo + 1] += frac
+    elif kind == "cubic":
+        if n_src < 4:
+            raise ValueError("Cubic normalisation needs at least four frames")
+        # The spline is linear in the data, so evaluating it on the identity
+        # gives the operator column by column
+        op = CubicSpline(np.arange(n_src, dtype=float), np.eye(n_src), axis=0)(dst)
+    else:
+        raise ValueError(f"Unknown interpolation kind: {kind}")
+    return op
+
+
+# ---------------------------------------------------------------------------
+# Normalisation
+# ---------------------------------------------------------------------------
+
+def normalize_stack(
+    stack: np.ndarray,
+    starts: Optional[Sequence[int]] = None,
+    ends: Optional[Sequence[int]] = None,
+    n_points: int = N_POINTS,
+    kind: str = "linear",
+) -> np.ndarray:
+    """
+    Normalise each trial's [start, end] frame window onto n_points.
+
+    Args:
+        stack: (trials x frames x variables); trials shorter than `frames`
+            may be NaN-padded past their end event
+        starts: First frame of each cycle (default 0)
+        ends: Last frame of each cycle, inclusive (default frames - 1)
+        n_points: Output points per cycle
+        kind: 'linear' or 'cubic'
+
+    Returns:
+        (trials x n_points x variables) array
+    """
+    stack = np.asarray(stack, dtype=float)
+    if stack.ndim == 2:
+        stack = stack[:, :, None]
+    n_trials, n_frames, n_vars = stack.shape
+    starts = np.zeros(n_trials, dtype=int) if starts is None else np.asarray(starts, dtype=int)
+    ends = np.full(n_trials, n_frames - 1) if ends is None else np.asarray(ends, dtype=int)
+    lengths = ends - starts + 1
+
+    out = np.full((n_trials, n_points, n_vars), np.nan)
+    for length in np.unique(lengths):
+        trials = np.flatnonzero(lengths == length)
+        if length < 2:
+            continue
+        # Gather every window of this length: (group, length, vars)
+        frames = starts[trials, None] + np.arange(length)
+        windows = stack[trials[:, None], frames]
+        op = interpolation_operator(int(length), n_points, kind)
+        out[trials] = np.einsum("pl,glv->gpv", op, windows)
+    return out
+
+
+def normalize_trials(
+    trials: Sequence[np.ndarray],
+    n_points: int = N_POINTS,
+    kind: str = "linear",
+) -> List[np.ndarray]:
+    """
+    Normalise a ragged list of (frames x variables) cycles.
+
+    Cycles sharing a shape are stacked and normalised together; results are
+    (n_points x variables) in the input order.
+    """
+    out: List[np.ndarray] = [np.empty(0)] * len(trials)
+    groups: dict = {}
+    for i, block in enumerate(trials):
+        groups.setdefault(np.shape(block), []).append(i)
+    for shape, indices in groups.items():
+        stacked = np.stack([np.asarray(trials[i], dtype=float) for i in indices])
+        normed = normalize_stack(stacked, n_points=n_points, kind=kind)
+        if len(shape) == 1:
+            normed = normed[:, :, 0]
+        for i, block in zip(indices, normed):
+            out[i] = block
+    return out
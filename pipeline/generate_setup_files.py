@@ -7,7 +7,6 @@ Can be imported as a module or run independently.
 
 import sys
 import os
-import subprocess
 import shutil
 import logging
 import json
@@ -15,6 +14,10 @@ from pathlib import Path
 from typing import Optional, Dict, Any, List
 
 
+# Actuator set copied into each subject's SO folder when it has none
+ACTUATORS_SRC = Path(r"d:\RESEARCH\STW_dataset\Extracted\model\cmc_actuators.xml")
+
+
 # ---------------------------------------------------------------------------
 # Logger configuration
 # ---------------------------------------------------------------------------
@@ -50,30 +53,6 @@ def _dbg(tag: str, msg: str, value=None):
         print(f"\n{sep}\n[DBG] [{tag}] {msg}\n{sep}", flush=True)
 
 
-def _run_script(script_name: str, args: list, cwd: Path, logger: logging.Logger) -> bool:
-    """Run a helper setup script and return True on success."""
-    # _dbg("SCRIPT", f"Running: {script_name}", f"cwd={cwd}  args={args}")
-    result = subprocess.run(
-        [sys.executable, script_name] + args,
-        cwd=str(cwd),
-        capture_output=True,
-        text=True,
-    )
-    # _dbg("SCRIPT", f"Return code: {result.returncode}", script_name)
-    if result.stdout.strip():
-        print(f"[DBG] [SCRIPT stdout]\n{result.stdout.strip()}", flush=True)
-    if result.returncode != 0:
-        print(f"[DBG] [SCRIPT stderr]\n{result.stderr.strip()}", flush=True)
-        logger.error("Script %s failed:\n%s", script_name, result.stderr.strip())
-        return False
-    return True
-
-
-def replace_subject_in_path(path_str: str, old_subj: str, new_subj: str) -> str:
-    """Replace subject number in path string."""
-    return path_str.replace(old_subj, new_subj)
-
-
 def load_and_adapt_template(template_path: Path, subject_num: str, logger: logging.Logger) -> Dict[str, Any]:
     """
     Load template JSON and adapt it for the given subject.
@@ -97,17 +76,9 @@ def load_and_adapt_template(template_path: Path, subject_num: str, logger: loggi
     
     # _dbg("TEMPLATE", "Template loaded — keys", list(template.keys()))
     
-    # Deep-copy template and substitute '01' -> subject_num everywhere
-    adapted = json.loads(json.dumps(template))
-    for key, value in adapted.items():
-        if isinstance(value, str):
-            adapted[key] = replace_subject_in_path(value, "01", subject_num)
-        elif isinstance(value, list):
-            for item in value:
-                if isinstance(item, dict):
-                    for k, v in item.items():
-                        if isinstance(v, str):
-                            item[k] = replace_subject_in_path(v, "01", subject_num)
+    # Same subject substitution the pipeline's compiled manifest uses
+    from manifest import adapt_template
+    adapted = adapt_template(template, subject_num)
     
     # _dbg("TEMPLATE", "Template adapted for subject", subject_num)
     return adapted
@@ -172,104 +143,61 @@ def generate_setups_if_needed(
     """
     if logger is None:
         logger = setup_logger()
-    
-    script_dir = Path(__file__).parent
-    setup_dir = script_dir.parent / "setup_files"
+
+    # Every kind is rendered in this process (setup_generator); a file is only
+    # rewritten when its content changes
+    from setup_generator import write_setup
 
     # _dbg("SETUP", f"generate_setups_if_needed called",
         #   f"subject={subject_num}  trial_name={trial_name!r}  subj_dir={subj_dir}")
-    # _dbg("SETUP", "Setup scripts directory", setup_dir)
-    # _dbg("SETUP", "Setup dir exists?", setup_dir.exists())
     # _dbg("SETUP", "Model file", model_file)
 
     # ---- Scale setup ------------------------------------------------
     if trial_name == "scale":
-        if not Path(xml).exists():
-            # _dbg("SCALE-SETUP", "Entering scale setup branch")
+        if not xml or not Path(xml).exists():
             # _dbg("SCALE-SETUP", "Scale XML path", xml)
-            # _dbg("SCALE-SETUP", "Scale XML exists?", Path(xml).exists() if xml else "no path given")
             logger.info("Generating scale setup for subject %s", subject_num)
-            ok = True ;'''_run_script(
-                "scale_setup.py",
-                [subject_num, str(subj_dir), str(model_file), str(xml)],
-                setup_dir,
-                logger,
-            )
-            # _dbg("SCALE-SETUP", "scale_setup.py result", "SUCCESS" if ok else "FAILED") '''
-            return ok
-        
+            try:
+                if write_setup("scale", subj_dir, {}, model_file, xml) is None:
+                    logger.warning("No scale setup rendered for subject %s (no target or not in the "
+                                   "subject registry)", subject_num)
+            except Exception as exc:
+                logger.error("Scale setup error for %s: %s", subject_num, exc)
+                return False
+        return True
+
     # ---- GRF setup --------------------------------------
-    
-    # _dbg("GRF-SETUP", "Entering GRF setup branch (stw1 trial)")
+    # Always rendered: it follows the cached plate assignment of the trial
     try:
         grf_xml_path = trial.get("grf_xml", "")
-        
-        # _dbg("GRF-SETUP", "GRF XML path (to be generated)", grf_xml_path)
-        logger.info("Generating GRF setup for subject %s", subject_num)
-        mot_path = trial.get("trial_mot", "")
-        trc_path = trial.get("trial_trc", "")
         # _dbg("GRF-SETUP", "GRF XML path", grf_xml_path)
-        # _dbg("GRF-SETUP", "GRF XML exists?", Path(grf_xml_path).exists() if grf_xml_path else "no path")
-        # _dbg("GRF-SETUP", "MOT path", mot_path)
-        # _dbg("GRF-SETUP", "MOT exists?", Path(mot_path).exists() if mot_path else "no path")
-        # _dbg("GRF-SETUP", "TRC path", trc_path)
-        # _dbg("GRF-SETUP", "TRC exists?", Path(trc_path).exists() if trc_path else "no path")
-        
         logger.info("Generating GRF setups for subject %s", subject_num)
-        ok = _run_script(
-            "grf_setup.py",
-            [subject_num, str(subj_dir), str(mot_path), str(trc_path), str(grf_xml_path)],
-            setup_dir,
-            logger,
-        )
-        # _dbg("GRF-SETUP", "grf_setup.py result", "SUCCESS" if ok else "FAILED")
+        wrote = write_setup("grf", subj_dir, trial, model_file, grf_xml_path)
+        if wrote is None and grf_xml_path:
+            logger.error("No force plate could be assigned to a foot for %s", trial_name)
+        elif wrote is False:
+            logger.debug("GRF setup unchanged: %s", grf_xml_path)
     except Exception as exc:
         # _dbg("GRF-SETUP", "EXCEPTION in GRF setup", str(exc))
         logger.error("GRF setup error for %s: %s", subject_num, exc)
 
-    # ---- ID setup ---------------------------------------------------
-    # _dbg("ID-SETUP", "Entering ID setup branch")
-    try:
-        id_xml_path = trial.get("id_xml", "")
-        if not id_xml_path:
-            # _dbg("ID-SETUP", "ID XML path (to be generated)", id_xml_path)
-            logger.info("Generating ID setups for subject %s", subject_num)
-        
-            ok = True ;'''_run_script(
-                "id_setup.py",
-                [str(subj_dir), str(trial_name), str(model_file), str(id_xml_path)],
-                setup_dir,
-                logger,
-            ) '''
-            # _dbg("ID-SETUP", "id_setup.py result", "SUCCESS" if ok else "FAILED")
-    except Exception as exc:
-        # _dbg("ID-SETUP", "EXCEPTION in ID setup", str(exc))
-        logger.error("ID setup error for %s: %s", subject_num, exc)
+    # ---- IK / ID / SO setups ------------------------------------------
+    # Rendered only when missing, so hand-tuned setups are kept
+    for kind in ("ik", "id", "so"):
+        xml_path = trial.get(f"{kind}_xml", "")
+        if not xml_path or Path(xml_path).exists():
+            continue
+        # _dbg(f"{kind.upper()}-SETUP", "XML path (to be generated)", xml_path)
+        logger.info("Generating %s setup for subject %s", kind.upper(), subject_num)
+        try:
+            write_setup(kind, subj_dir, trial, model_file, xml_path)
+        except Exception as exc:
+            logger.error("%s setup error for %s: %s", kind.upper(), subject_num, exc)
 
-    # ---- SO setup ---------------------------------------------------
-    # _dbg("SO-SETUP", "Entering SO setup branch")
+    # ---- SO actuators -------------------------------------------------
     try:
         so_dir = subj_dir / "SO"
-        so_xml_path = trial.get("so_xml", "")
-        # _dbg("SO-SETUP", "SO dir", so_dir)
-        # _dbg("SO-SETUP", "SO dir exists?", so_dir.exists())
-        # _dbg("SO-SETUP", "SO XML path", so_xml_path)
-        # _dbg("SO-SETUP", "SO XML exists?", Path(so_xml_path).exists() if so_xml_path else "no path")
-        if not so_dir.exists() or not Path(so_xml_path).exists():
-            # _dbg("SO-SETUP", "SO XML or dir missing — running SO_setup.py")
-            logger.info("Generating SO setups for subject %s", subject_num)
-            ok = True ;'''_run_script(
-                "SO_setup.py",
-                [str(subj_dir), str(trial_name), str(model_file), str(so_xml_path)],
-                setup_dir,
-                logger,
-            ) '''
-            # _dbg("SO-SETUP", "SO_setup.py result", "SUCCESS" if ok else "FAILED")
-        else:
-            # _dbg("SO-SETUP", "SO XML already exists — skipping SO_setup.py")
-            pass
-
-        actuators_src = Path(r"d:\RESEARCH\STW_dataset\Extracted\model\cmc_actuators.xml")
+        actuators_src = ACTUATORS_SRC
         actuators_dst = so_dir / "cmc_actuators.xml"
         # _dbg("SO-SETUP", "Actuators source", actuators_src)
         # _dbg("SO-SETUP", "Actuators source exists?", actuators_src.exists())
@@ -284,28 +212,6 @@ def generate_setups_if_needed(
         # _dbg("SO-SETUP", "EXCEPTION in SO setup", str(exc))
         logger.error("SO setup error for %s: %s", subject_num, exc)
 
-    # ---- IK setup ---------------------------------------------------
-    # _dbg("IK-SETUP", "Entering IK setup branch")
-    try:
-        ik_xml_path = trial.get("ik_xml", "")
-        trc_path = trial.get("trial_trc", "")
-        # _dbg("IK-SETUP", "IK XML path (to be generated)", ik_xml_path)
-        # _dbg("IK-SETUP", "TRC path", trc_path)
-        # _dbg("IK-SETUP", "TRC exists?", Path(trc_path).exists() if trc_path else "no path")
-        if not ik_xml_path or not Path(trc_path).exists():
-            # _dbg("IK-SETUP", "IK XML or TRC missing — running ik_setup.py")
-            logger.info("Generating IK setups for subject %s", subject_num)
-            ok = True ;'''_run_script(
-                "ik_setup.py",
-                [str(subj_dir), str(trial_name), str(model_file), str(trc_path), str(ik_xml_path)],
-                setup_dir,
-                logger,
-            ) '''
-            # _dbg("IK-SETUP", "ik_setup.py result", "SUCCESS" if ok else "FAILED")
-    except Exception as exc:
-        # _dbg("IK-SETUP", "EXCEPTION in IK setup", str(exc))
-        logger.error("IK setup error for %s: %s", subject_num, exc)
-
     return True
 
 
@@ -5,10 +5,12 @@ Features:
 - Extract root_dir from JSON
 - Discover subjects under root_dir (Sxx)
 - Subject checklist with filter & sort
-- Per-subject trial discovery (replacing '01' in template paths) and validation
+- Per-subject trial discovery (template compiled per subject by manifest.py) and validation
 - Trial tree with checkboxes under subjects
 - Select pipeline steps (Scale, IK, ID, SO)
 - Run pipeline (in background thread) and display logs
+- Live view of the run: running jobs, trials/minute, CPU use and ETA (run_monitor.py)
+- Pause / stop / abort a run and resume its unfinished trials later (run_state.py)
 
 Save this file and run: python pipeline_gui.py
 Requires: PySide6, OpenSim (if running actual tools)
@@ -17,50 +19,34 @@ Requires: PySide6, OpenSim (if running actual tools)
 import sys
 import os
 import json
+import time
 import logging
-import subprocess
+import queue
 import threading
-import shutil
 from pathlib import Path
 from dataclasses import dataclass, field
 from typing import Dict, List
-from multiprocessing import Pool, cpu_count
 
 from PySide6.QtWidgets import (
     QApplication, QWidget, QMainWindow, QFileDialog, QPushButton, QLabel,
     QListWidget, QListWidgetItem, QVBoxLayout, QHBoxLayout, QTreeWidget, QTreeWidgetItem,
-    QCheckBox, QLineEdit, QTextEdit, QProgressBar, QGroupBox, QGridLayout, QMessageBox
+    QCheckBox, QLineEdit, QTextEdit, QProgressBar, QGroupBox, QGridLayout, QMessageBox,
+    QTableWidget, QTableWidgetItem, QHeaderView
 )
-from PySide6.QtCore import Qt, Signal, QObject
+from PySide6.QtCore import Qt, Signal, QObject, QTimer
 
-
-import opensim as osim
+from file_inventory import FileInventory
+from manifest import compile_manifest, compile_subject, load_template, restrict_trials
+from pipeline_cli import discover_subjects, physical_core_count, run_parallel, run_sequential
+from preflight import DEFAULT_REPORT_NAME, build_jobs, cleared_entries, preflight_all, write_report
+from quality_gates import DEFAULT_SUMMARY_NAME, load_gates, log_summary, write_summary
+from run_monitor import DEFAULT_TIMINGS_NAME, RunMonitor, format_duration, load_timings, record_timings
+from run_state import DEFAULT_STATE_NAME, RunControl, build_state, load_state, resume_trials, start_manager, write_state
 
 
 BOLD_RED = "\033[1;91m" # Bold and bright red for extra attention
 END = "\033[0m" # Reset code
 
-def subject_worker(args):
-    s, template_path, root_dir, steps, trials = args
-    import json
-    import opensim as osim
-
-    from pathlib import Path
-
-    engine = PipelineEngine(logging.getLogger(f"S{s}"))
-    template = json.load(open(template_path))
-
-    engine.run_pipeline_for_subject(
-        s,
-        template,
-        root_dir,
-        enabled_steps=steps,
-        selected_trials=trials
-    )
-
-    return s
-
-
 # ------------------ Data classes ------------------
 
 @dataclass
@@ -74,275 +60,7 @@ class PipelineConfig:
     run_id: bool
     run_so: bool
     parallel: bool
-
-
-# ------------------ Utility functions ------------------
-
-def replace_subject_in_path(path_str: str, old_subj: str, new_subj: str) -> str:
-    return path_str.replace(old_subj, new_subj)
-
-
-# ------------------ Pipeline Engine (refactored) ------------------
-class PipelineEngine:
-    def __init__(self, logger: logging.Logger = None):# type: ignore
-        self.logger = logger or logging.getLogger(__name__)
-
-    def generate_setups_if_needed(self, subject_num: str, subj_dir: Path, trial, model_file: Path,xml = "", trial_name = "") -> bool:
-        script_dir = Path(__file__).parent
-        print(f"subject_num = {subject_num},\nsubj_dir = {subj_dir},\ntrial = {trial},\nmodel_file = {model_file},\nxml = {xml},\ntrial_name = {trial_name}\n")
-        if trial_name == "scale":
-            # scale
-            scale_dir = subj_dir / "scale"
-            # if not scale_dir.exists() or not Path(xml).exists():
-            self.logger.info(f"Generating scale setup for subject {subject_num}")
-            
-            result = subprocess.run(['python', 'scale_setup.py', subject_num, str(subj_dir), str(model_file), str(xml)], cwd=str(Path.joinpath(script_dir.parent, 'setup_files')), capture_output=True, text=True)
-            if result.returncode != 0:
-                self.logger.error(f"Scale setup failed for {subject_num}: {result.stderr}")
-            return True
-        # GRF
-        try:
-            grf_dir = subj_dir / "ID" / "grf"
-            if trial_name == "stw1":
-            # if not grf_dir.exists() or not Path(trial.get('grf_xml',"")).exists():
-                self.logger.info(f"Generating GRF setups for subject {subject_num}")
-                print("*"*50)
-                result = subprocess.run(['python', 'grf_setup.py', subject_num, str(subj_dir), str(trial_name), str(trial.get('trial_mot',"")),str(trial.get('trial_trc',"")),str(trial.get('grf_xml',""))], cwd=str(Path.joinpath(script_dir.parent, 'setup_files')), capture_output=True, text=True)
-                print(result.returncode)
-        except Exception as e:
-            self.logger.error(f"GRF setup failed for {subject_num}: {e}")
-
-        # ID
-        try:
-            id_dir = subj_dir / "ID"
-            # if not id_dir.exists() or not Path(trial.get('id_xml',"")).exists():
-            self.logger.info(f"Generating ID setups for subject {subject_num}")
-            
-            result = subprocess.run(['python', 'id_setup.py', str(subj_dir), str(trial_name), str(model_file), str(trial.get('id_xml',""))], cwd=str(Path.joinpath(script_dir.parent, 'setup_files')), capture_output=True, text=True)
-        except Exception as e:
-            self.logger.error(f"ID setup failed for {subject_num}: {e}")
-
-        # SO
-        try:
-            so_dir = subj_dir / "SO"
-            if not so_dir.exists() or not Path(trial.get('so_xml',"")).exists():
-                self.logger.info(f"Generating SO setups for subject {subject_num}")
-                
-                result = subprocess.run(['python', 'SO_setup.py', str(subj_dir), str(trial_name), str(model_file), str(trial.get('so_xml',""))], cwd=str(Path.joinpath(script_dir.parent, 'setup_files')), capture_output=True, text=True)
-            
-            # Copy actuators file if it doesn't exist
-            actuators_src = Path(r"d:\student\MTech\Sakshi\STW\S01\SO\cmc_actuators.xml")
-            actuators_dst = so_dir / "cmc_actuators.xml"
-            if actuators_src.exists() and not actuators_dst.exists():
-                so_dir.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(str(actuators_src), str(actuators_dst))
-                self.logger.info(f"Copied cmc_actuators.xml to {actuators_dst}")
-        except Exception as e:
-            self.logger.error(f"SO setup failed for {subject_num}: {e}")
-
-        # IK
-        try:            
-            ik_dir = subj_dir / "IK"
-            # if not ik_dir.exists() or not Path(trial.get('ik_xml',"")).exists():
-            self.logger.info(f"Generating IK setups for subject {subject_num}")
-            
-            result = subprocess.run(['python', 'ik_setup.py', str(subj_dir), str(trial_name), str(model_file), str(trial.get('trial_trc',"")), str(trial.get('ik_xml',""))], cwd=str(Path.joinpath(script_dir.parent, 'setup_files')), capture_output=True, text=True)
-        except Exception as e:
-            self.logger.error(f"IK setup failed for {subject_num}: {e}")
-        
-
-        return True
-
-    def run_pipeline_for_subject(self, subject_num: str, template: dict, root_dir: Path, enabled_steps: dict, selected_trials: List[str] = None): # type: ignore
-        subj_dir = root_dir / f"S{subject_num}"
-        osim.Logger.setLevelString("Warn")
-        if not subj_dir.exists():
-            self.logger.warning(f"Subject {subject_num} directory not found; skipping.")
-            return False
-        # osim.Logger_setLevelString("Off")
-        adapted = json.loads(json.dumps(template))
-        # Replace subject 01 with subject_num in adapted paths
-        for key, value in adapted.items():
-            if isinstance(value, str):
-                adapted[key] = replace_subject_in_path(value, "01", subject_num)
-            elif isinstance(value, list):
-                for item in value:
-                    if isinstance(item, dict):
-                        for k, v in item.items():
-                            if isinstance(v, str):
-                                item[k] = replace_subject_in_path(v, "01", subject_num)
-
-        # print(f"Adapted template for subject {subject_num}: {adapted}")  # Debug print to check adapted paths
-        original_cwd = os.getcwd()
-        try:
-            
-            print('{BOLD_RED}',os.getcwd(),'{END}')
-            self.logger.info(f"Processing subject {subject_num} in {subj_dir}")
-
-            # Scaling
-            scaled_model = None
-            scale_xml = None
-            if enabled_steps.get('scale', True):
-                os.mkdir(subj_dir / "scale") if not (subj_dir / "scale").exists() else None
-                # os.chdir(os.path.join(str(subj_dir)+'\\scale'))
-                scale_xml = Path(adapted.get('scale_xml', ''))
-                self.generate_setups_if_needed(subject_num = subject_num, subj_dir = subj_dir, trial = 0, model_file=adapted.get('model', ''),xml = scale_xml,trial_name = "scale") # generate scale setup if not exists
-                if scale_xml.exists():
-                    os.chdir(str(scale_xml.parent))
-                    self.logger.info(f"Running scaling for subject {subject_num}")
-                    
-                    try:
-                        
-                        scale_tool = osim.ScaleTool(str(scale_xml))
-                        scale_tool.setPathToSubject("")
-                        scaled_model = scale_tool.getMarkerPlacer().getOutputModelFileName()
-                        scale_tool.getGenericModelMaker().setModelFileName(adapted.get("model", ""))
-                        scale_tool.getMarkerPlacer().setMarkerFileName(adapted.get("static_trc", ""))
-                        scale_tool.getModelScaler().setMarkerFileName(adapted.get("static_trc", ""))
-                        scale_tool.printToXML(str(scale_xml))  # Save the possibly updated XML
-
-                        success = scale_tool.run()
-                        if not success:
-                            self.logger.error(f"Scaling failed for {subject_num}")
-                            return False
-                    except Exception as e:
-                        self.logger.error(f"Scaling failed for {subject_num}: {str(e)}")
-                        return False
-                else:
-                    self.logger.warning(f"Scale XML not found for {subject_num}; skipping scaling.")
-            
-            # Run for each trial
-            mapped_trials = adapted.get('mapped_trials', [])
-            # if not scaled_model:
-            #     self.logger.error(f"[FATAL] No scaled model for subject {subject_num}")
-            #     return False
-            # scaled_model = os.path.join(scale_xml.parent, scaled_model) #type : ignore
-            for trial in mapped_trials:
-                # extract trial name robustly
-                trc = trial.get('trial_trc', '')
-                # attempt to replace subject in trc path
-                trc = replace_subject_in_path(trc, '01', subject_num)
-                # default trial name as filename without extension
-                trial_name = Path(trc).stem
-
-                # if user selected only specific trials, skip others
-                if selected_trials and trial_name not in selected_trials:
-                    self.logger.debug(f"Skipping trial {trial_name} as not selected")
-                    continue
-
-                self.logger.info(f"Processing trial {trial_name} for subject {subject_num}")
-                
-                if not self.generate_setups_if_needed(subject_num = subject_num, subj_dir = subj_dir, trial = trial, trial_name = trial_name, model_file=(os.path.join(scale_xml.parent,(scaled_model))) ):
-                    self.logger.error(f"Setup generation failed for {subject_num}; skipping.")
-                    continue
-
-                # IK
-                ik_tool = None
-                if enabled_steps.get('ik', True):
-                    ik_xml = Path(replace_subject_in_path(trial.get('ik_xml', ''), '01', subject_num))
-                    os.chdir(str(ik_xml.parent))
-                    self.logger.info(f"ik xml =  {ik_xml}")           
-                    if ik_xml.exists():
-                        self.logger.info(f"Running IK for trial {trial_name}")
-                        
-                        try:
-                            ik_tool = osim.InverseKinematicsTool(str(ik_xml))
-                            ik_tool.set_model_file((os.path.join(scale_xml.parent,(scaled_model)))) 
-                            ik_tool.setMarkerDataFileName(trial['trial_trc'])
-                            ik_tool.printToXML(str(ik_xml))  # Save the possibly updated XML
-                            success = ik_tool.run() 
-                            if not success:
-                                self.logger.error(f"IK failed for {trial_name}")
-                                continue
-                        except Exception as e:
-                            self.logger.error(f"IK failed for {trial_name}: {str(e)}")
-                            continue
-                    else:
-                        self.logger.warning(f"IK XML not found for {trial_name}; skipping IK.")
-                        continue
-
-                # ID
-                if enabled_steps.get('id', True):
-                    id_xml = Path(replace_subject_in_path(trial.get('id_xml', ''), '01', subject_num))
-                    grf_xml = Path(replace_subject_in_path(trial.get('grf_xml', ''), '01', subject_num))
-                    os.chdir(str(id_xml.parent))
-                    if id_xml.exists() and grf_xml.exists():
-                        id_tool = osim.InverseDynamicsTool(str(id_xml))
-                    else:
-                        id_tool = osim.InverseDynamicsTool()
-                        self.logger.info(f"Running ID for trial {trial_name}")
-                        
-                    try:
-                        if grf_xml.exists():
-                            id_tool.setModelFileName((os.path.join(scale_xml.parent,(scaled_model))))
-                            mot_file = ik_tool.getOutputMotionFileName()
-                            table = osim.TimeSeriesTable(mot_file)
-                            start = table.getIndependentColumn()[0]
-                            end   = table.getIndependentColumn()[-1]
-                            id_tool.setStartTime(start)
-                            id_tool.setEndTime(end)   
-                            if ik_tool is not None:
-                                id_tool.setCoordinatesFileName(os.path.join(ik_xml.parent, mot_file))
-                            id_tool.setExternalLoadsFileName(str(grf_xml))
-                            id_tool.printToXML(str(id_xml))  # Save the possibly updated XML
-                            success = id_tool.run()
-                            if not success:
-                                self.logger.error(f"ID failed for {trial_name}")
-                                continue
-                        else:
-                            self.logger.info(f"Grf file does not exist for {trial_name}")
-                            continue
-                    except Exception as e:
-                        self.logger.error(f"ID failed for {trial_name}: {str(e)}")
-                        continue
-
-                # SO
-                if enabled_steps.get('so', True):
-                    so_xml = Path(replace_subject_in_path(trial.get('so_xml', ''), '01', subject_num))
-                    os.chdir(str(so_xml.parent))
-                    if so_xml.exists():
-                        self.logger.info(f"Running SO for trial {trial_name}")
-                        
-                        try:
-                            so_tool = osim.AnalyzeTool(str(so_xml))
-                            so_tool.setExternalLoadsFileName(str(grf_xml)) 
-                            so_tool.setModel((os.path.join(scale_xml.parent,scaled_model)))   
-                            if ik_tool is not None:
-                                so_tool.setCoordinatesFileName(ik_tool.getOutputMotionFileName())
-                            so_tool.printToXML(str(so_xml))  # Save the possibly updated XML
-                            success = so_tool.run()
-                            if not success:
-                                self.logger.error(f"SO failed for {trial_name}")
-                        except Exception as e:
-                            self.logger.error(f"SO failed for {trial_name}: {str(e)}")
-                    else:
-                        self.logger.warning(f"SO XML not found for {trial_name}; skipping SO.")
-                        continue
-        
-        finally:
-            os.chdir(original_cwd)
-
-    def run_pipeline(self, config: PipelineConfig):
-        # Load template
-        with open(config.template_path, 'r') as f:
-            template = json.load(f)
-
-        root_dir = config.root_dir
-
-        subjects = config.subjects
-        self.logger.info(f"Starting pipeline for subjects: {subjects}")
-
-        for s in subjects:
-            self.run_pipeline_for_subject(s, template, root_dir,
-                                         enabled_steps={
-                                             'scale': config.run_scale,
-                                             'ik': config.run_ik,
-                                             'id': config.run_id,
-                                             'so': config.run_so
-                                         },
-                                         selected_trials=config.trials.get(s, None)) # type: ignore
-
-        self.logger.info("Pipeline completed.")
+    resume: bool = False
 
 
 # ------------------ Logging integration with Qt ------------------
@@ -449,10 +167,26 @@ class MainWindow(QMainWindow):
         self.chk_parallel = QCheckBox("Parallel (use multiple cores)")
         self.btn_run = QPushButton("Run pipeline")
         self.btn_run.clicked.connect(self.run_pipeline)
+        self.chk_resume = QCheckBox("Resume unfinished")
+        self.chk_resume.setToolTip("Run only the incomplete/pending trials recorded in run_state.json")
         run_box.addWidget(self.chk_parallel)
+        run_box.addWidget(self.chk_resume)
         run_box.addWidget(self.btn_run)
         left_panel.addLayout(run_box)
 
+        # Pause / stop (no new trials) / abort (terminate running tools)
+        control_box = QHBoxLayout()
+        self.btn_pause = QPushButton("Pause")
+        self.btn_stop = QPushButton("Stop after running trials")
+        self.btn_abort = QPushButton("Abort")
+        self.btn_pause.clicked.connect(self.toggle_pause)
+        self.btn_stop.clicked.connect(lambda: self.cancel_run(hard=False))
+        self.btn_abort.clicked.connect(lambda: self.cancel_run(hard=True))
+        for btn in (self.btn_pause, self.btn_stop, self.btn_abort):
+            btn.setEnabled(False)
+            control_box.addWidget(btn)
+        left_panel.addLayout(control_box)
+
         # Right: Trial tree + logs
         self.trial_tree = QTreeWidget()
         self.trial_tree.setHeaderLabels(["Subject/Trial", "Exists"])
@@ -468,7 +202,14 @@ class MainWindow(QMainWindow):
         # Progress
         self.progress = QProgressBar()
         right_panel.addWidget(self.progress)
-        self.engine = PipelineEngine(logger=self.logger)
+        self.run_status = QLabel("")
+        right_panel.addWidget(self.run_status)
+        self.job_table = QTableWidget(0, 5)
+        self.job_table.setHorizontalHeaderLabels(["Subject", "Trial", "Stage", "Elapsed", "PID"])
+        self.job_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)        # type: ignore
+        self.job_table.setEditTriggers(QTableWidget.NoEditTriggers)                          # type: ignore
+        right_panel.addWidget(QLabel("Running jobs:"))
+        right_panel.addWidget(self.job_table, stretch=1)
         self.qt_emitter.progress_signal.connect(self.progress.setValue)
 
         main_layout.addLayout(left_panel, stretch=1)
@@ -478,10 +219,27 @@ class MainWindow(QMainWindow):
         self.template = None
         self.template_path = None
         self.root_dir = None
+        self.inventory = None  # FileInventory of root_dir
         self.detected_subjects = []  # list of '01','02' etc
         self.subject_items = {}  # subj -> QListWidgetItem
         self.subject_trials = {}  # subj -> list of trial dicts
 
+        # Run view: workers report progress events on self.events, the timer folds them in
+        self.events = None
+        self.manager = None
+        self.monitor = None  # RunMonitor of the current run
+        self.control = None  # RunControl of the current run
+        self.pool_run = False  # True once the current run's subjects went to run_parallel's pool
+        self.run_thread = None
+        self.run_id = ""
+        self.run_result = "interrupted"
+        self.state_path = None
+        self.resumed_state = None  # run state a resumed run continues
+        self.run_finished = False
+        self.run_timer = QTimer(self)
+        self.run_timer.setInterval(1000)
+        self.run_timer.timeout.connect(self.refresh_run_view)
+
         # Connect logger signal to UI
         self.qt_emitter.log_signal.connect(self.append_log)
 
@@ -530,6 +288,9 @@ class MainWindow(QMainWindow):
             return
         self.root_dir = Path(root)
 
+        # index the dataset once; subject/trial lookups below query it, not the drive
+        self.inventory = FileInventory.open(self.root_dir, logger=self.logger) if self.root_dir.exists() else None
+
         # discover subjects in root_dir
         self.detect_subjects()
 
@@ -542,10 +303,7 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Warning", f"Root dir {self.root_dir} does not exist")
             return
 
-        subjects = [p.name.replace('S', '') for p in sorted(self.root_dir.glob('S*')) if p.is_dir()]
-        # ensure two-digit format
-        subjects = [s for s in subjects if s.isdigit()]
-        subjects = sorted(subjects, key=lambda x: int(x))
+        subjects = discover_subjects(self.root_dir, self.inventory)
         self.detected_subjects = subjects
 
         for s in subjects:
@@ -604,13 +362,11 @@ class MainWindow(QMainWindow):
     def resolve_trials_for_subject(self, subj: str):
         # Use template mapped_trials to resolve trial paths for the given subject
         trials = []
-        mapped = self.template.get('mapped_trials', []) if self.template else []
+        mapped = compile_subject(self.template, subj)['mapped_trials'] if self.template else []
         for t in mapped:
-            trc = t.get('trial_trc', '')
-            trc_sub = replace_subject_in_path(trc, '01', subj)
-            exists = Path(trc_sub).exists()
-            trial_name = Path(trc_sub).stem
-            trials.append({'name': trial_name, 'path': trc_sub, 'exists': exists, 'raw': t})
+            trc_sub = t['trial_trc']
+            exists = self.inventory.exists(trc_sub) if self.inventory else Path(trc_sub).exists()
+            trials.append({'name': t['trial'], 'path': trc_sub, 'exists': exists, 'raw': t})
         self.subject_trials[subj] = trials
 
     def populate_trial_tree(self):
@@ -656,7 +412,8 @@ class MainWindow(QMainWindow):
             run_ik=self.chk_ik.isChecked(),
             run_id=self.chk_id.isChecked(),
             run_so=self.chk_so.isChecked(),
-            parallel=self.chk_parallel.isChecked()
+            parallel=self.chk_parallel.isChecked(),
+            resume=self.chk_resume.isChecked()
         )
         return config
 
@@ -680,18 +437,109 @@ class MainWindow(QMainWindow):
         if QMessageBox.question(self, "Confirm run", msg) != QMessageBox.StandardButton.Yes:
             return
 
+        # spawned workers can only reach a Manager queue; a sequential run stays in this process
+        if config.parallel:
+            self.manager = start_manager()
+            self.events = self.manager.Queue()
+        else:
+            self.events = queue.Queue()
+        self.control = RunControl(self.manager)
+        self.monitor = None
+        self.pool_run = False
+        self.run_id = time.strftime("%Y%m%d-%H%M%S")
+        self.run_result = "interrupted"
+        self.state_path = Path(config.root_dir) / DEFAULT_STATE_NAME
+        self.resumed_state = None
+        self.run_finished = False
+        self.btn_run.setEnabled(False)
+        for btn in (self.btn_pause, self.btn_stop, self.btn_abort):
+            btn.setEnabled(True)
+        self.btn_pause.setText("Pause")
+        self.run_timer.start()
+
         # run in background thread to keep UI responsive
-        thread = threading.Thread(target=self._background_run, args=(config,), daemon=True)
-        thread.start()
+        self.run_thread = threading.Thread(target=self._background_run, args=(config,), daemon=True)
+        self.run_thread.start()
 
-    
+    def toggle_pause(self):
+        if self.control is None:
+            return
+        if self.control.paused:
+            self.control.resume()
+            self.btn_pause.setText("Pause")
+            self.logger.info("Run resumed")
+        else:
+            self.control.pause()
+            self.btn_pause.setText("Resume")
+            self.logger.info("Run paused: running trials finish, no new trial starts")
+
+    def cancel_run(self, hard: bool):
+        if self.control is None or self.run_finished:
+            return
+        # only run_parallel's pool workers can be terminated; a run in this process (sequential,
+        # or a parallel run with a single subject) stops after its running trial
+        if hard and not self.pool_run:
+            self.logger.warning("Sequential run: stopping after the running trial (tools in this process can't be killed)")
+        self.control.cancel(hard=hard and self.pool_run)
+        self.logger.warning(f"Run cancelled{': terminating workers' if self.control.hard else ''}")
+        self.btn_pause.setEnabled(False)
+        self.btn_stop.setEnabled(False)
+
+    def write_run_state(self, status: str):
+        if self.monitor is None or self.state_path is None:
+            return
+        try:
+            write_state(self.state_path, build_state(self.run_id, status, self.monitor.steps,
+                                                     self.monitor.trial_states(), self.resumed_state))
+        except OSError as e:
+            self.logger.error(f"Could not write run state: {str(e)}")
+
+    def closeEvent(self, event):
+        # never leave workers holding cores behind a closed window
+        if self.run_thread is not None and self.run_thread.is_alive():
+            answer = QMessageBox.question(self, "Run in progress", "Abort the running pipeline and quit?")
+            if answer != QMessageBox.StandardButton.Yes:
+                event.ignore()
+                return
+            self.control.cancel(hard=True)
+            self.run_thread.join(timeout=30)
+            self.refresh_run_view()
+        event.accept()
+
+    def refresh_run_view(self):
+        finished = self.run_finished
+        if self.monitor is not None:
+            if self.monitor.update(self.events):
+                self.write_run_state("paused" if self.control.paused else "running")
+            rows = self.monitor.running_jobs()
+            self.job_table.setRowCount(len(rows))
+            for r, job in enumerate(rows):
+                values = (f"S{job['subject']}", job['trial'], job['stage'].upper(),
+                          format_duration(job['elapsed']), str(job['pid']))
+                for c, value in enumerate(values):
+                    self.job_table.setItem(r, c, QTableWidgetItem(value))
+            total = self.monitor.total_trials
+            self.progress.setValue(int(self.monitor.completed_trials / total * 100) if total else 0)
+            self.run_status.setText(("PAUSED  |  " if self.control.paused else "") + self.monitor.status_line())
+
+        if finished:
+            self.run_timer.stop()
+            self.job_table.setRowCount(0)
+            self.write_run_state(self.run_result)
+            if self.run_result != "completed" and self.monitor is not None:
+                self.logger.warning(f"Run {self.run_result}; tick 'Resume unfinished' to continue it")
+            for btn in (self.btn_pause, self.btn_stop, self.btn_abort):
+                btn.setEnabled(False)
+            if self.manager is not None:
+                self.manager.shutdown()
+                self.manager = None
+            self.btn_run.setEnabled(True)
 
     def _background_run(self, config: PipelineConfig):
         try:
             self.qt_emitter.progress_signal.emit(0)
 
             subjects = config.subjects
-            total = len(subjects)
 
             steps = {
                 'scale': config.run_scale,
@@ -700,39 +548,74 @@ class MainWindow(QMainWindow):
                 'so': config.run_so
             }
 
+            # Compile once here; workers only receive their own manifest entry
+            manifest = compile_manifest(load_template(config.template_path), subjects,
+                                        trials_by_subject=config.trials)
+            entries = manifest['subjects']
+            if config.resume:
+                self.resumed_state = load_state(self.state_path)
+                todo = resume_trials(self.resumed_state)
+                entries = [restrict_trials(e, todo[e['subject']]) for e in entries if e['subject'] in todo]
+                entries = [e for e in entries if e['mapped_trials']]
+                self.logger.info(f"Resuming run {self.resumed_state.get('run_id', '?')}: "
+                                 f"{sum(len(e['mapped_trials']) for e in entries)} trial(s) left")
+            # Same pre-flight as pipeline_cli.py: blocked steps never reach the solver pool
+            if any(steps[s] for s in ('ik', 'id', 'so')):
+                checks = build_jobs({'subjects': entries}, steps, self.inventory)
+                check_cores = max(1, physical_core_count()-1) if config.parallel else 1
+                rows = preflight_all(checks, cores=check_cores, logger=self.logger)
+                report = Path(config.root_dir) / DEFAULT_REPORT_NAME
+                write_report(rows, report)
+                entries = cleared_entries(entries, rows)
+                self.logger.info(f"Pre-flight: {sum(len(e['mapped_trials']) for e in entries)}/{len(rows)} "
+                                 f"trial(s) cleared; report written to {report}")
+                if not entries:
+                    self.logger.error(f"Every trial failed pre-flight (see {report})")
+                    return
+            # Same job tuples and runners as pipeline_cli.py
+            gates = load_gates()
             jobs = []
-            for s in subjects:
+            for entry in entries:
                 jobs.append((
-                    s,
-                    str(config.template_path),
-                    config.root_dir,
+                    entry,
+                    str(config.root_dir),
                     steps,
-                    config.trials.get(s, None)
+                    "INFO",
+                    None,
+                    None,
+                    gates,
+                    self.events,
+                    self.control
                 ))
 
-            if config.parallel:
-                cores = min(cpu_count()-2, len(jobs))
-                self.logger.info(f"Running in parallel on {cores} cores")
-
-                done = 0
-                with Pool(cores) as pool:
-                    for result in pool.imap_unordered(subject_worker, jobs):
-                        done += 1
-                        progress = int(done/total*100)
-                        self.qt_emitter.progress_signal.emit(progress)
-                        self.logger.info(f"Finished subject {result}")
+            cores = min(max(1, physical_core_count()-1), len(jobs)) if config.parallel else 1
+            timings_path = Path(config.root_dir) / DEFAULT_TIMINGS_NAME
+            self.monitor = RunMonitor({e['subject']: [t['trial'] for t in e['mapped_trials']] for e in entries},
+                                      steps, workers=cores, history=load_timings(timings_path))
 
+            self.pool_run = config.parallel and len(jobs) > 1
+            if self.pool_run:
+                self.logger.info(f"Running in parallel on {cores} cores")
+                failed, gate_rows, timings = run_parallel(jobs, cores, self.logger, self.events, self.control)
             else:
-                for idx, job in enumerate(jobs):
-                    subject_worker(job)
-                    progress = int((idx+1)/total*100)
-                    self.qt_emitter.progress_signal.emit(progress)
+                failed, gate_rows, timings = run_sequential(jobs, self.logger, self.events)
+            self.run_result = "cancelled" if self.control.cancelled else "completed"
+
+            record_timings(timings_path, timings)
+            summary_path = Path(config.root_dir) / DEFAULT_SUMMARY_NAME
+            write_summary(gate_rows, summary_path, self.run_id)
+            log_summary(gate_rows, self.logger)
+            self.logger.info(f"Run summary written to {summary_path}")
+            if failed:
+                self.logger.error(f"Failed subjects: {failed}")
 
             self.qt_emitter.progress_signal.emit(100)
             self.logger.info("All done")
 
         except Exception as e:
             self.logger.exception(f"Pipeline failed: {e}")
+        finally:
+            self.run_finished = True
 
 
 
@@ -0,0 +1,451 @@
+"""
+Leg-to-force-plate assignment stage with a persisted, input-keyed cache.
+
+Which foot stands on which force plate decides the ExternalLoads mapping in
+grf_setup.py.  assign_plates() scans every ground_force_N_* column group of
+the GRF .mot, so any number of plates and any plate layout is handled without
+a dataset-specific script.  Instead of re-reading the full TRC and GRF on
+every setup generation, the assignment is computed once per trial and stored
+in <root>/Sxx/leg_assignment.json:
+
+    {"stw1": {"version": 2, "plate_owner": "Right Foot",
+              "plates": {"1": {"side": null, ...}, "2": {"side": "r", ...}, ...},
+              "trc": {"size": ..., "mtime": ..., "sha1": ...},
+              "mot": {"size": ..., "mtime": ..., "sha1": ...}}, ...}
+
+An entry is reused while both inputs are unchanged: equal size and mtime
+short-circuit, otherwise the SHA-1 of the (decompressed) contents decides, so
+a touched-but-identical or re-compressed file does not trigger recomputation.
+Living under the subject directory, the cache is staged and synced back with
+the rest of a subject job (see scratch_staging.EXTRA_INPUTS) and never written
+by two subject workers at once.
+
+    owner = plate_owner(subj_dir, "stw1", trc, mot)     # leading foot: 'Left Foot' / 'Right Foot'
+    plates = plate_mapping(subj_dir, "stw1", trc, mot)  # {2: 'r', 3: 'l'}
+
+The batch CLI fills every subject's cache in a process pool and can write the
+subject x trial table that first_leg_detection.py used to build by hand.
+
+Usage:
+    python leg_assignment.py --root D:/RESEARCH/STW_dataset/Extracted [--subjects 01,02] [--cores N]
+                             [--force] [--wide leg_results.csv]
+"""
+
+import sys
+import csv
+import json
+import os
+import re
+import hashlib
+import logging
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from batch_runner import run_jobs
+from opensim_io import (
+    MarkerData, PathLike, Storage, plain_name, read_bytes, read_storage, read_trc, resolve_path,
+)
+from resample import to_common_grid
+from run_length import find_runs
+
+
+# Bump when the detector changes so cached assignments are recomputed
+ASSIGNMENT_VERSION = 2
+
+CACHE_NAME = "leg_assignment.json"
+
+# Vertical force above which the plate counts as loaded (N)
+STANCE_THRESHOLD_N = 20.0
+
+# Shortest loaded run reported as a stance interval (marker frames)
+MIN_STANCE_FRAMES = 15
+
+# A foot owns a plate when its mean COP distance is at most this far (m) ...
+MAX_COP_DISTANCE_M = 0.15
+# ... and the other foot is at least this many times farther away
+MIN_DISTANCE_RATIO = 2.0
+
+# side -> (heel, toe) marker names
+FOOT_MARKERS = {"l": ("LFCC", "LFMT2"), "r": ("RFCC", "RFMT2")}
+SIDE_NAMES = {"l": "Left Foot", "r": "Right Foot"}
+
+PLATE_COLUMN = re.compile(r"ground_force_(\d+)_vy$", re.IGNORECASE)
+
+# (subject dir, trial name, trc path, mot path)
+TrialInputs = Tuple[str, str, str, str]
+
+
+# ---------------------------------------------------------------------------
+# Detection
+# ---------------------------------------------------------------------------
+
+def plate_ids(columns: List[str]) -> List[int]:
+    """Plate numbers N with a ground_force_N_vy column, in ascending order."""
+    return sorted(int(m.group(1)) for m in map(PLATE_COLUMN.match, columns) if m)
+
+
+def assign_plates(trc_file: PathLike, mot_file: PathLike) -> Dict[int, dict]:
+    """
+    Foot on every force plate of a trial, from one pass over all plates.
+
+    For each plate the stance frames are those with vertical force above
+    STANCE_THRESHOLD_N.  The COP-to-heel and COP-to-toe distances of both feet
+    are computed for every plate and frame as one (frames x plates x markers)
+    array; per frame a foot's distance is its nearer marker, averaged over the
+    plate's stance frames.  A plate is given to a foot only when that foot is
+    within MAX_COP_DISTANCE_M and at least MIN_DISTANCE_RATIO times closer than
+    the other (a plate both feet rest on, e.g. in front of the chair, stays
+    unassigned).
+
+    Returns:
+        {plate: {"side": 'l' | 'r' | None, "nearest": 'l' | 'r' | None,
+                 "distance_m": {"l": float, "r": float},
+                 "stance_s": [[start, end], ...]}}
+    """
+    return plates_from_data(read_trc(trc_file), read_storage(mot_file))
+
+
+def plates_from_data(markers: MarkerData, grf: Storage) -> Dict[int, dict]:
+    """assign_plates() on an already-parsed TRC and GRF."""
+    plates = plate_ids(grf.columns)
+    if not plates:
+        raise ValueError(f"No ground_force_N_vy columns in {grf.name or 'GRF data'}")
+
+    names = [m for side in FOOT_MARKERS for m in FOOT_MARKERS[side]]
+    feet = np.stack([markers.marker(n) for n in names], axis=1)              # (frames, 4, 3)
+    cols = [f"ground_force_{p}_{c}" for p in plates for c in ("px", "py", "pz", "vy")]
+
+    # Anti-aliased resampling of the GRF onto the marker clock, aligned on
+    # timestamps over the span both files cover (rates from the headers)
+    grid, (block, feet) = to_common_grid(
+        [(grf.time, grf.block(cols)), (markers.time, feet)],
+        fs_out=markers.rate,
+        rates=[grf.rate, markers.rate],
+    )
+    block = block.reshape(len(grid), len(plates), 4)
+    cop, fz = block[:, :, :3], block[:, :, 3]                                 # (frames, plates, 3)
+    stance = fz > STANCE_THRESHOLD_N
+
+    dist = np.linalg.norm(feet[:, None, :, :] - cop[:, :, None, :], axis=3)   # (frames, plates, 4)
+    per_side = dist.reshape(len(grid), len(plates), len(FOOT_MARKERS), -1).min(axis=3)
+    n_stance = stance.sum(axis=0)
+    with np.errstate(invalid="ignore"):
+        mean = np.where(stance[:, :, None], per_side, 0.0).sum(axis=0) / n_stance[:, None]
+
+    starts, ends, (rows,) = find_runs(stance, MIN_STANCE_FRAMES)
+    sides = list(FOOT_MARKERS)
+    result: Dict[int, dict] = {}
+    for i, plate in enumerate(plates):
+        entry = {"side": None, "nearest": None, "distance_m": {}, "stance_s": []}
+        entry["stance_s"] = [
+            [round(float(grid[s]), 4), round(float(grid[e - 1]), 4)]
+            for s, e, r in zip(starts, ends, rows) if r == i
+        ]
+        if n_stance[i] >= MIN_STANCE_FRAMES:
+            order = np.argsort(mean[i])
+            best, other = mean[i, order[0]], mean[i, order[1]]
+            entry["nearest"] = sides[order[0]]
+            entry["distance_m"] = {side: round(float(d), 4) for side, d in zip(sides, mean[i])}
+            if best <= MAX_COP_DISTANCE_M and other >= MIN_DISTANCE_RATIO * best:
+                entry["side"] = sides[order[0]]
+        result[plate] = entry
+    return result
+
+
+def first_foot(plates: Dict[int, dict]) -> Optional[str]:
+    """
+    'Left Foot' / 'Right Foot' on the assigned plate loaded first, i.e. the
+    leading leg; None when no plate could be assigned.
+    """
+    loaded = [(e["stance_s"][0][0], e["side"]) for e in plates.values() if e["side"] and e["stance_s"]]
+    return SIDE_NAMES[min(loaded)[1]] if loaded else None
+
+
+def detect_plate_owner(trc_file: PathLike, mot_file: PathLike, plate: int = 2) -> str:
+    """
+    'Left Foot' or 'Right Foot': the foot nearest on average to the plate's
+    centre of pressure while it is loaded (see assign_plates).
+    """
+    nearest = assign_plates(trc_file, mot_file).get(plate, {}).get("nearest")
+    if nearest is None:
+        raise ValueError(f"Force plate {plate} is never loaded in {mot_file}")
+    return SIDE_NAMES[nearest]
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+def content_sha1(path: PathLike) -> str:
+    """SHA-1 of the decompressed contents (plain and .gz/.zst copies agree)."""
+    return hashlib.sha1(read_bytes(path)).hexdigest()
+
+
+def fingerprint(path: PathLike) -> dict:
+    path = resolve_path(path)
+    st = path.stat()
+    return {"size": st.st_size, "mtime": st.st_mtime, "sha1": content_sha1(path)}
+
+
+def matches(recorded: Optional[dict], path: PathLike) -> bool:
+    """True when `path` still has the contents recorded in a fingerprint."""
+    if not recorded:
+        return False
+    path = resolve_path(path)
+    if not path.is_file():
+        return False
+    st = path.stat()
+    if st.st_size == recorded.get("size") and st.st_mtime == recorded.get("mtime"):
+        return True
+    return content_sha1(path) == recorded.get("sha1")
+
+
+def cache_file(subj_dir: PathLike) -> Path:
+    return Path(subj_dir) / CACHE_NAME
+
+
+def load_cache(subj_dir: PathLike) -> Dict[str, dict]:
+    path = cache_file(subj_dir)
+    if not path.is_file():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(subj_dir: PathLike, cache: Dict[str, dict]) -> None:
+    path = cache_file(subj_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(cache, indent=1, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _persisted(entry: dict) -> dict:
+    """Cache form of a worker entry (no paths, which change under scratch staging)."""
+    return {k: v for k, v in entry.items() if k not in ("subject_dir", "trial")}
+
+
+def is_current(entry: Optional[dict], trc_file: PathLike, mot_file: PathLike) -> bool:
+    return (
+        bool(entry)
+        and entry.get("version") == ASSIGNMENT_VERSION
+        and "plate_owner" in entry
+        and matches(entry.get("trc"), trc_file)
+        and matches(entry.get("mot"), mot_file)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Lookup (used by grf_setup.py)
+# ---------------------------------------------------------------------------
+
+def cached_entry(
+    subj_dir: PathLike,
+    trial: str,
+    trc_file: PathLike,
+    mot_file: PathLike,
+    logger: Optional[logging.Logger] = None,
+) -> dict:
+    """Cached assignment for one trial, recomputed and stored only when an input changed."""
+    logger = logger or logging.getLogger("leg_assignment")
+    cache = load_cache(subj_dir)
+    entry = cache.get(trial)
+    if is_current(entry, trc_file, mot_file):
+        logger.debug("Leg assignment for %s from cache: %s", trial, entry["plate_owner"])
+        return entry
+
+    entry = _persisted(assign_trial((str(subj_dir), trial, str(trc_file), str(mot_file))))
+    if entry.get("error"):
+        raise RuntimeError(f"Leg assignment failed for {trial}: {entry['error']}")
+    cache[trial] = entry
+    save_cache(subj_dir, cache)
+    logger.info("Leg assignment for %s computed: %s", trial, entry["plate_owner"])
+    return entry
+
+
+def plate_owner(subj_dir: PathLike, trial: str, trc_file: PathLike, mot_file: PathLike,
+                logger: Optional[logging.Logger] = None) -> str:
+    """Leading foot ('Left Foot' / 'Right Foot') of one trial, from the cache."""
+    return cached_entry(subj_dir, trial, trc_file, mot_file, logger)["plate_owner"]
+
+
+def plate_mapping(subj_dir: PathLike, trial: str, trc_file: PathLike, mot_file: PathLike,
+                  logger: Optional[logging.Logger] = None) -> Dict[int, str]:
+    """{plate number: 'l' | 'r'} for every plate assigned to one foot, from the cache."""
+    plates = cached_entry(subj_dir, trial, trc_file, mot_file, logger)["plates"]
+    return {int(p): e["side"] for p, e in sorted(plates.items(), key=lambda kv: int(kv[0])) if e["side"]}
+
+
+# ---------------------------------------------------------------------------
+# Per-trial worker
+# ---------------------------------------------------------------------------
+
+def assign_trial(args: TrialInputs) -> dict:
+    """Cache entry for one trial (with 'error' set instead of 'plate_owner' on failure)."""
+    subj_dir, trial, trc_file, mot_file = args
+    entry = {"version": ASSIGNMENT_VERSION, "subject_dir": subj_dir, "trial": trial}
+    try:
+        entry["trc"] = fingerprint(trc_file)
+        entry["mot"] = fingerprint(mot_file)
+        plates = assign_plates(trc_file, mot_file)
+        owner = first_foot(plates) or SIDE_NAMES.get(plates.get(2, {}).get("nearest"))
+        if owner is None:
+            raise ValueError("no force plate could be assigned to a foot")
+        entry["plates"] = {str(p): e for p, e in plates.items()}
+        entry["plate_owner"] = owner
+    except Exception as exc:
+        entry["error"] = str(exc)
+    return entry
+
+
+# ---------------------------------------------------------------------------
+# Batch runner
+# ---------------------------------------------------------------------------
+
+def discover_trials(
+    root_dir: Path,
+    subjects: Optional[List[str]] = None,
+    inventory=None,
+) -> List[TrialInputs]:
+    """
+    (subject dir, trial, trc, mot) for every trial TRC with a matching GRF .mot.
+    Read from the cached file_inventory listing when an inventory is passed.
+    """
+    pattern = "S*/S*/Mocap/trcResults/*.trc*"
+    listed = inventory.glob(pattern) if inventory else sorted(root_dir.glob(pattern))
+    exists = inventory.exists if inventory else lambda p: Path(p).exists()
+    resolve = inventory.resolve if inventory else resolve_path
+    trials = []
+    for trc in listed:
+        if plain_name(trc).suffix.lower() != ".trc" or (plain_name(trc) != trc and exists(plain_name(trc))):
+            continue
+        subj_dir = trc.parents[3]
+        if subjects and subj_dir.name.replace("S", "") not in subjects:
+            continue
+        trial = plain_name(trc).stem
+        mot = resolve(trc.parents[1] / "grfResults" / f"{trial}.mot")
+        if exists(mot):
+            trials.append((str(subj_dir), trial, str(trc), str(mot)))
+    return trials
+
+
+def assign_all(
+    trials: List[TrialInputs],
+    cores: int = 1,
+    force: bool = False,
+    logger: Optional[logging.Logger] = None,
+) -> List[dict]:
+    """
+    Bring every subject's cache up to date; only trials whose inputs changed
+    are recomputed, in a spawn-context process pool when cores > 1.
+    """
+    logger = logger or logging.getLogger("leg_assignment")
+    caches = {subj: load_cache(subj) for subj in {t[0] for t in trials}}
+
+    entries: List[dict] = []
+    jobs: List[TrialInputs] = []
+    for job in trials:
+        subj_dir, trial, trc, mot = job
+        entry = caches[subj_dir].get(trial)
+        if not force and is_current(entry, trc, mot):
+            entries.append(dict(entry, subject_dir=subj_dir, trial=trial))
+        else:
+            jobs.append(job)
+    logger.info("%d trial(s) cached, %d to compute", len(entries), len(jobs))
+
+    computed = run_jobs(assign_trial, jobs, cores, _log_entry, logger)
+
+    for entry in computed:
+        if not entry.get("error"):
+            caches[entry["subject_dir"]][entry["trial"]] = _persisted(entry)
+    for subj_dir in {e["subject_dir"] for e in computed}:
+        save_cache(subj_dir, caches[subj_dir])
+
+    entries += computed
+    return sorted(entries, key=lambda e: (e["subject_dir"], e["trial"]))
+
+
+def _log_entry(logger: logging.Logger, done: int, total: int, entry: dict) -> None:
+    subject = Path(entry["subject_dir"]).name
+    if entry.get("error"):
+        logger.error("[%d/%d] %s %s  FAILED: %s", done, total, subject, entry["trial"], entry["error"])
+    else:
+        logger.info("[%d/%d] %s %s  %s", done, total, subject, entry["trial"], entry["plate_owner"])
+
+
+def write_wide(entries: List[dict], path: Path) -> None:
+    """Subject x trial table of plate owners (the layout of leg_results.csv)."""
+    table: Dict[int, Dict[str, str]] = {}
+    for entry in entries:
+        subject = int(Path(entry["subject_dir"]).name.replace("S", ""))
+        table.setdefault(subject, {})[entry["trial"]] = entry.get("plate_owner", "")
+    trials = sorted({t for row in table.values() for t in row})
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow([""] + list(range(len(trials))))
+        for subject in sorted(table):
+            writer.writerow([subject] + [table[subject].get(t, "") for t in trials])
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Batch leg-to-force-plate assignment with a per-subject cache",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--cores", type=int, default=0, help="Worker processes (default: physical_cores - 1)")
+    parser.add_argument("--force", action="store_true", help="Recompute even when the cache is current")
+    parser.add_argument("--wide", default="", help="Optional subject x trial CSV of plate owners")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from file_inventory import FileInventory
+    from pipeline_cli import physical_core_count, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()] or None
+    trials = discover_trials(root_dir, subjects, FileInventory.open(root_dir, logger=logger))
+    if not trials:
+        logger.error("No TRC / GRF trial pairs found under %s", root_dir)
+        sys.exit(1)
+
+    cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+    t0 = time.monotonic()
+    entries = assign_all(trials, cores=cores, force=args.force, logger=logger)
+    logger.info("Finished in %.1f s", time.monotonic() - t0)
+
+    if args.wide:
+        write_wide(entries, Path(args.wide))
+        logger.info("Assignment table written to %s", args.wide)
+
+    failed = [e for e in entries if e.get("error")]
+    if failed:
+        logger.error("Failed trials: %s", [f"{Path(e['subject_dir']).name}/{e['trial']}" for e in failed])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # Required on Windows with frozen/spawn executables
+    main()
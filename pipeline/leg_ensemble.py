@@ -0,0 +1,367 @@
+"""
+Ensemble first-leg detection: three methods, one parse, one vote.
+
+The three first-leg methods used so far each re-read and re-filtered the
+trial on their own:
+
+    cop     COP-to-foot distance on the force plates (first_leg_detection /
+            leg_assignment.assign_plates)
+    acc     first heel to exceed a vertical-acceleration threshold
+            (first_leg_using_just_acc)
+    swing   swing-displacement voting before the first plate contact
+            (assign_leg_to_forceplate_decreptated.detect_swing_leg)
+
+Here the TRC and GRF are parsed once, the heel markers are low-pass filtered
+once as one block (positions, velocities and accelerations derived from it),
+and all three features are computed from those shared arrays.  Each method casts a vote ('l' / 'r' / None) with a strength
+in [0, 1]; the trial result is the side with the larger summed strength,
+with a confidence score (winning strength over total strength, scaled by the
+fraction of methods that voted) and a High / Medium / Low label.
+
+    result = ensemble_leg(trc, mot)     # {'leg': 'r', 'confidence': 0.93, 'label': 'High', ...}
+
+Plots are opt-in (--plot-dir) and drawn after the batch, never in a worker.
+
+Usage:
+    python leg_ensemble.py --root D:/RESEARCH/STW_dataset/Extracted [--subjects 01,02] [--cores N]
+                           [--out leg_ensemble.csv] [--plot-dir DIR]
+"""
+
+import sys
+import csv
+import logging
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from batch_runner import run_jobs
+from leg_assignment import FOOT_MARKERS, SIDE_NAMES, TrialInputs, discover_trials, plates_from_data
+from opensim_io import MarkerData, PathLike, Storage, read_storage, read_trc
+from run_length import detect_onsets, first_sustained
+from signal_filters import lowpass
+
+
+METHODS = ("cop", "acc", "swing")
+
+MARKER_LOWPASS_HZ = 6.0
+GRF_LOWPASS_HZ = 20.0
+
+# Vertical axis of the OpenSim marker frame (Y up)
+VERTICAL = 1
+
+# acc: heel vertical acceleration above this (m/s^2) marks the start of movement
+ACC_THRESHOLD = 1.9
+# acc: a lead of this many seconds or more counts as a full-strength vote
+ACC_FULL_LEAD_S = 0.2
+
+# swing: the window before first contact and the voting margins of detect_swing_leg
+SWING_LOOKBACK_S = 1.5
+SWING_GAP_S = 0.05
+SWING_MARGIN = 0.15
+SWING_NET_ABS_MARGIN = 0.010   # m
+
+# cop: a distance ratio of this or more counts as a full-strength vote
+COP_FULL_RATIO = 4.0
+
+
+# ---------------------------------------------------------------------------
+# Shared arrays
+# ---------------------------------------------------------------------------
+
+def prepare(markers: MarkerData, cutoff: float = MARKER_LOWPASS_HZ) -> Dict[str, np.ndarray]:
+    """
+    Filtered heel positions, velocities and accelerations from one filter pass.
+
+    Returns dict with time, heels (frames, 2, 3) ordered (l, r), heel_vel and
+    heel_acc with the same layout.
+    """
+    names = [FOOT_MARKERS[side][0] for side in ("l", "r")]
+    heels = lowpass(np.stack([markers.marker(n) for n in names], axis=1), cutoff, markers.rate)
+    vel = np.gradient(heels, markers.time, axis=0)
+    acc = np.gradient(vel, markers.time, axis=0)
+    return {"time": markers.time, "heels": heels, "heel_vel": vel, "heel_acc": acc}
+
+
+def first_contact(grf: Storage, plates: Dict[int, dict]) -> Optional[float]:
+    """
+    Time of the first sustained loading of any plate that is unloaded at the
+    start of the trial (the seat / foot-rest plate is ignored).
+    """
+    ids = sorted(p for p, e in plates.items() if e["side"])
+    if not ids:
+        return None
+    fz = lowpass(np.abs(grf.block([f"ground_force_{p}_vy" for p in ids])), GRF_LOWPASS_HZ, grf.rate)
+    onsets, _ = detect_onsets(fz, grf.rate)
+    onsets = onsets[onsets > 0]
+    return float(grf.time[onsets.min()]) if len(onsets) else None
+
+
+# ---------------------------------------------------------------------------
+# Methods
+# ---------------------------------------------------------------------------
+
+def vote_cop(plates: Dict[int, dict]) -> Tuple[Optional[str], float, dict]:
+    """Foot on the first-loaded assigned plate; strength from the distance ratio."""
+    loaded = [(e["stance_s"][0][0], p, e) for p, e in plates.items() if e["side"] and e["stance_s"]]
+    if not loaded:
+        return None, 0.0, {}
+    _, plate, entry = min(loaded)
+    dist = entry["distance_m"]
+    side = entry["side"]
+    ratio = dist["r" if side == "l" else "l"] / max(dist[side], 1e-6)
+    strength = float(np.clip((ratio - 1.0) / (COP_FULL_RATIO - 1.0), 0.0, 1.0))
+    return side, strength, {"plate": plate, "ratio": round(ratio, 2)}
+
+
+def vote_acc(shared: Dict[str, np.ndarray]) -> Tuple[Optional[str], float, dict]:
+    """Heel whose vertical acceleration first exceeds ACC_THRESHOLD."""
+    above = np.abs(shared["heel_acc"][:, :, VERTICAL]) > ACC_THRESHOLD
+    starts = first_sustained(above, 1)                      # (l, r), -1 if never
+    time = shared["time"]
+    if (starts < 0).all():
+        return None, 0.0, {}
+    if (starts < 0).any():
+        side = "l" if starts[0] >= 0 else "r"
+        return side, 1.0, {"start_s": round(float(time[starts.max()]), 3)}
+    lead = abs(float(time[starts[0]] - time[starts[1]]))
+    if lead == 0.0:
+        return None, 0.0, {"lead_s": 0.0}
+    side = "l" if starts[0] < starts[1] else "r"
+    return side, min(1.0, lead / ACC_FULL_LEAD_S), {
+        "start_s": round(float(time[starts.min()]), 3), "lead_s": round(lead, 3),
+    }
+
+
+def vote_swing(shared: Dict[str, np.ndarray], contact_s: Optional[float], ap_axis: int) -> Tuple[Optional[str], float, dict]:
+    """
+    Swing foot before the first plate contact: net displacement (x2), range
+    and 95th-percentile speed along the walking axis, as in detect_swing_leg.
+    """
+    if contact_s is None:
+        return None, 0.0, {}
+    time = shared["time"]
+    ws = int(np.searchsorted(time, max(0.0, contact_s - SWING_LOOKBACK_S)))
+    we = int(np.searchsorted(time, contact_s - SWING_GAP_S))
+    if we - ws < 5:
+        return None, 0.0, {"error": "window too short"}
+
+    pos = shared["heels"][ws:we, :, ap_axis]                # (frames, 2) ordered (l, r)
+    net = pos[-1] - pos[0]
+    rng = np.nanmax(pos, axis=0) - np.nanmin(pos, axis=0)
+    vel = np.nanpercentile(np.abs(shared["heel_vel"][ws:we, :, ap_axis]), 95, axis=0)
+
+    score = np.zeros(2)
+    if abs(net[0] - net[1]) > SWING_NET_ABS_MARGIN:
+        score[np.argmax(net)] += 2
+    for metric in (rng, vel):
+        hi, lo = np.argmax(metric), np.argmin(metric)
+        if metric[hi] > metric[lo] * (1 + SWING_MARGIN):
+            score[hi] += 1
+    details = {"window_s": [round(float(time[ws]), 3), round(float(time[we - 1]), 3)],
+               "scores": {"l": int(score[0]), "r": int(score[1])}}
+    if score[0] == score[1]:
+        return None, 0.0, details
+    side = "l" if score[0] > score[1] else "r"
+    return side, float(abs(score[0] - score[1]) / score.sum()), details
+
+
+# ---------------------------------------------------------------------------
+# Ensemble
+# ---------------------------------------------------------------------------
+
+def combine(votes: Dict[str, Tuple[Optional[str], float, dict]]) -> dict:
+    """Weighted vote over the methods; confidence in [0, 1] plus a label."""
+    strength = {"l": 0.0, "r": 0.0}
+    for side, weight, _ in votes.values():
+        if side:
+            strength[side] += weight
+    total = strength["l"] + strength["r"]
+    n_voted = sum(1 for side, _, _ in votes.values() if side)
+    if total == 0.0 or strength["l"] == strength["r"]:
+        return {"leg": None, "confidence": 0.0, "label": "Low"}
+
+    leg = "l" if strength["l"] > strength["r"] else "r"
+    confidence = strength[leg] / total * n_voted / len(votes)
+    agree = sum(1 for side, _, _ in votes.values() if side == leg)
+    if agree == len(votes):
+        label = "High"
+    elif agree > len(votes) / 2:
+        label = "Medium"
+    else:
+        label = "Low"
+    return {"leg": leg, "confidence": round(confidence, 3), "label": label}
+
+
+def ensemble_from_data(markers: MarkerData, grf: Storage) -> dict:
+    """All three methods on one parsed trial."""
+    shared = prepare(markers)
+    plates = plates_from_data(markers, grf)
+
+    # Walking axis: the horizontal axis with the largest net heel travel
+    travel = np.abs(shared["heels"][-1] - shared["heels"][0]).sum(axis=0)
+    travel[VERTICAL] = -1.0
+    ap_axis = int(np.argmax(travel))
+
+    votes = {
+        "cop": vote_cop(plates),
+        "acc": vote_acc(shared),
+        "swing": vote_swing(shared, first_contact(grf, plates), ap_axis),
+    }
+    result = combine(votes)
+    result["votes"] = {m: {"leg": v[0], "strength": round(v[1], 3), **v[2]} for m, v in votes.items()}
+    return result
+
+
+def ensemble_leg(trc_file: PathLike, mot_file: PathLike) -> dict:
+    """Voted first leg for one trial; parses each file once."""
+    return ensemble_from_data(read_trc(trc_file), read_storage(mot_file))
+
+
+# ---------------------------------------------------------------------------
+# Per-trial worker
+# ---------------------------------------------------------------------------
+
+def ensemble_trial(args: TrialInputs) -> dict:
+    """Flat summary row for one trial (status 'ok' or 'failed')."""
+    subj_dir, trial, trc_file, mot_file = args
+    row = {"subject": Path(subj_dir).name, "trial": trial, "trc": trc_file, "mot": mot_file,
+           "status": "", "error": ""}
+    try:
+        result = ensemble_leg(trc_file, mot_file)
+        row["leg"] = SIDE_NAMES.get(result["leg"], "Uncertain")
+        row["confidence"] = result["confidence"]
+        row["label"] = result["label"]
+        for method in METHODS:
+            vote = result["votes"][method]
+            row[f"{method}_leg"] = vote["leg"] or ""
+            row[f"{method}_strength"] = vote["strength"]
+        row["status"] = "ok"
+    except Exception as exc:
+        row["status"] = "failed"
+        row["error"] = str(exc)
+    return row
+
+
+def ensemble_all(
+    trials: List[TrialInputs],
+    cores: int = 1,
+    logger: Optional[logging.Logger] = None,
+) -> List[dict]:
+    """Ensemble every trial, in a spawn-context process pool when cores > 1."""
+    return run_jobs(ensemble_trial, trials, cores, _log_row, logger or logging.getLogger("leg_ensemble"),
+                    key=lambda r: (r["subject"], r["trial"]))
+
+
+def _log_row(logger: logging.Logger, done: int, total: int, row: dict) -> None:
+    if row["status"] == "failed":
+        logger.error("[%d/%d] %s %s  FAILED: %s", done, total, row["subject"], row["trial"], row["error"])
+    else:
+        logger.info("[%d/%d] %s %s  %s (%s, %.2f)", done, total, row["subject"], row["trial"],
+                    row["leg"], row["label"], row["confidence"])
+
+
+def write_rows(rows: List[dict], path: Path) -> None:
+    fields = ["subject", "trial", "leg", "label", "confidence"]
+    fields += [f"{m}_{k}" for m in METHODS for k in ("leg", "strength")]
+    fields += ["status", "error", "trc", "mot"]
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# ---------------------------------------------------------------------------
+# Plotting (opt-in, after the batch)
+# ---------------------------------------------------------------------------
+
+def plot_heel_acceleration(trc_file: PathLike, out_png: PathLike, title: str = "") -> None:
+    """Heel vertical acceleration with the detected movement starts."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    shared = prepare(read_trc(trc_file))
+    acc = shared["heel_acc"][:, :, VERTICAL]
+    starts = first_sustained(np.abs(acc) > ACC_THRESHOLD, 1)
+    time = shared["time"]
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+    for i, (side, color) in enumerate((("l", "red"), ("r", "blue"))):
+        ax.plot(time, acc[:, i], color=color, label=f"{FOOT_MARKERS[side][0]} vertical accel")
+        if starts[i] >= 0:
+            ax.axvline(time[starts[i]], color=color, linestyle="--", alpha=0.5,
+                       label=f"{side.upper()}-Start")
+    ax.set_title(title or "Heel Marker Vertical Acceleration")
+    ax.set_ylabel("Acceleration ($m/s^2$)")
+    ax.set_xlabel("Time (s)")
+    ax.legend()
+    fig.savefig(out_png)
+    plt.close(fig)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Ensemble first-leg detection (COP, heel acceleration, swing voting)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--cores", type=int, default=0, help="Worker processes (default: physical_cores - 1)")
+    parser.add_argument("--out", default="", help="Result CSV (default: <root>/leg_ensemble.csv)")
+    parser.add_argument("--plot-dir", default="", help="Also save a heel-acceleration PNG per trial here")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from file_inventory import FileInventory
+    from pipeline_cli import physical_core_count, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()] or None
+    trials = discover_trials(root_dir, subjects, FileInventory.open(root_dir, logger=logger))
+    if not trials:
+        logger.error("No TRC / GRF trial pairs found under %s", root_dir)
+        sys.exit(1)
+
+    cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+    t0 = time.monotonic()
+    rows = ensemble_all(trials, cores=cores, logger=logger)
+    out_path = Path(args.out or root_dir / "leg_ensemble.csv")
+    write_rows(rows, out_path)
+    logger.info("%d trial(s) written to %s in %.1f s", len(rows), out_path, time.monotonic() - t0)
+
+    if args.plot_dir:
+        plot_dir = Path(args.plot_dir)
+        plot_dir.mkdir(parents=True, exist_ok=True)
+        for row in rows:
+            if row["status"] == "ok":
+                png = plot_dir / f"heel_acceleration_{row['subject']}_{row['trial']}.png"
+                plot_heel_acceleration(row["trc"], png, title=f"{row['subject']} {row['trial']}")
+        logger.info("Plots written to %s", plot_dir)
+
+    failed = [r for r in rows if r["status"] == "failed"]
+    if failed:
+        logger.error("Failed trials: %s", [f"{r['subject']}/{r['trial']}" for r in failed])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # Required on Windows with frozen/spawn executables
+    main()
@@ -0,0 +1,300 @@
+"""
+Compile a template_map.json into an explicit per-subject job manifest.
+
+The template describes one subject (normally S01); every other subject is
+derived from it by swapping the subject id in its paths.  Doing that inside
+every worker with a global str.replace("01", ...) also rewrote any other
+"01" (dataset folders like 2001, dates), so it now happens once, here, in
+the parent:
+
+  * only the part of a path below root_dir is rewritten, never root_dir itself
+  * the id is replaced only where it is not part of a longer number
+    (S01 -> S03 and subject01 -> subject03, but 2001 and 0105 stay)
+  * the template subject is read from the template's "subject" entry
+    (falls back to "01")
+
+The manifest keeps the template's shape per subject, so engines and
+ScratchStage.stage_template read it as they read an adapted template, plus
+the subject id, subject folder, trial names and each trial's result folders:
+
+    {"version": 1, "root_dir": "...", "template_subject": "01",
+     "subjects": [{"subject": "03", "subj_dir": ".../S03", "model": "...",
+                   "static_trc": "...", "scale_xml": "...",
+                   "details": {"mass": 70.1, "height": 1.75, "age_group": "young", ...},
+                   "mapped_trials": [{"trial": "stw1", "trial_trc": "...",
+                                      "ik_xml": "...", ..., "ik_results": "..."}]}]}
+
+Workers receive one subject entry each; nothing is re-loaded or re-adapted
+in child processes.  "details" is the subject's record in the subject
+registry (empty when the subject is not in 'Subject Details.csv').
+
+Usage:
+    python manifest.py --template path/to/template.json [--subjects 01,02] [--trials stw1]
+                       [--out manifest.json]
+"""
+
+import re
+import sys
+import json
+import argparse
+from pathlib import Path, PureWindowsPath
+from typing import Any, Dict, List, Optional
+
+from results_catalog import ARTIFACT_DIRS
+from subject_registry import default_registry
+
+
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST_NAME = "manifest.json"
+
+# Subject id of the template when it has no usable "subject" entry
+DEFAULT_TEMPLATE_SUBJECT = "01"
+
+SUBJECT_FIELDS = ("model", "static_trc", "scale_xml")
+TRIAL_FIELDS = ("trial_trc", "trial_mot", "ik_xml", "id_xml", "so_xml", "grf_xml")
+
+
+# ---------------------------------------------------------------------------
+# Subject substitution
+# ---------------------------------------------------------------------------
+
+def template_subject(template: Dict[str, Any]) -> str:
+    """Subject id the template was written for, from its "subject" folder (S01 -> '01')."""
+    name = PureWindowsPath(template.get("subject") or "").name
+    match = re.fullmatch(r"[Ss](\d+)", name)
+    return match.group(1) if match else DEFAULT_TEMPLATE_SUBJECT
+
+
+def _is_absolute(path_str: str) -> bool:
+    return Path(path_str).is_absolute() or PureWindowsPath(path_str).is_absolute()
+
+
+def _under_root(path_str: str, root_dir: str) -> int:
+    """Length of the root_dir prefix of path_str, or 0 when it is not below root_dir."""
+    norm = lambda p: p.replace("\\", "/").rstrip("/").lower()
+    root = norm(root_dir)
+    if root and norm(path_str[:len(root_dir)]) == root and path_str[len(root_dir):len(root_dir) + 1] in ("/", "\\"):
+        return len(root_dir)
+    return 0
+
+
+def substitute_subject(path_str: str, root_dir: str, old: str, new: str) -> str:
+    """
+    Swap subject id `old` for `new` in a path, leaving root_dir and longer
+    numbers that merely contain `old` untouched.
+    """
+    if not path_str or old == new:
+        return path_str
+    keep = _under_root(path_str, root_dir) if root_dir else 0
+    pattern = rf"(?<!\d){re.escape(old)}(?!\d)"
+    return path_str[:keep] + re.sub(pattern, new, path_str[keep:])
+
+
+def adapt_template(template: Dict[str, Any], subject_num: str) -> Dict[str, Any]:
+    """The template with every path rewritten for one subject (same shape as the input)."""
+    root_dir = template.get("root_dir") or ""
+    old = template_subject(template)
+    sub = lambda v: substitute_subject(v, root_dir, old, subject_num) if isinstance(v, str) else v
+
+    adapted: Dict[str, Any] = {}
+    for key, value in template.items():
+        if key == "root_dir":
+            adapted[key] = value
+        elif isinstance(value, list):
+            adapted[key] = [
+                {k: sub(v) for k, v in item.items()} if isinstance(item, dict) else item
+                for item in value
+            ]
+        else:
+            adapted[key] = sub(value)
+    return adapted
+
+
+# ---------------------------------------------------------------------------
+# Compile
+# ---------------------------------------------------------------------------
+
+def _absolute(path_str: Optional[str], root_dir: Path) -> str:
+    if not path_str:
+        return ""
+    return path_str if _is_absolute(path_str) else str(root_dir / path_str)
+
+
+def compile_subject(
+    template: Dict[str, Any],
+    subject_num: str,
+    selected_trials: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Manifest entry for one subject: absolute inputs/outputs of every selected trial."""
+    root_dir = Path(template.get("root_dir") or "")
+    adapted = adapt_template(template, subject_num)
+    subj_dir = root_dir / f"S{subject_num}"
+
+    entry: Dict[str, Any] = {"subject": subject_num, "subj_dir": str(subj_dir)}
+    for key in SUBJECT_FIELDS:
+        entry[key] = _absolute(adapted.get(key), root_dir)
+    entry["details"] = dict(default_registry().get(subject_num) or {})
+
+    trials = []
+    for raw in adapted.get("mapped_trials", []):
+        trial = {key: _absolute(raw.get(key), root_dir) for key in TRIAL_FIELDS}
+        trial["trial"] = PureWindowsPath(trial["trial_trc"]).stem   # either separator
+        if selected_trials and trial["trial"] not in selected_trials:
+            continue
+        for stage, rel in ARTIFACT_DIRS.items():
+            trial[f"{stage}_results"] = str(subj_dir / rel)
+        trials.append(trial)
+    entry["mapped_trials"] = trials
+    return entry
+
+
+def validate_manifest(manifest: Dict[str, Any]) -> List[str]:
+    """Problems that would make a job ill-defined; an empty list means valid."""
+    problems = []
+    seen_subjects = set()
+    for entry in manifest.get("subjects", []):
+        subject = entry.get("subject", "")
+        if subject in seen_subjects:
+            problems.append(f"S{subject}: listed twice")
+        seen_subjects.add(subject)
+
+        names = set()
+        for trial in entry.get("mapped_trials", []):
+            name = trial.get("trial", "")
+            if not trial.get("trial_trc"):
+                problems.append(f"S{subject}: trial without trial_trc")
+            elif name in names:
+                problems.append(f"S{subject}: trial {name} listed twice")
+            names.add(name)
+            for key in TRIAL_FIELDS:
+                if trial.get(key) and not _is_absolute(trial[key]):
+                    problems.append(f"S{subject} {name}: {key} is not absolute: {trial[key]}")
+    return problems
+
+
+def compile_manifest(
+    template: Dict[str, Any],
+    subjects: List[str],
+    selected_trials: Optional[List[str]] = None,
+    trials_by_subject: Optional[Dict[str, List[str]]] = None,
+) -> Dict[str, Any]:
+    """
+    Compile the template for every subject.
+
+    `selected_trials` applies to every subject; `trials_by_subject` (as
+    picked per subject in the GUI) overrides it for the subjects it names.
+
+    Raises:
+        ValueError: the template has no root_dir or the result fails validation
+    """
+    if not template.get("root_dir"):
+        raise ValueError("Template JSON missing 'root_dir' key")
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "root_dir": template["root_dir"],
+        "template_subject": template_subject(template),
+        "subjects": [
+            compile_subject(template, s, (trials_by_subject or {}).get(s) or selected_trials)
+            for s in subjects
+        ],
+    }
+    problems = validate_manifest(manifest)
+    if problems:
+        raise ValueError("Invalid manifest:\n  " + "\n  ".join(problems))
+    return manifest
+
+
+def load_template(template_path: Path) -> Dict[str, Any]:
+    with open(template_path, "r") as fh:
+        return json.load(fh)
+
+
+def restrict_trials(entry: Dict[str, Any], trials: List[str]) -> Dict[str, Any]:
+    """A copy of a subject entry keeping only the named trials."""
+    kept = dict(entry)
+    kept["mapped_trials"] = [t for t in entry.get("mapped_trials", []) if t["trial"] in trials]
+    return kept
+
+
+def subject_entry(manifest: Dict[str, Any], subject_num: str) -> Optional[Dict[str, Any]]:
+    return next((e for e in manifest.get("subjects", []) if e["subject"] == subject_num), None)
+
+
+# ---------------------------------------------------------------------------
+# Persistence
+# ---------------------------------------------------------------------------
+
+def write_manifest(manifest: Dict[str, Any], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    """
+    Read a compiled manifest back.
+
+    Raises:
+        ValueError: unknown manifest version or failed validation
+    """
+    manifest = json.loads(Path(path).read_text(encoding="utf-8"))
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version: {manifest.get('version')}")
+    problems = validate_manifest(manifest)
+    if problems:
+        raise ValueError("Invalid manifest:\n  " + "\n  ".join(problems))
+    return manifest
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Compile a template JSON into a per-subject job manifest",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--template", required=True, help="Path to template JSON file")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--trials", default="", help="Comma-separated trial names (default: all)")
+    parser.add_argument("--out", default="", help=f"Manifest JSON (default: <root_dir>/{DEFAULT_MANIFEST_NAME})")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from pipeline_cli import discover_subjects, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    template_path = Path(args.template)
+    if not template_path.is_file():
+        logger.error("Template file not found: %s", template_path)
+        sys.exit(1)
+    template = load_template(template_path)
+    root_dir = Path(template.get("root_dir") or "")
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    subjects = ([s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()]
+                or discover_subjects(root_dir))
+    trials = [t.strip() for t in args.trials.split(",") if t.strip()] or None
+    try:
+        manifest = compile_manifest(template, subjects, trials)
+    except ValueError as exc:
+        logger.error("%s", exc)
+        sys.exit(1)
+
+    out_path = Path(args.out or root_dir / DEFAULT_MANIFEST_NAME)
+    write_manifest(manifest, out_path)
+    logger.info("%d subject(s), %d trial job(s) written to %s", len(manifest["subjects"]),
+                sum(len(e["mapped_trials"]) for e in manifest["subjects"]), out_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ Scans ONLY the first subject (01) interactively to learn the pattern,
 then applies that pattern to all other subjects by replacing subject numbers.
 
 Usage: python create_subjects_json_pattern.py /path/to/root_directory
+       python create_subjects_json_pattern.py --rules rules.json /path/to/root_directory
+           (headless: no prompts, writes a pipeline_cli manifest + template; see bulk_map.py)
 """
 
 import sys
@@ -14,6 +16,8 @@ import re
 from pathlib import Path
 from collections import defaultdict
 
+from file_inventory import FileInventory
+
 REQ_EXT = {".xml", ".trc", ".mot", ".sto"}
 OUTPUT = "subjects_trials.json"
 
@@ -34,8 +38,10 @@ def print_tree(root: Path, prefix="", max_depth=3, current_depth=0):
         pass
 
 
-def gather_files(directory: Path, extensions=REQ_EXT):
-    """Gather all files with specified extensions"""
+def gather_files(directory: Path, extensions=REQ_EXT, inventory=None):
+    """Gather all files with specified extensions (from the inventory when given)"""
+    if inventory is not None:
+        return [p for p in inventory.files(under=directory) if p.suffix.lower() in extensions]
     files = []
     for p in directory.rglob("*"):
         if p.is_file() and p.suffix.lower() in extensions:
@@ -203,7 +209,7 @@ def find_all_subjects(root_dir: Path, first_subject: Path):
     return sorted(subjects)
 
 
-def process_first_subject(subject_dir: Path, root_dir: Path):
+def process_first_subject(subject_dir: Path, root_dir: Path, inventory=None):
     """Process first subject interactively and learn the pattern"""
     print(f"\n{'='*60}")
     print(f"PROCESSING FIRST SUBJECT: {subject_dir.name}")
@@ -213,12 +219,12 @@ def process_first_subject(subject_dir: Path, root_dir: Path):
     print_tree(subject_dir)
     
     # Gather files
-    files = gather_files(subject_dir)
+    files = gather_files(subject_dir, inventory=inventory)
     xml_files = [p for p in files if p.suffix.lower() == '.xml']
     trc_files = [p for p in files if p.suffix.lower() == '.trc']
     
     # Find OSIM model in parent directory
-    osim_files = gather_files(root_dir, {".osim"})
+    osim_files = gather_files(root_dir, {".osim"}, inventory=inventory)
     osim_model = None
     if len(osim_files) == 1:
         osim_model = osim_files[0]
@@ -350,7 +356,7 @@ def replace_subject_number(path: Path, old_num: str, new_num: str):
     return None
 
 
-def apply_pattern_to_subject(template, subject_dir: Path, first_subject_dir: Path):
+def apply_pattern_to_subject(template, subject_dir: Path, first_subject_dir: Path, inventory=None):
     """Apply learned pattern to a new subject"""
     first_num = detect_subject_number(first_subject_dir.name)
     new_num = detect_subject_number(subject_dir.name)
@@ -362,7 +368,7 @@ def apply_pattern_to_subject(template, subject_dir: Path, first_subject_dir: Pat
         if path is None:
             return None
         new_path = replace_subject_number(path, first_num, new_num)
-        if new_path and new_path.exists():
+        if new_path and (inventory.exists(new_path) if inventory else new_path.exists()):
             return new_path
         return None
     
@@ -403,6 +409,15 @@ def apply_pattern_to_subject(template, subject_dir: Path, first_subject_dir: Pat
 
 
 def main():
+    if "--rules" in sys.argv[1:]:
+        # Headless bulk mode: rules file instead of prompts, pipeline_cli-ready output
+        from bulk_map import main as bulk_main
+        argv = sys.argv[1:]
+        i = argv.index("--rules")
+        rules = argv[i + 1] if i + 1 < len(argv) else ""
+        rest = argv[:i] + argv[i + 2:]
+        return bulk_main(["--rules", rules, "--root", rest[0] if rest else ""])
+
     if len(sys.argv) < 2:
         print("Usage: python create_subjects_json_pattern.py /path/to/root_directory")
         sys.exit(1)
@@ -422,8 +437,11 @@ def main():
         print("Error: No valid subject folder found.")
         sys.exit(1)
     
+    # One parallel, persisted listing of the dataset instead of rglob/exists per subject
+    inventory = FileInventory.open(root_dir)
+
     # Process first subject interactively
-    template = process_first_subject(first_subject, root_dir)
+    template = process_first_subject(first_subject, root_dir, inventory)
     
     # Find all subjects
     all_subjects = find_all_subjects(root_dir, first_subject)
@@ -461,7 +479,7 @@ def main():
             print("  (First subject - template)")
         else:
             # Apply pattern
-            result, error = apply_pattern_to_subject(template, subject_dir, first_subject)
+            result, error = apply_pattern_to_subject(template, subject_dir, first_subject, inventory)
             if result:
                 subject_data = {
                     "subject": str(result["subject_dir"]),
@@ -0,0 +1,367 @@
+"""
+Marker-error QA over the IK outputs of the whole cohort.
+
+IK runs with report_errors / report_marker_locations (setup_files/ik_setup.py)
+and leaves two files per trial in Sxx/IK/results_stw, which nothing read:
+
+    <Sxx>_<trial>_ik_marker_errors.sto            time, total_squared_error,
+                                                   marker_error_RMS, marker_error_max
+    <Sxx>_<trial>_ik_model_marker_locations.sto   time, <marker>_tx/_ty/_tz (ground, m)
+
+Per trial both are parsed with the pandas-backed readers of opensim_io
+(.gz/.zst included) and the model marker locations are compared with the
+experimental TRC markers at the same frames:
+
+  * per marker: RMS and max distance over the trial
+  * per frame: total squared error, RMS and max (from the IK errors file;
+    derived from the per-marker distances when it is missing)
+  * frames whose max error exceeds --frame-max or RMS exceeds --frame-rms,
+    reported as runs (run_length.find_runs)
+
+The cohort table (one row per trial, <marker>_rms / <marker>_max columns) is
+written to marker_error_matrix.csv.  marker_error_outliers.csv lists the
+flagged frame runs and the flagged trials: mean RMS above --trial-rms, or a
+trial RMS / marker RMS whose robust z-score (median / MAD over the cohort)
+exceeds --z (cohorts of MIN_COHORT trials or more).  Trials are processed
+in a spawn-context process pool.
+
+Usage:
+    python marker_errors.py --root D:/RESEARCH/STW_dataset/Extracted [--subjects 01,02] [--cores N]
+                            [--out-dir DIR] [--frame-max 0.04] [--frame-rms 0.02] [--trial-rms 0.02] [--z 3.5]
+"""
+
+import sys
+import csv
+import logging
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from batch_runner import run_jobs
+from cohort_store import trial_from_filename
+from leg_assignment import discover_trials
+from opensim_io import PathLike, plain_name, read_storage, read_trc
+from results_catalog import ARTIFACT_DIRS
+from run_length import find_runs
+
+
+ERRORS_SUFFIX = "_ik_marker_errors.sto"
+LOCATIONS_SUFFIX = "_ik_model_marker_locations.sto"
+
+MATRIX_NAME = "marker_error_matrix.csv"
+OUTLIERS_NAME = "marker_error_outliers.csv"
+
+# OpenSim IK guidance: max marker error under 2-4 cm, RMS under 2 cm (m)
+FRAME_MAX_LIMIT = 0.04
+FRAME_RMS_LIMIT = 0.02
+TRIAL_RMS_LIMIT = 0.02
+# Robust z-score (0.6745 * |x - median| / MAD) above which a trial is a cohort outlier
+OUTLIER_Z = 3.5
+# Fewer analysed trials than this and the cohort median / MAD are not trusted
+MIN_COHORT = 10
+
+TRC_UNIT_SCALE = {"mm": 1e-3, "cm": 1e-2, "m": 1.0}
+
+# (subject, trial, errors file, locations file, trc file); missing files are ""
+ErrorInputs = Tuple[str, str, str, str, str]
+
+OUTLIER_FIELDS = ["level", "subject", "trial", "start", "end", "frames", "metric", "value", "detail"]
+
+
+# ---------------------------------------------------------------------------
+# Discovery
+# ---------------------------------------------------------------------------
+
+def discover_outputs(
+    root_dir: Path,
+    subjects: Optional[List[str]] = None,
+    inventory=None,
+) -> List[ErrorInputs]:
+    """
+    IK error / location files of every trial, paired with the trial's TRC.
+    A plain copy wins over a compressed one.  Listed from a
+    file_inventory.FileInventory when one is given.
+    """
+    trcs = {(Path(s).name, t): trc for s, t, trc, _ in discover_trials(root_dir, subjects, inventory)}
+    found: Dict[Tuple[str, str], Dict[str, str]] = {}
+    for suffix, key in ((ERRORS_SUFFIX, "errors"), (LOCATIONS_SUFFIX, "locations")):
+        pattern = f"S*/{ARTIFACT_DIRS['ik']}/*{suffix}*"
+        listed = inventory.glob(pattern) if inventory else sorted(root_dir.glob(pattern))
+        for path in listed:
+            name = plain_name(path).name
+            subject = path.parents[2].name
+            trial = trial_from_filename(name)
+            if not name.endswith(suffix) or not trial:
+                continue
+            if subjects and subject.replace("S", "") not in subjects:
+                continue
+            slot = found.setdefault((subject, trial), {})
+            if key not in slot or plain_name(slot[key]) != Path(slot[key]):
+                slot[key] = str(path)
+    return [
+        (subject, trial, f.get("errors", ""), f.get("locations", ""), trcs.get((subject, trial), ""))
+        for (subject, trial), f in sorted(found.items(), key=lambda kv: (kv[0][0], int(kv[0][1][3:])))
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Per-trial analysis
+# ---------------------------------------------------------------------------
+
+def marker_distances(locations_file: PathLike, trc_file: PathLike) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    (markers, time, (frames, markers) distances in m) between the model
+    marker locations IK reported and the experimental TRC markers.
+    Markers missing from the TRC are left out; gaps in the TRC give NaN.
+    """
+    loc = read_storage(locations_file)
+    markers = [c[:-3] for c in loc.columns if c.endswith("_tx")]
+    trc = read_trc(trc_file)
+    markers = [m for m in markers if m in trc.labels]
+    model = loc.block([f"{m}_{a}" for m in markers for a in ("tx", "ty", "tz")]).reshape(len(loc.time), len(markers), 3)
+
+    # Nearest TRC frame of every IK frame
+    idx = np.clip(np.searchsorted(trc.time, loc.time), 1, len(trc.time) - 1)
+    idx -= (loc.time - trc.time[idx - 1]) < (trc.time[idx] - loc.time)
+    scale = TRC_UNIT_SCALE.get(trc.units.strip().lower(), 1.0)
+    experimental = trc.xyz[idx][:, [trc.labels.index(m) for m in markers], :] * scale
+    return markers, loc.time, np.linalg.norm(model - experimental, axis=2)
+
+
+def frame_errors(errors_file: PathLike) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """(time, {total_sq, rms, max}) per frame from an IK marker errors file."""
+    sto = read_storage(errors_file)
+    return sto.time, {
+        "total_sq": sto.column("total_squared_error"),
+        "rms": sto.column("marker_error_RMS"),
+        "max": sto.column("marker_error_max"),
+    }
+
+
+def flagged_runs(time: np.ndarray, frames: Dict[str, np.ndarray], max_limit: float, rms_limit: float) -> List[dict]:
+    """Runs of frames whose max error or RMS exceeds its limit."""
+    mask = (frames["max"] > max_limit) | (frames["rms"] > rms_limit)
+    starts, ends, _ = find_runs(mask)
+    return [
+        {"start": float(time[s]), "end": float(time[e - 1]), "frames": int(e - s),
+         "peak_max": float(np.max(frames["max"][s:e])), "peak_rms": float(np.max(frames["rms"][s:e]))}
+        for s, e in zip(starts, ends)
+    ]
+
+
+def analyse_trial(args: Tuple[ErrorInputs, float, float]) -> dict:
+    """Summary row for one trial (status 'ok' or 'failed')."""
+    (subject, trial, errors_file, locations_file, trc_file), max_limit, rms_limit = args
+    row = {"subject": subject, "trial": trial, "status": "", "error": "",
+           "markers": {}, "runs": []}
+    try:
+        per_marker = None
+        if locations_file and trc_file:
+            markers, time_, dist = marker_distances(locations_file, trc_file)
+            with np.errstate(invalid="ignore"):
+                row["markers"] = {
+                    m: (float(np.sqrt(np.nanmean(dist[:, i] ** 2))), float(np.nanmax(dist[:, i])))
+                    for i, m in enumerate(markers) if np.isfinite(dist[:, i]).any()
+                }
+                per_marker = {
+                    "total_sq": np.nansum(dist ** 2, axis=1),
+                    "rms": np.sqrt(np.nanmean(dist ** 2, axis=1)),
+                    "max": np.nanmax(dist, axis=1),
+                }
+        if errors_file:
+            time_, frames = frame_errors(errors_file)
+        elif per_marker is not None:
+            frames = per_marker
+        else:
+            raise ValueError("no marker errors file, and no marker locations with a TRC")
+
+        row.update({
+            "frames": len(time_),
+            "rms_mean": float(np.mean(frames["rms"])),
+            "rms_max": float(np.max(frames["rms"])),
+            "max_error": float(np.max(frames["max"])),
+            "total_sq_peak": float(np.max(frames["total_sq"])),
+        })
+        row["runs"] = flagged_runs(time_, frames, max_limit, rms_limit)
+        row["flagged_frames"] = sum(r["frames"] for r in row["runs"])
+        row["status"] = "ok"
+    except Exception as exc:
+        row["status"] = "failed"
+        row["error"] = str(exc)
+    return row
+
+
+def analyse_all(
+    trials: List[ErrorInputs],
+    cores: int = 1,
+    max_limit: float = FRAME_MAX_LIMIT,
+    rms_limit: float = FRAME_RMS_LIMIT,
+    logger: Optional[logging.Logger] = None,
+) -> List[dict]:
+    """Analyse every trial, in a spawn-context process pool when cores > 1."""
+    jobs = [(t, max_limit, rms_limit) for t in trials]
+    return run_jobs(analyse_trial, jobs, cores, _log_row, logger or logging.getLogger("marker_errors"),
+                    key=lambda r: (r["subject"], int(r["trial"][3:])), chunksize=4)
+
+
+def _log_row(logger: logging.Logger, done: int, total: int, row: dict) -> None:
+    if row["status"] == "failed":
+        logger.error("[%d/%d] %s %s  FAILED: %s", done, total, row["subject"], row["trial"], row["error"])
+    else:
+        logger.debug("[%d/%d] %s %s  RMS %.4f m, max %.4f m, %d flagged frame(s)", done, total,
+                     row["subject"], row["trial"], row["rms_mean"], row["max_error"], row["flagged_frames"])
+
+
+# ---------------------------------------------------------------------------
+# Cohort
+# ---------------------------------------------------------------------------
+
+def robust_z(values: np.ndarray) -> np.ndarray:
+    """0.6745 * (x - median) / MAD, NaN-aware; zeros when the MAD is 0 or the cohort is small."""
+    if np.count_nonzero(np.isfinite(values)) < MIN_COHORT:
+        return np.zeros_like(values)
+    median = np.nanmedian(values)
+    mad = np.nanmedian(np.abs(values - median))
+    if not np.isfinite(mad) or mad == 0:
+        return np.zeros_like(values)
+    return 0.6745 * (values - median) / mad
+
+
+def error_matrix(rows: List[dict]) -> Tuple[List[str], List[dict]]:
+    """(marker order, one flat row per analysed trial with <marker>_rms / <marker>_max)."""
+    ok = [r for r in rows if r["status"] == "ok"]
+    markers: List[str] = []
+    for r in ok:
+        markers += [m for m in r["markers"] if m not in markers]
+    flat = []
+    for r in ok:
+        entry = {k: r[k] for k in ("subject", "trial", "frames", "rms_mean", "rms_max",
+                                   "max_error", "total_sq_peak", "flagged_frames")}
+        for m in markers:
+            rms, peak = r["markers"].get(m, (float("nan"), float("nan")))
+            entry[f"{m}_rms"], entry[f"{m}_max"] = rms, peak
+        flat.append(entry)
+    return markers, flat
+
+
+def find_outliers(
+    rows: List[dict],
+    trial_rms: float = TRIAL_RMS_LIMIT,
+    z_limit: float = OUTLIER_Z,
+) -> List[dict]:
+    """Flagged frame runs plus trials over the RMS limit or far from the cohort."""
+    markers, flat = error_matrix(rows)
+    outliers = []
+    for r in rows:
+        for run in r["runs"]:
+            outliers.append({"level": "frames", "subject": r["subject"], "trial": r["trial"],
+                             "start": run["start"], "end": run["end"], "frames": run["frames"],
+                             "metric": "max_error", "value": run["peak_max"],
+                             "detail": f"peak RMS {run['peak_rms']:.4f}"})
+    if not flat:
+        return outliers
+
+    def trial_row(entry, metric, value, detail):
+        return {"level": "trial", "subject": entry["subject"], "trial": entry["trial"], "start": "",
+                "end": "", "frames": entry["frames"], "metric": metric, "value": value, "detail": detail}
+
+    rms = np.array([e["rms_mean"] for e in flat])
+    for entry, z in zip(flat, robust_z(rms)):
+        if entry["rms_mean"] > trial_rms:
+            outliers.append(trial_row(entry, "rms_mean", entry["rms_mean"], f"above {trial_rms:g} m"))
+        elif z > z_limit:
+            outliers.append(trial_row(entry, "rms_mean", entry["rms_mean"], f"cohort z {z:.1f}"))
+    for m in markers:
+        values = np.array([e[f"{m}_rms"] for e in flat])
+        for entry, z in zip(flat, robust_z(values)):
+            if z > z_limit:
+                outliers.append(trial_row(entry, f"{m}_rms", entry[f"{m}_rms"], f"cohort z {z:.1f}"))
+    return outliers
+
+
+def write_matrix(rows: List[dict], path: Path) -> int:
+    markers, flat = error_matrix(rows)
+    fields = ["subject", "trial", "frames", "rms_mean", "rms_max", "max_error", "total_sq_peak", "flagged_frames"]
+    fields += [f"{m}_{k}" for m in markers for k in ("rms", "max")]
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(flat)
+    return len(flat)
+
+
+def write_outliers(outliers: List[dict], path: Path) -> None:
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=OUTLIER_FIELDS)
+        writer.writeheader()
+        writer.writerows(outliers)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Per-marker / per-frame IK marker-error QA over the cohort",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--cores", type=int, default=0, help="Worker processes (default: physical_cores - 1)")
+    parser.add_argument("--out-dir", default="", help="Directory for the matrix and outlier CSVs (default: root)")
+    parser.add_argument("--frame-max", type=float, default=FRAME_MAX_LIMIT, help="Flag frames above this max error (m)")
+    parser.add_argument("--frame-rms", type=float, default=FRAME_RMS_LIMIT, help="Flag frames above this RMS (m)")
+    parser.add_argument("--trial-rms", type=float, default=TRIAL_RMS_LIMIT, help="Flag trials above this mean RMS (m)")
+    parser.add_argument("--z", type=float, default=OUTLIER_Z, help="Robust z-score for cohort outliers")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from file_inventory import FileInventory
+    from pipeline_cli import physical_core_count, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()] or None
+    trials = discover_outputs(root_dir, subjects, FileInventory.open(root_dir, logger=logger))
+    if not trials:
+        logger.error("No IK marker error / location files found under %s", root_dir)
+        sys.exit(1)
+
+    cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+    t0 = time.monotonic()
+    rows = analyse_all(trials, cores=cores, max_limit=args.frame_max, rms_limit=args.frame_rms, logger=logger)
+    outliers = find_outliers(rows, trial_rms=args.trial_rms, z_limit=args.z)
+
+    out_dir = Path(args.out_dir or root_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n = write_matrix(rows, out_dir / MATRIX_NAME)
+    write_outliers(outliers, out_dir / OUTLIERS_NAME)
+    flagged = {(o["subject"], o["trial"]) for o in outliers}
+    logger.info("%d trial(s) analysed in %.1f s; %d with flags, %d outlier row(s)",
+                n, time.monotonic() - t0, len(flagged), len(outliers))
+    logger.info("Matrix: %s", out_dir / MATRIX_NAME)
+    logger.info("Outliers: %s", out_dir / OUTLIERS_NAME)
+
+    failed = [r for r in rows if r["status"] == "failed"]
+    if failed:
+        logger.error("Failed trials: %s", [f"{r['subject']}/{r['trial']}" for r in failed])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # Required on Windows with frozen/spawn executables
+    main()
@@ -0,0 +1,537 @@
+"""
+IK marker-weight sweep: run IK over a grid (or random sample) of IKTaskSet
+weights and collect marker errors per configuration in one table.
+
+The weights in setup_files/ik_setup.py (ASIS 100, PSIS 50, thigh clusters
+10, ...) were tuned by hand, one edited setup and one IK re-run per
+configuration, and the heatmaps in graph/markerweights_graph drawn from the
+collected logs.  Here a sweep varies the weights of marker groups
+(WEIGHT_GROUPS) around the trial's own IK setup and solves every
+configuration x trial in a spawn-context process pool.  Each worker keeps the
+loaded model and the parsed marker data of the trials it has seen
+(WORKER_CACHE_SIZE), so a configuration only costs a new solver and the
+tracking loop, not a new IKTool, model load and TRC parse.
+
+Configurations:
+    --grid asis=50,100,200 --grid psis=25,50      every combination (3 x 2)
+    --sample thigh=1:50 --samples 40 --seed 1     uniform random draws
+
+Per configuration and trial the table holds the frame count, the mean and
+peak of the per-frame marker RMS and the largest single marker error (m),
+the same quantities IK writes to *_ik_marker_errors.sto.  Heatmaps are drawn
+from the table, for a pair of groups, showing the best configuration of each
+cell averaged over the swept trials (opt-in, after the batch).
+
+Usage:
+    python marker_weight_sweep.py --template path/to/template.json --subjects 01,02 --trials stw1
+                                  --grid asis=50,100,200 --grid psis=25,50,100 [--cores N]
+                                  [--out marker_weight_sweep.csv] [--plot-dir DIR] [--heatmap asis,psis]
+    python marker_weight_sweep.py --manifest manifest.json --sample thigh=1:50 --samples 40 --seed 1
+    python marker_weight_sweep.py --from-table marker_weight_sweep.csv --plot-dir DIR
+"""
+
+import sys
+import csv
+import math
+import random
+import logging
+import argparse
+import itertools
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from batch_runner import run_jobs
+from opensim_io import PathLike, plain_text
+from setup_generator import render_setup
+
+
+# Marker groups whose IKMarkerTask weights are swept together
+WEIGHT_GROUPS: Dict[str, Tuple[str, ...]] = {
+    "asis": ("RASIS", "LASIS"),
+    "psis": ("RPSIS", "LPSIS"),
+    "thigh": ("RTH1", "RTH2", "RTH3", "RTH4", "LTH1", "LTH2", "LTH3", "LTH4"),
+    "knee": ("RFLE", "LFLE"),
+    "shank": ("RSK1", "RSK2", "RSK3", "RSK4", "LSK1", "LSK2", "LSK3", "LSK4"),
+    "ankle": ("RFAL", "LFAL"),
+    "heel": ("RFCC", "LFCC"),
+    "toe": ("RFMT1", "RFMT2", "RFMT5", "LFMT1", "LFMT2", "LFMT5"),
+}
+
+# Models / marker references kept per worker process (most recently used)
+WORKER_CACHE_SIZE = 4
+
+# Solver settings of the IK setup template
+IK_ACCURACY = 1e-5
+IK_CONSTRAINT_WEIGHT = float("inf")
+
+DEFAULT_SWEEP_NAME = "marker_weight_sweep.csv"
+HEATMAP_PREFIX = "marker_weights_heatmaps"
+
+SweepJob = Tuple[int, Dict[str, float], Dict[str, Any]]
+
+
+# ---------------------------------------------------------------------------
+# Weights
+# ---------------------------------------------------------------------------
+
+def task_weights(ik_xml_text: str) -> Dict[str, float]:
+    """{marker: weight} of the IKMarkerTasks an IK setup applies."""
+    root = ET.fromstring(ik_xml_text.encode("utf-8"))
+    weights = {}
+    for task in root.iter("IKMarkerTask"):
+        if (task.findtext("apply") or "true").strip().lower() == "true":
+            weights[task.get("name", "")] = float(task.findtext("weight") or 0.0)
+    return weights
+
+
+def apply_config(base: Dict[str, float], config: Dict[str, float]) -> Dict[str, float]:
+    """Base task weights with every marker of each configured group overridden."""
+    weights = dict(base)
+    for group, value in config.items():
+        for marker in WEIGHT_GROUPS[group]:
+            if marker in weights:
+                weights[marker] = value
+    return weights
+
+
+def grid_configs(axes: Dict[str, Sequence[float]]) -> List[Dict[str, float]]:
+    """Every combination of the listed group weights."""
+    groups = list(axes)
+    return [dict(zip(groups, values)) for values in itertools.product(*(axes[g] for g in groups))]
+
+
+def random_configs(
+    ranges: Dict[str, Tuple[float, float]],
+    n: int,
+    seed: Optional[int] = None,
+) -> List[Dict[str, float]]:
+    """n configurations drawn uniformly from each group's (low, high) range."""
+    rng = random.Random(seed)
+    return [{g: round(rng.uniform(lo, hi), 3) for g, (lo, hi) in ranges.items()} for _ in range(n)]
+
+
+def parse_axis(spec: str) -> Tuple[str, str]:
+    """
+    'asis=50,100' -> ('asis', '50,100').
+
+    Raises:
+        ValueError: malformed spec or unknown group
+    """
+    group, sep, values = spec.partition("=")
+    group = group.strip().lower()
+    if not sep or not values.strip():
+        raise ValueError(f"Expected group=values, got: {spec}")
+    if group not in WEIGHT_GROUPS:
+        raise ValueError(f"Unknown marker group '{group}' (known: {', '.join(WEIGHT_GROUPS)})")
+    return group, values.strip()
+
+
+def build_configs(
+    grid: Sequence[str],
+    sample: Sequence[str],
+    samples: int = 0,
+    seed: Optional[int] = None,
+) -> List[Dict[str, float]]:
+    """
+    Configurations from --grid / --sample specs; sampled groups are drawn
+    for every grid point when both are given.
+
+    Raises:
+        ValueError: malformed spec, a group given twice, or nothing to sweep
+    """
+    axes: Dict[str, List[float]] = {}
+    ranges: Dict[str, Tuple[float, float]] = {}
+    for spec in grid:
+        group, values = parse_axis(spec)
+        if group in axes:
+            raise ValueError(f"Group '{group}' given twice")
+        axes[group] = [float(v) for v in values.split(",") if v.strip()]
+    for spec in sample:
+        group, values = parse_axis(spec)
+        if group in axes or group in ranges:
+            raise ValueError(f"Group '{group}' given twice")
+        lo, sep, hi = values.partition(":")
+        if not sep:
+            raise ValueError(f"Expected group=low:high, got: {spec}")
+        ranges[group] = (float(lo), float(hi))
+    if ranges and samples < 1:
+        raise ValueError("--sample needs --samples N")
+    if not axes and not ranges:
+        raise ValueError("Nothing to sweep: give --grid and/or --sample")
+
+    points = grid_configs(axes) if axes else [{}]
+    if not ranges:
+        return points
+    draws = random_configs(ranges, samples, seed)
+    return [{**p, **d} for p in points for d in draws]
+
+
+# ---------------------------------------------------------------------------
+# Jobs
+# ---------------------------------------------------------------------------
+
+def scaled_model(entry: Dict[str, Any]) -> str:
+    """The scaled model the scale setup writes, when it exists; else the generic model."""
+    scale_xml = Path(entry.get("scale_xml") or "")
+    if scale_xml.is_file():
+        name = (ET.parse(str(scale_xml)).getroot().findtext(".//MarkerPlacer/output_model_file") or "").strip()
+        if name and name != "Unassigned" and (scale_xml.parent / name).is_file():
+            return str(scale_xml.parent / name)
+    return entry.get("model", "")
+
+
+def base_weights(entry: Dict[str, Any], trial: Dict[str, Any], model_file: str) -> Dict[str, float]:
+    """Task weights of the trial's IK setup (rendered from the template when not written yet)."""
+    ik_xml = Path(trial.get("ik_xml") or "")
+    if ik_xml.is_file():
+        return task_weights(ik_xml.read_text(encoding="utf-8"))
+    return task_weights(render_setup("ik", entry["subj_dir"], trial, model_file))
+
+
+def build_sweep_jobs(
+    manifest: Dict[str, Any],
+    configs: List[Dict[str, float]],
+    model_file: str = "",
+) -> List[SweepJob]:
+    """
+    (config index, weights, trial info) for every configuration x trial,
+    trial-major so consecutive jobs of a worker share its cached trial.
+    """
+    trials = []
+    for entry in manifest.get("subjects", []):
+        model = model_file or scaled_model(entry)
+        for trial in entry.get("mapped_trials", []):
+            info = {"subject": f"S{entry['subject']}", "trial": trial["trial"],
+                    "model": model, "trc": trial["trial_trc"]}
+            trials.append((info, base_weights(entry, trial, model)))
+    return [
+        (i, apply_config(base, config), info)
+        for info, base in trials
+        for i, config in enumerate(configs)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Per-job worker
+# ---------------------------------------------------------------------------
+
+_MODELS: "OrderedDict[str, tuple]" = OrderedDict()
+_MARKERS: "OrderedDict[str, Any]" = OrderedDict()
+
+
+def _cached(cache: OrderedDict, key: str, load):
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    cache[key] = value = load()
+    while len(cache) > WORKER_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def _load_model(model_file: str):
+    import opensim as osim  # type: ignore
+    osim.Logger.setLevelString("Warn")
+    model = osim.Model(model_file)
+    return model, model.initSystem()
+
+
+def _load_markers(trc_file: str):
+    import opensim as osim  # type: ignore
+    reference = osim.MarkersReference()
+    with plain_text(trc_file) as plain:
+        reference.initializeFromMarkersFile(plain, osim.SetMarkerWeights())
+    return reference
+
+
+def solve_errors(model, state, reference, weights: Dict[str, float]) -> np.ndarray:
+    """(frames, markers) marker errors (m) of one IK solve with the given task weights."""
+    import opensim as osim  # type: ignore
+
+    weight_set = osim.SetMarkerWeights()
+    for marker, weight in weights.items():
+        weight_set.cloneAndAppend(osim.MarkerWeight(marker, weight))
+    reference.setMarkerWeightSet(weight_set)
+
+    solver = osim.InverseKinematicsSolver(
+        model, reference, osim.SimTKArrayCoordinateReference(), IK_CONSTRAINT_WEIGHT)
+    solver.setAccuracy(IK_ACCURACY)
+
+    times = list(reference.getMarkerTable().getIndependentColumn())
+    state = osim.State(state)
+    state.setTime(times[0])
+    solver.assemble(state)
+    errors = []
+    for t in times:
+        state.setTime(t)
+        solver.track(state)
+        errors.append([solver.computeCurrentMarkerError(i) for i in range(solver.getNumMarkersInUse())])
+    return np.asarray(errors, dtype=float)
+
+
+def error_summary(errors: np.ndarray) -> Dict[str, float]:
+    """Frame count, mean / peak per-frame marker RMS and largest marker error."""
+    rms = np.sqrt(np.mean(errors ** 2, axis=1))
+    return {
+        "frames": int(errors.shape[0]),
+        "markers": int(errors.shape[1]),
+        "rms_mean": float(np.mean(rms)),
+        "rms_peak": float(np.max(rms)),
+        "max_error": float(np.max(errors)),
+    }
+
+
+def sweep_job(job: SweepJob) -> dict:
+    """Table row for one configuration x trial (status 'ok' or 'failed')."""
+    config, weights, info = job
+    row = {"config": config, "subject": info["subject"], "trial": info["trial"],
+           "status": "", "error": ""}
+    row.update({f"w_{g}": weights.get(markers[0], "") for g, markers in WEIGHT_GROUPS.items()})
+    t0 = time.monotonic()
+    try:
+        model, state = _cached(_MODELS, info["model"], lambda: _load_model(info["model"]))
+        reference = _cached(_MARKERS, info["trc"], lambda: _load_markers(info["trc"]))
+        row.update(error_summary(solve_errors(model, state, reference, weights)))
+        row["status"] = "ok"
+    except Exception as exc:
+        row["status"] = "failed"
+        row["error"] = str(exc)
+    row["seconds"] = round(time.monotonic() - t0, 3)
+    return row
+
+
+def sweep_all(
+    jobs: List[SweepJob],
+    cores: int = 1,
+    logger: Optional[logging.Logger] = None,
+) -> List[dict]:
+    """Solve every job, in a spawn-context process pool when cores > 1."""
+    # Contiguous chunks keep a worker on the same trial (and its cached data)
+    chunksize = max(1, math.ceil(len(jobs) / (max(1, min(cores, len(jobs))) * 4)))
+    return run_jobs(sweep_job, jobs, cores, _log_row, logger or logging.getLogger("marker_weight_sweep"),
+                    key=lambda r: (r["config"], r["subject"], r["trial"]), chunksize=chunksize)
+
+
+def _log_row(logger: logging.Logger, done: int, total: int, row: dict) -> None:
+    if row["status"] == "failed":
+        logger.error("[%d/%d] config %d %s %s  FAILED: %s", done, total, row["config"],
+                     row["subject"], row["trial"], row["error"])
+    else:
+        logger.info("[%d/%d] config %d %s %s  RMS %.4f m, max %.4f m (%.1f s)", done, total,
+                    row["config"], row["subject"], row["trial"], row["rms_mean"], row["max_error"],
+                    row["seconds"])
+
+
+# ---------------------------------------------------------------------------
+# Table
+# ---------------------------------------------------------------------------
+
+SWEEP_FIELDS = (
+    ["config", "subject", "trial"]
+    + [f"w_{g}" for g in WEIGHT_GROUPS]
+    + ["frames", "markers", "rms_mean", "rms_peak", "max_error", "seconds", "status", "error"]
+)
+
+
+def write_table(rows: List[dict], path: Path) -> None:
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=SWEEP_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def load_table(path: Path) -> List[dict]:
+    with open(path, "r", newline="") as fh:
+        return list(csv.DictReader(fh))
+
+
+def config_summary(rows: List[dict]) -> List[dict]:
+    """
+    One row per configuration: its weights, the mean RMS and the largest
+    marker error over its solved trials, sorted best (lowest RMS) first.
+    """
+    by_config: Dict[int, List[dict]] = {}
+    for row in rows:
+        if row["status"] == "ok":
+            by_config.setdefault(int(row["config"]), []).append(row)
+    summary = []
+    for config, group in by_config.items():
+        entry = {"config": config, "trials": len(group)}
+        entry.update({k: group[0][k] for k in group[0] if k.startswith("w_")})
+        entry["rms_mean"] = float(np.mean([float(r["rms_mean"]) for r in group]))
+        entry["max_error"] = float(np.max([float(r["max_error"]) for r in group]))
+        summary.append(entry)
+    return sorted(summary, key=lambda e: e["rms_mean"])
+
+
+def swept_groups(rows: List[dict]) -> List[str]:
+    """Groups whose weight differs between configurations of the table."""
+    return [g for g in WEIGHT_GROUPS if len({str(r.get(f"w_{g}", "")) for r in rows}) > 1]
+
+
+# ---------------------------------------------------------------------------
+# Plotting (opt-in, after the batch)
+# ---------------------------------------------------------------------------
+
+def plot_heatmaps(rows: List[dict], x: str, y: str, out_png: PathLike) -> None:
+    """
+    Mean marker RMS and largest marker error over the weights of two groups.
+    Each cell shows the best configuration with those two weights (other
+    swept groups at their best values).
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    summary = config_summary(rows)
+    xs = sorted({float(e[f"w_{x}"]) for e in summary})
+    ys = sorted({float(e[f"w_{y}"]) for e in summary})
+    grids = {k: np.full((len(ys), len(xs)), np.nan) for k in ("rms_mean", "max_error")}
+    for e in summary:           # best first: the first entry of a cell wins
+        i, j = ys.index(float(e[f"w_{y}"])), xs.index(float(e[f"w_{x}"]))
+        if np.isnan(grids["rms_mean"][i, j]):
+            grids["rms_mean"][i, j] = e["rms_mean"] * 1000.0
+            grids["max_error"][i, j] = e["max_error"] * 1000.0
+
+    fig, axes = plt.subplots(1, 2, figsize=(6 + 1.2 * len(xs), 2 + 0.6 * len(ys)))
+    for ax, (key, title) in zip(axes, (("rms_mean", "Mean marker RMS (mm)"),
+                                       ("max_error", "Max marker error (mm)"))):
+        image = ax.imshow(grids[key], origin="lower", cmap="viridis", aspect="auto")
+        for (i, j), value in np.ndenumerate(grids[key]):
+            if not np.isnan(value):
+                ax.text(j, i, f"{value:.1f}", ha="center", va="center", color="w", fontsize=8)
+        ax.set_xticks(range(len(xs)), [f"{v:g}" for v in xs])
+        ax.set_yticks(range(len(ys)), [f"{v:g}" for v in ys])
+        ax.set_xlabel(f"{x} weight")
+        ax.set_ylabel(f"{y} weight")
+        ax.set_title(title)
+        fig.colorbar(image, ax=ax)
+    fig.tight_layout()
+    fig.savefig(out_png)
+    plt.close(fig)
+
+
+def plot_all(rows: List[dict], plot_dir: Path, pairs: Optional[List[Tuple[str, str]]] = None) -> List[Path]:
+    """Heatmaps for the given group pairs (default: every pair of swept groups)."""
+    plot_dir.mkdir(parents=True, exist_ok=True)
+    if pairs is None:
+        pairs = list(itertools.combinations(swept_groups(rows), 2))
+    written = []
+    for x, y in pairs:
+        png = plot_dir / f"{HEATMAP_PREFIX}_{x}_{y}.png"
+        plot_heatmaps(rows, x, y, png)
+        written.append(png)
+    return written
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Sweep IK marker weights and tabulate marker errors per configuration",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--template", default="", help="Path to template JSON file")
+    source.add_argument("--manifest", default="", help="Compiled manifest JSON (instead of --template)")
+    source.add_argument("--from-table", default="", help="Only draw heatmaps from an existing sweep CSV")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--trials", default="", help="Comma-separated trial names (default: all)")
+    parser.add_argument("--grid", action="append", default=[], metavar="GROUP=W1,W2,...",
+                        help=f"Weights to combine for a marker group ({', '.join(WEIGHT_GROUPS)}); repeatable")
+    parser.add_argument("--sample", action="append", default=[], metavar="GROUP=LOW:HIGH",
+                        help="Random weight range for a marker group; repeatable")
+    parser.add_argument("--samples", type=int, default=0, help="Random draws for --sample")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for --sample")
+    parser.add_argument("--model", default="", help="Model for every trial (default: scaled model, else template model)")
+    parser.add_argument("--cores", type=int, default=0, help="Worker processes (default: physical_cores - 1)")
+    parser.add_argument("--out", default="", help=f"Result CSV (default: <root>/{DEFAULT_SWEEP_NAME})")
+    parser.add_argument("--plot-dir", default="", help="Also save heatmaps here")
+    parser.add_argument("--heatmap", action="append", default=[], metavar="X,Y",
+                        help="Group pair to plot (default: every pair of swept groups); repeatable")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from manifest import compile_manifest, load_manifest, load_template, restrict_trials
+    from pipeline_cli import discover_subjects, physical_core_count, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    pairs = None
+    if args.heatmap:
+        pairs = [tuple(p.strip().lower() for p in h.split(",")) for h in args.heatmap]
+        bad = [p for p in pairs if len(p) != 2 or not set(p) <= set(WEIGHT_GROUPS)]
+        if bad:
+            logger.error("--heatmap expects two marker groups as X,Y: %s", bad)
+            sys.exit(1)
+
+    if args.from_table:
+        rows = load_table(Path(args.from_table))
+        for png in plot_all(rows, Path(args.plot_dir or Path(args.from_table).parent), pairs):
+            logger.info("Heatmap written: %s", png)
+        return
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()]
+    trials = [t.strip() for t in args.trials.split(",") if t.strip()] or None
+    try:
+        configs = build_configs(args.grid, args.sample, args.samples, args.seed)
+        if args.manifest:
+            manifest = load_manifest(Path(args.manifest))
+            manifest["subjects"] = [
+                restrict_trials(e, trials) if trials else e
+                for e in manifest["subjects"] if not subjects or e["subject"] in subjects
+            ]
+        else:
+            template = load_template(Path(args.template))
+            root_dir = Path(template.get("root_dir") or "")
+            manifest = compile_manifest(template, subjects or discover_subjects(root_dir), trials)
+        jobs = build_sweep_jobs(manifest, configs, args.model)
+    except (OSError, ValueError, ET.ParseError) as exc:
+        logger.error("%s", exc)
+        sys.exit(1)
+    if not jobs:
+        logger.error("No trials selected")
+        sys.exit(1)
+
+    cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+    logger.info("%d configuration(s) x %d trial(s) on %d core(s)", len(configs),
+                len(jobs) // len(configs), cores)
+    t0 = time.monotonic()
+    rows = sweep_all(jobs, cores=cores, logger=logger)
+    out_path = Path(args.out or Path(manifest["root_dir"]) / DEFAULT_SWEEP_NAME)
+    write_table(rows, out_path)
+    logger.info("%d row(s) written to %s in %.1f s", len(rows), out_path, time.monotonic() - t0)
+
+    best = config_summary(rows)[:5]
+    for e in best:
+        weights = ", ".join(f"{k[2:]}={e[k]:g}" for k in e if k.startswith("w_") and e[k] != "")
+        logger.info("config %d  RMS %.4f m, max %.4f m  (%s)", e["config"], e["rms_mean"], e["max_error"], weights)
+
+    if args.plot_dir:
+        pngs = plot_all(rows, Path(args.plot_dir), pairs)
+        for png in pngs:
+            logger.info("Heatmap written: %s", png)
+        if not pngs:
+            logger.warning("Heatmaps need at least two swept groups (or --heatmap X,Y)")
+
+    failed = [r for r in rows if r["status"] == "failed"]
+    if failed:
+        logger.error("%d failed job(s)", len(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # Required on Windows with frozen/spawn executables
+    main()
@@ -1,7 +1,10 @@
 from ezc3d import c3d
-from scipy.signal import find_peaks, argrelmin, butter, filtfilt
+from scipy.signal import find_peaks, argrelmin
 import numpy as np
 
+from run_length import baseline_threshold, first_sustained
+from signal_filters import lowpass
+
 
 def align_axis(traj):
     """
@@ -25,16 +28,6 @@ def absolute(x, axis):
     return x
 
 
-def lowpass(signal, fs=200, cutoff=8, order=4):
-    """
-    Zero‑phase low‑pass Butterworth filter.
-    fs: sampling rate (Hz)
-    cutoff: cutoff frequency (Hz)
-    """
-    b, a = butter(order, cutoff / (fs / 2), btype='low')
-    return filtfilt(b, a, signal)
-
-
 def load_c3d_markers(c3d_path):
     """
     Load C3D file and return marker trajectories and labels.
@@ -90,18 +83,17 @@ def compute_relative_foot_signals(trajectory_sacrum_1d,
     return lhs, rhs, lto, rto
 
 
-def detect_events(lhs, rhs, lto, rto, fs=200):
+def detect_all_events(lhs, rhs, lto, rto, fs=200):
     """
     Coordinate-based gait event detection with filtering and constraints.
     - Heel strike: peaks in heel-sacro distance (lhs, rhs)
     - Toe off: minima in toe-sacro distance (lto, rto)
+    Returns dict of frame index arrays: left_hs, right_hs, left_to, right_to.
     """
 
-    # 1) Low-pass filter the signals
-    lhs_f = lowpass(lhs, fs=fs, cutoff=8)
-    rhs_f = lowpass(rhs, fs=fs, cutoff=8)
-    lto_f = lowpass(lto, fs=fs, cutoff=8)
-    rto_f = lowpass(rto, fs=fs, cutoff=8)
+    # 1) Low-pass filter the four signals as one (frames x 4) block
+    filtered = lowpass(np.column_stack([lhs, rhs, lto, rto]), cutoff=8, fs=fs)
+    lhs_f, rhs_f, lto_f, rto_f = filtered.T
 
     # 2) Peak/minimum detection parameters (tune as needed)
     min_step_frames = 180   # ~0.9 s at 200 Hz, adjust per dataset
@@ -114,53 +106,151 @@ def detect_events(lhs, rhs, lto, rto, fs=200):
                                  distance=min_step_frames,
                                  prominence=prominence)
 
-    left_to_idx = argrelmin(lto_f, order=40)[0][-1]
-    right_to_idx = argrelmin(rto_f, order=40)[0][-1]
+    left_to_idx = argrelmin(lto_f, order=40)[0]
+    right_to_idx = argrelmin(rto_f, order=40)[0]
 
-    return left_hs_idx[0], right_hs_idx[0], left_to_idx, right_to_idx
+    return {
+        "left_hs": left_hs_idx,
+        "right_hs": right_hs_idx,
+        "left_to": left_to_idx,
+        "right_to": right_to_idx,
+    }
 
 
-def main(c3d_path):
-    # Path to your C3D file
-    # c3d_path = r"D:\student\MTech\Sakshi\STW\S01\ExpData\Mocap\stw2.c3d"
+def detect_events(lhs, rhs, lto, rto, fs=200):
+    """
+    First heel strike and last toe off per side (see detect_all_events).
+    """
+    events = detect_all_events(lhs, rhs, lto, rto, fs=fs)
+    return (events["left_hs"][0], events["right_hs"][0],
+            events["left_to"][-1], events["right_to"][-1])
 
-    fs_markers = 200  # Hz
 
-    # Load data
-    xyz, labels = load_c3d_markers(c3d_path)
+def movement_window(trajectory_sacrum, fs=200, baseline_sec=0.5,
+                    noise_mult=5.0, min_peak_frac=0.05, min_dur_ms=100.0):
+    """
+    Start and end frame of whole-body movement from pelvis speed.
+    trajectory_sacrum: 3xN pelvis trajectory in original time order.
+    Speed must exceed mean + noise_mult * std of the quiet first
+    `baseline_sec` (and at least min_peak_frac of the peak speed) for
+    `min_dur_ms`; the end is the last frame of the last such run.
+    Returns (start, end), -1 for both if no movement is found.
+    """
+    pelvis = lowpass(np.asarray(trajectory_sacrum, dtype=float).T, cutoff=6, fs=fs)
+    speed = np.linalg.norm(np.gradient(pelvis, axis=0), axis=1) * fs
+
+    n_base = max(10, int(baseline_sec * fs))
+    _, thresh = baseline_threshold(speed, (0, n_base), noise_mult)
+    thresh = max(float(thresh), min_peak_frac * float(np.nanmax(speed)))
+    moving = speed > thresh
+
+    min_fr = max(3, int(min_dur_ms / 1000.0 * fs))
+    start = int(first_sustained(moving, min_fr))
+    if start < 0:
+        return -1, -1
+    end = len(moving) - 1 - int(first_sustained(moving[::-1], min_fr))
+    return start, end
+
+
+def _foot_signals(xyz, labels, keep_time_order=False):
+    """
+    Dominant axis, oriented pelvis-relative heel/toe signals and the raw
+    pelvis trajectory from (3, N_markers, N_frames) marker arrays.
+    With keep_time_order the axis is oriented by negating the coordinate
+    (sign taken from the pelvis) instead of absolute()'s time reversal, so
+    frame indices of the signals match the recording and the pelvis.
+    """
+    xyz = np.array(xyz, dtype=float)
 
     # Pelvis reference trajectory (3D) from LASIS/RASIS
     trajectory_sacrum = compute_sacrum(xyz, labels)
+    pelvis = trajectory_sacrum.copy()
 
     # Determine dominant axis from pelvis and orient positively
     axis = align_axis(trajectory_sacrum)
-    trajectory_sacrum = absolute(trajectory_sacrum, axis)
-    trajectory_sacrum_1d = trajectory_sacrum[axis]
-
-    # Foot markers along dominant axis (using LFCC/RFCC and LFMT2/RFMT2)
-    trajectory_rfcc_1d = extract_1d_marker(xyz, labels, 'RFCC', axis, make_absolute=True)
-    trajectory_rfmt2_1d = extract_1d_marker(xyz, labels, 'RFMT2', axis, make_absolute=True)
-    trajectory_lfcc_1d = extract_1d_marker(xyz, labels, 'LFCC', axis, make_absolute=True)
-    trajectory_lfmt2_1d = extract_1d_marker(xyz, labels, 'LFMT2', axis, make_absolute=True)
+    if keep_time_order:
+        sign = -1.0 if trajectory_sacrum[axis][-1] - trajectory_sacrum[axis][0] < 0 else 1.0
+        trajectory_sacrum_1d = sign * trajectory_sacrum[axis]
+        trajectory_rfcc_1d, trajectory_rfmt2_1d, trajectory_lfcc_1d, trajectory_lfmt2_1d = (
+            sign * extract_1d_marker(xyz, labels, name, axis, make_absolute=False)
+            for name in ('RFCC', 'RFMT2', 'LFCC', 'LFMT2')
+        )
+    else:
+        trajectory_sacrum = absolute(trajectory_sacrum, axis)
+        trajectory_sacrum_1d = trajectory_sacrum[axis]
+
+        # Foot markers along dominant axis (using LFCC/RFCC and LFMT2/RFMT2)
+        trajectory_rfcc_1d = extract_1d_marker(xyz, labels, 'RFCC', axis, make_absolute=True)
+        trajectory_rfmt2_1d = extract_1d_marker(xyz, labels, 'RFMT2', axis, make_absolute=True)
+        trajectory_lfcc_1d = extract_1d_marker(xyz, labels, 'LFCC', axis, make_absolute=True)
+        trajectory_lfmt2_1d = extract_1d_marker(xyz, labels, 'LFMT2', axis, make_absolute=True)
 
     # Pelvis-relative signals
-    lhs, rhs, lto, rto = compute_relative_foot_signals(
+    signals = compute_relative_foot_signals(
         trajectory_sacrum_1d,
         trajectory_lfcc_1d,
         trajectory_rfcc_1d,
         trajectory_lfmt2_1d,
         trajectory_rfmt2_1d
     )
+    return int(axis), signals, pelvis
+
+
+def detect_events_from_markers(xyz, labels, fs=200):
+    """
+    Run the full event detection on already-parsed marker arrays.
+    xyz: (3, N_markers, N_frames) as returned by load_c3d_markers (C3D units).
+    Works on a copy, so the caller's array is left untouched.
+    Returns dict with dominant axis and HS/TO frame indices.
+    """
+    axis, (lhs, rhs, lto, rto), _ = _foot_signals(xyz, labels)
 
     # Detect gait events
-    left_hs, right_hs, left_to, right_to = detect_events(lhs, rhs, lto, rto, fs=fs_markers)
+    left_hs, right_hs, left_to, right_to = detect_events(lhs, rhs, lto, rto, fs=fs)
+
+    return {
+        "axis": axis,
+        "left_hs": int(left_hs),
+        "right_hs": int(right_hs),
+        "left_to": int(left_to),
+        "right_to": int(right_to),
+    }
+
+
+def detect_all_events_from_markers(xyz, labels, fs=200):
+    """
+    Like detect_events_from_markers, but with every heel strike / toe off
+    (lists of frame indices) and the movement window (movement_start,
+    movement_end frames) from the same parse.  All frames are in recording
+    order, also for trials moving towards the negative axis.
+    """
+    axis, (lhs, rhs, lto, rto), pelvis = _foot_signals(xyz, labels, keep_time_order=True)
+
+    events = {"axis": axis}
+    for key, frames in detect_all_events(lhs, rhs, lto, rto, fs=fs).items():
+        events[key] = [int(f) for f in frames]
+    events["movement_start"], events["movement_end"] = movement_window(pelvis, fs=fs)
+    return events
+
+
+def main(c3d_path):
+    # Path to your C3D file
+    # c3d_path = r"D:\student\MTech\Sakshi\STW\S01\ExpData\Mocap\stw2.c3d"
+
+    fs_markers = 200  # Hz
+
+    # Load data
+    xyz, labels = load_c3d_markers(c3d_path)
+
+    events = detect_events_from_markers(xyz, labels, fs=fs_markers)
 
     # Print results
-    print("Dominant axis:", axis)
-    print("Left heel strike indices:", left_hs)
-    print("Right heel strike indices:", right_hs)
-    print("Left toe off indices:", left_to)
-    print("Right toe off indices:", right_to)
+    print("Dominant axis:", events["axis"])
+    print("Left heel strike indices:", events["left_hs"])
+    print("Right heel strike indices:", events["right_hs"])
+    print("Left toe off indices:", events["left_to"])
+    print("Right toe off indices:", events["right_to"])
+    return events
 
 
 # if __name__ == "__main__":
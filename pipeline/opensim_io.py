@@ -0,0 +1,407 @@
+"""
+Shared readers and writers for OpenSim text formats (.trc, .mot, .sto).
+
+Every stage that needs marker or force data goes through this module so a
+file is parsed the same way everywhere.  Parsers return NumPy blocks
+(frames x channels) instead of per-column pandas lookups.
+
+Compressed variants (stw1.mot.gz, id_output.sto.zst) are handled
+transparently: readers fall back to a compressed sibling when the plain file
+is missing, writers compress on request, and plain_text() hands OpenSim tools
+a temporary decompressed copy.  zstd needs the optional 'zstandard' package.
+"""
+
+import io
+import os
+import gzip
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+
+PathLike = Union[str, Path]
+
+# codec name -> file suffix
+COMPRESSION_SUFFIXES = {"gz": ".gz", "zst": ".zst"}
+
+
+# ---------------------------------------------------------------------------
+# Compression helpers
+# ---------------------------------------------------------------------------
+
+def codec_of(path: PathLike) -> Optional[str]:
+    """'gz', 'zst' or None depending on the file suffix."""
+    suffix = Path(path).suffix.lower()
+    return next((c for c, s in COMPRESSION_SUFFIXES.items() if s == suffix), None)
+
+
+def plain_name(path: PathLike) -> Path:
+    """stw1.mot.gz -> stw1.mot (unchanged for uncompressed paths)."""
+    path = Path(path)
+    return path.with_suffix("") if codec_of(path) else path
+
+
+def data_suffix(path: PathLike) -> str:
+    """Format suffix ignoring compression: '.mot' for both stw1.mot and stw1.mot.gz."""
+    return plain_name(path).suffix.lower()
+
+
+def resolve_path(path: PathLike) -> Path:
+    """
+    Return `path` if it exists, else its first existing compressed sibling
+    (.gz, .zst).  Falls back to `path` so callers still get a clear error.
+    """
+    path = Path(path)
+    if path.exists() or codec_of(path):
+        return path
+    for suffix in COMPRESSION_SUFFIXES.values():
+        candidate = path.with_name(path.name + suffix)
+        if candidate.exists():
+            return candidate
+    return path
+
+
+def _require_zstd() -> None:
+    if zstandard is None:
+        raise ImportError("Reading/writing .zst files requires the 'zstandard' package")
+
+
+def open_text(path: PathLike, mode: str = "r"):
+    """Open a plain, gzip or zstd text file for reading ('r') or writing ('w')."""
+    path = Path(path)
+    codec = codec_of(path)
+    if codec == "gz":
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="\n" if mode == "w" else None)
+    if codec == "zst":
+        _require_zstd()
+        raw = open(path, mode + "b")
+        cctx = zstandard.ZstdCompressor() if mode == "w" else zstandard.ZstdDecompressor()
+        stream = cctx.stream_writer(raw) if mode == "w" else cctx.stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding="utf-8", newline="\n" if mode == "w" else None)
+    return open(path, mode, newline="\n" if mode == "w" else None)
+
+
+def compress_file(path: PathLike, codec: str = "gz", remove_original: bool = True) -> Path:
+    """Compress an existing plain file next to itself; returns the new path."""
+    path = Path(path)
+    target = path.with_name(path.name + COMPRESSION_SUFFIXES[codec])
+    with open(path, "rb") as src:
+        if codec == "gz":
+            with gzip.open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            _require_zstd()
+            with open(target, "wb") as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+    shutil.copystat(path, target)
+    if remove_original:
+        path.unlink()
+    return target
+
+
+def read_bytes(path: PathLike) -> bytes:
+    """Whole file contents, decompressed if needed."""
+    path = resolve_path(path)
+    codec = codec_of(path)
+    if codec == "gz":
+        return gzip.decompress(path.read_bytes())
+    if codec == "zst":
+        _require_zstd()
+        with open(path, "rb") as fh:
+            return zstandard.ZstdDecompressor().stream_reader(fh).read()
+    return path.read_bytes()
+
+
+@contextmanager
+def plain_text(path: PathLike) -> Iterator[str]:
+    """
+    Yield a path OpenSim can read directly.
+
+    Plain files are yielded unchanged.  A compressed file (or a missing plain
+    file with a compressed sibling) is decompressed into a temporary
+    directory, under its plain name, and removed on exit.
+    """
+    source = resolve_path(path)
+    if not codec_of(source):
+        yield str(path)
+        return
+    tmp_dir = tempfile.mkdtemp(prefix="osim_plain_")
+    try:
+        target = Path(tmp_dir) / plain_name(source).name
+        target.write_bytes(read_bytes(source))
+        yield str(target)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@contextmanager
+def plain_external_loads(grf_xml: PathLike) -> Iterator[str]:
+    """
+    Yield an ExternalLoads XML whose <datafile> OpenSim can read directly.
+
+    The XML is yielded unchanged unless its data file is compressed; then a
+    copy pointing at a decompressed data file is written to a temporary
+    directory (see plain_text), so the setup on disk keeps the dataset path.
+    """
+    tree = ET.parse(str(grf_xml))
+    node = tree.getroot().find(".//datafile")
+    datafile = Path((node.text or "").strip()) if node is not None else Path()
+    if not datafile.name:
+        yield str(grf_xml)
+        return
+    if not datafile.is_absolute():
+        datafile = Path(grf_xml).parent / datafile
+    if not codec_of(resolve_path(datafile)):
+        yield str(grf_xml)
+        return
+    with plain_text(datafile) as plain:
+        node.text = plain
+        target = Path(plain).parent / Path(grf_xml).name
+        tree.write(str(target))
+        yield str(target)
+
+
+# ---------------------------------------------------------------------------
+# Containers
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Storage:
+    """A parsed .mot / .sto file: header, column labels and a data block."""
+    columns: List[str]
+    data: np.ndarray                      # (frames, columns), column 0 is time
+    header: Dict[str, str] = field(default_factory=dict)
+    name: str = ""
+
+    @property
+    def time(self) -> np.ndarray:
+        return self.data[:, 0]
+
+    @property
+    def rate(self) -> float:
+        """Sampling rate in Hz estimated from the time column."""
+        t = self.time
+        if len(t) < 2:
+            return 0.0
+        return float(1.0 / np.mean(np.diff(t)))
+
+    def index(self, name: str) -> int:
+        return self.columns.index(name)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.data[:, self.index(name)]
+
+    def block(self, names: Sequence[str]) -> np.ndarray:
+        """Return the (frames x len(names)) block for the given columns."""
+        return self.data[:, [self.index(n) for n in names]]
+
+
+@dataclass
+class MarkerData:
+    """A parsed .trc file with marker positions as a (frames, markers, 3) array."""
+    labels: List[str]
+    time: np.ndarray
+    xyz: np.ndarray
+    rate: float
+    units: str = "m"
+    header: Dict[str, str] = field(default_factory=dict)
+
+    def marker(self, name: str) -> np.ndarray:
+        return self.xyz[:, self.labels.index(name), :]
+
+
+# ---------------------------------------------------------------------------
+# Readers
+# ---------------------------------------------------------------------------
+
+def read_storage_header(path: PathLike) -> tuple:
+    """
+    Read only the header of a .mot/.sto file.
+
+    Returns:
+        (header dict, column labels, number of header lines incl. labels, name)
+    """
+    header: Dict[str, str] = {}
+    name = ""
+    with open_text(resolve_path(path)) as fh:
+        for i, line in enumerate(fh):
+            stripped = line.strip()
+            if stripped.lower() == "endheader":
+                columns = fh.readline().strip().split("\t")
+                return header, [c.strip() for c in columns], i + 2, name
+            if "=" in stripped:
+                key, value = stripped.split("=", 1)
+                header[key.strip()] = value.strip()
+            elif stripped and i == 0:
+                name = stripped
+    raise ValueError(f"No 'endheader' found in {path}")
+
+
+def read_storage(path: PathLike) -> Storage:
+    """Parse an OpenSim .mot/.sto file (optionally .gz/.zst) into a Storage."""
+    path = resolve_path(path)
+    header, columns, skip, name = read_storage_header(path)
+    df = _read_table(path, sep=r"\s+", skiprows=skip)
+    data = df.to_numpy(dtype=float)[:, :len(columns)]
+    return Storage(columns=columns, data=data, header=header, name=name)
+
+
+def read_trc_header(path: PathLike) -> tuple:
+    """
+    Read only the 5-line header of a .trc file.
+
+    Returns:
+        (header dict, marker labels)
+    """
+    with open_text(resolve_path(path)) as fh:
+        lines = [fh.readline() for _ in range(4)]
+    keys = lines[1].rstrip("\r\n").split("\t")
+    values = lines[2].rstrip("\r\n").split("\t")
+    header = {k.strip(): v.strip() for k, v in zip(keys, values) if k.strip()}
+    labels = [
+        m.strip() for m in lines[3].rstrip("\r\n").split("\t")[2:]
+        if m.strip()
+    ]
+    return header, labels
+
+
+def read_trc(path: PathLike) -> MarkerData:
+    """Parse a .trc file (optionally .gz/.zst).  Missing samples (empty fields) become NaN."""
+    path = resolve_path(path)
+    header, labels = read_trc_header(path)
+    df = _read_table(path, sep="\t", skiprows=5)
+    raw = df.to_numpy(dtype=float)
+    n = len(labels)
+    xyz = raw[:, 2:2 + 3 * n].reshape(len(raw), n, 3)
+    return MarkerData(
+        labels=labels,
+        time=raw[:, 1],
+        xyz=xyz,
+        rate=float(header.get("DataRate", 0.0) or 0.0),
+        units=header.get("Units", "m"),
+        header=header,
+    )
+
+
+def _read_table(path: Path, sep: str, skiprows: int) -> pd.DataFrame:
+    if codec_of(path) == "zst":
+        with open_text(path) as fh:
+            return pd.read_csv(fh, sep=sep, skiprows=skiprows, header=None, engine="c")
+    return pd.read_csv(path, sep=sep, skiprows=skiprows, header=None, engine="c",
+                       compression="infer")
+
+
+# ---------------------------------------------------------------------------
+# Writers
+# ---------------------------------------------------------------------------
+
+def write_storage(
+    path: PathLike,
+    columns: Sequence[str],
+    data: np.ndarray,
+    name: str = "",
+    in_degrees: Optional[bool] = None,
+    fmt: str = "%.10g",
+    compress: Optional[str] = None,
+) -> Path:
+    """
+    Write a (frames x columns) block as an OpenSim version-3 .mot/.sto file.
+
+    Column 0 of `data` must be time.  compress='gz'/'zst' appends the codec
+    suffix and writes compressed; the written path is returned.
+    """
+    path = _output_path(path, compress)
+    lines = []
+    if name:
+        lines.append(name)
+    lines += [
+        f"nColumns={len(columns)}",
+        f"nRows={len(data)}",
+        "DataType=double",
+        "version=3",
+        "OpenSimVersion=4.5",
+    ]
+    if in_degrees is not None:
+        lines.append(f"inDegrees={'yes' if in_degrees else 'no'}")
+    lines.append("endheader")
+    lines.append("\t".join(columns))
+    _write_block(path, "\n".join(lines) + "\n", data, fmt)
+    return path
+
+
+def write_trc(
+    path: PathLike,
+    labels: Sequence[str],
+    time: np.ndarray,
+    xyz: np.ndarray,
+    rate: float,
+    units: str = "m",
+    fmt: str = "%.10g",
+    compress: Optional[str] = None,
+) -> Path:
+    """Write (frames, markers, 3) marker positions as a .trc file (optionally compressed)."""
+    path = _output_path(path, compress)
+    n_frames, n_markers = xyz.shape[0], xyz.shape[1]
+    head = [
+        f"PathFileType\t4\t(X/Y/Z)\t{plain_name(path)}",
+        "DataRate\tCameraRate\tNumFrames\tNumMarkers\tUnits\tOrigDataRate"
+        "\tOrigDataStartFrame\tOrigNumFrames",
+        f"{rate:f}\t{rate:f}\t{n_frames}\t{n_markers}\t{units}\t{rate:f}\t0\t{n_frames}",
+        "Frame#\tTime\t" + "".join(f"{m}\t\t\t" for m in labels),
+        "\t\t" + "".join(f"X{i}\tY{i}\tZ{i}\t" for i in range(1, n_markers + 1)),
+        "",
+    ]
+    frames = np.arange(1, n_frames + 1, dtype=float)[:, None]
+    block = np.hstack([frames, np.asarray(time)[:, None], xyz.reshape(n_frames, -1)])
+    _write_block(path, "\n".join(head) + "\n", block, fmt, nan_as_blank=True)
+    return path
+
+
+def write_if_changed(path: PathLike, text: str, encoding: str = "utf-8") -> bool:
+    """
+    Write text (platform newlines, like open(path, "w")) only when the bytes
+    differ from what is on disk, so unchanged setup files keep their mtime.
+    Returns True when the file was (re)written.
+    """
+    path = Path(path)
+    data = text.replace("\n", os.linesep).encode(encoding)
+    try:
+        if path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    os.makedirs(path.parent, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+    return True
+
+
+def _output_path(path: PathLike, compress: Optional[str]) -> Path:
+    path = plain_name(path) if compress else Path(path)
+    return path.with_name(path.name + COMPRESSION_SUFFIXES[compress]) if compress else path
+
+
+def _write_block(path: Path, head: str, block: np.ndarray, fmt: str,
+                 nan_as_blank: bool = False) -> None:
+    """Write header text followed by a tab-separated numeric block in one go."""
+    os.makedirs(path.parent, exist_ok=True)
+    body = pd.DataFrame(block).to_csv(
+        sep="\t", header=False, index=False, float_format=fmt,
+        na_rep="" if nan_as_blank else "NaN", lineterminator="\n",
+    )
+    with open_text(path, "w") as fh:
+        fh.write(head)
+        fh.write(body)
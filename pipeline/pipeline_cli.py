@@ -3,11 +3,15 @@ CLI Pipeline for OpenSim processing.
 
 Usage:
     python pipeline_cli.py --template path/to/template.json [OPTIONS]
+    python pipeline_cli.py --manifest path/to/manifest.json [OPTIONS]
 
 Options:
-    --template      Path to template JSON (required)
+    --template      Path to template JSON (this or --manifest is required)
+    --manifest      Compiled manifest JSON (e.g. from bulk_map.py) with explicit
+                    per-subject paths; used as-is instead of adapting a template
     --subjects      Comma-separated subject numbers e.g. 01,02,05
-                    If omitted, all discovered subjects under root_dir are used.
+                    If omitted, all discovered subjects under root_dir (or all
+                    subjects of the manifest) are used.
     --trials        Comma-separated trial names e.g. stw1,stw2
                     Applied to all selected subjects. If omitted, all trials run.
     --steps         Comma-separated steps: scale,ik,id,so  (default: all)
@@ -15,6 +19,24 @@ Options:
     --cores         Number of cores to use (default: physical_core_count - 1, min 1)
     --log-level     Logging level: DEBUG, INFO, WARNING, ERROR (default: INFO)
     --log-file      Optional path to write log output to a file
+    --catalog       Results catalog path (default: <root_dir>/results_catalog.sqlite)
+    --no-catalog    Do not update the results catalog after the run
+    --scratch       Local directory (e.g. tmpfs/SSD) to stage each subject's inputs
+                    into; tools run there and results are copied back on success
+    --compress-outputs  gz|zst: compress each subject's IK/ID/SO results once it
+                    finishes (readers and the catalog handle both transparently)
+    --preflight-report  Go/no-go table path (default: <root_dir>/preflight.csv)
+    --no-preflight  Skip input validation; every selected trial is sent to the solvers
+    --gates         JSON overriding the default quality-gate limits (see quality_gates.py)
+    --no-gates      Do not check IK/ID/SO outputs; every trial runs all its steps
+    --run-summary   Gate results per trial/stage (default: <root_dir>/run_summary.csv)
+    --run-state     Per-trial state of the run, written however it ends
+                    (default: <root_dir>/run_state.json)
+    --resume        Run only the incomplete and pending trials of the last run's state
+
+Ctrl-C once stops starting new trials and lets running ones finish; a second
+Ctrl-C terminates the workers.  Either way the run state is written, so the
+next run can continue with --resume (see run_state.py).
 
 Example:
     python pipeline_cli.py --template D:/study/template.json --subjects 01,02 --steps ik,id --parallel
@@ -27,12 +49,27 @@ import logging
 import subprocess
 import shutil
 import argparse
+import signal
 import time
+from contextlib import ExitStack
 from pathlib import Path
 from typing import Dict, List, Optional
 
 # Import the setup generation module
 from generate_setup_files import generate_setups_if_needed
+from results_catalog import ARTIFACT_DIRS, CATALOG_NAME, update_catalog
+from cohort_store import find_dir
+from file_inventory import FileInventory
+from opensim_io import codec_of, compress_file, plain_external_loads, plain_text, zstandard
+from scratch_staging import ScratchStage
+from setup_generator import print_to_xml_if_changed
+from manifest import compile_manifest, load_manifest, restrict_trials
+from preflight import DEFAULT_REPORT_NAME, build_jobs, cleared_entries, go_trials, preflight_all, write_report
+from quality_gates import (DEFAULT_SUMMARY_NAME, downstream, error_row, evaluate_gate, load_gates,
+                           log_summary, summary_row, write_summary)
+from run_monitor import DEFAULT_TIMINGS_NAME, RunMonitor, make_event, record_timings
+from run_state import (CANCELLED, DEFAULT_STATE_NAME, RunControl, build_state, ignore_sigint, install_sigint,
+                       load_state, resume_trials, start_manager, write_state)
 
 
 # ---------------------------------------------------------------------------
@@ -53,8 +90,25 @@ except ImportError:
 # Utility
 # ---------------------------------------------------------------------------
 
-def replace_subject_in_path(path_str: str, old_subj: str, new_subj: str) -> str:
-    return path_str.replace(old_subj, new_subj)
+def field_path(record: dict, key: str) -> Optional[Path]:
+    """Path of a manifest field, or None when it is empty (Path("") is ".", which always exists)."""
+    value = record.get(key) or ""
+    return Path(value) if value else None
+
+
+def compress_stage_outputs(subj_dir: Path, codec: str, logger: logging.Logger) -> int:
+    """Compress the plain .mot/.sto results of one subject in place."""
+    count = 0
+    for rel in ARTIFACT_DIRS.values():
+        out_dir = find_dir(subj_dir, rel)
+        if out_dir is None:
+            continue
+        for path in out_dir.iterdir():
+            if path.is_file() and not codec_of(path) and path.suffix.lower() in (".mot", ".sto"):
+                compress_file(path, codec)
+                count += 1
+    logger.info("Compressed %d output file(s) in %s (%s)", count, subj_dir, codec)
+    return count
 
 
 def setup_logging(level_name: str = "INFO", log_file: Optional[str] = None) -> logging.Logger:
@@ -79,8 +133,15 @@ def setup_logging(level_name: str = "INFO", log_file: Optional[str] = None) -> l
 # ---------------------------------------------------------------------------
 
 class PipelineEngine:
-    def __init__(self, logger: logging.Logger):
+    def __init__(self, logger: logging.Logger, gates: Optional[dict] = None, events=None,
+                 control: Optional[RunControl] = None):
         self.logger = logger
+        self.gates = gates
+        self.gate_rows: List[dict] = []
+        self.events = events  # queue for run_monitor progress events, or None
+        self.stage_times: List[dict] = []
+        self.control = control
+        self.cancelled = False  # set when a cancel stopped the trial loop early
 
     # ------------------------------------------------------------------
     # Internal helpers
@@ -119,28 +180,80 @@ class PipelineEngine:
             return False
         return True
 
+    def _emit(self, event: str, subject: str, trial: str = "", stage: str = "", **extra) -> None:
+        if self.events is not None:
+            self.events.put(make_event(event, subject, trial, stage, **extra))
+
+    def _timed_run(self, tool, subject_num: str, trial_name: str, stage: str) -> bool:
+        """Run an OpenSim tool, recording its duration and reporting it as progress events."""
+        self._emit("stage_start", subject_num, trial_name, stage)
+        t0 = time.monotonic()
+        success = False
+        try:
+            success = bool(tool.run())
+        finally:
+            seconds = time.monotonic() - t0
+            if success:
+                self.stage_times.append({"stage": stage, "seconds": seconds})
+            self._emit("stage_end", subject_num, trial_name, stage, seconds=seconds, ok=success)
+        return success
+
+    def _tracked_trials(self, subject_num: str, trials: List[dict]):
+        """
+        Yield the trials, reporting when each one starts and ends (including on
+        continue).  Waits here while the run is paused and stops on a cancel.
+        """
+        for trial in trials:
+            if self.control is not None and not self.control.wait_if_paused():
+                self.logger.warning("Run cancelled; subject %s stops before trial %s", subject_num, trial["trial"])
+                self.cancelled = True
+                return
+            self._emit("trial_start", subject_num, trial["trial"])
+            yield trial
+            self._emit("trial_end", subject_num, trial["trial"])
+
+    def _passes_gate(self, stage: str, subj_dir: Path, job: dict, trial_name: str, enabled_steps: dict) -> bool:
+        """Check a stage's output; a failing trial skips its remaining steps (recorded in gate_rows)."""
+        if not self.gates:
+            return True
+        try:
+            result = evaluate_gate(stage, subj_dir, trial_name, self.gates, job.get("details"))
+        except Exception as exc:
+            # Recorded, but not blocking: the stage's own run succeeded, only its check is unknown
+            self.logger.error("%s gate could not be evaluated for trial %s: %s", stage.upper(), trial_name, exc)
+            self.gate_rows.append(error_row(job["subject"], trial_name, stage, exc))
+            return True
+        skipped = [] if result["passed"] else downstream(stage, enabled_steps)
+        self.gate_rows.append(summary_row(job["subject"], trial_name, result, skipped))
+        if not result["passed"]:
+            self.logger.warning("Trial %s failed the %s gate (%s)%s", trial_name, stage.upper(),
+                                "; ".join(result["reasons"]),
+                                f"; skipping {', '.join(skipped)}" if skipped else "")
+        return result["passed"]
+
     # ------------------------------------------------------------------
     # Main per-subject runner
     # ------------------------------------------------------------------
 
     def run_pipeline_for_subject(
         self,
-        subject_num: str,
-        template: dict,
+        job: dict,
         root_dir: Path,
         enabled_steps: dict,
-        selected_trials: Optional[List[str]] = None,
+        compress: Optional[str] = None,
+        scratch: Optional[str] = None,
     ) -> bool:
-        
+        """Run the enabled steps for one compiled manifest entry (see manifest.py)."""
         # Defer opensim import so each spawned process loads it cleanly
         import opensim as osim  # type: ignore
 
+        subject_num = job["subject"]
         self. _dbg("SUBJECT", f"===== START subject {subject_num} =====")
         self. _dbg("SUBJECT", "enabled_steps", enabled_steps)
-        self. _dbg("SUBJECT", "selected_trials", selected_trials or "all")
+        self. _dbg("SUBJECT", "trials", [t["trial"] for t in job.get("mapped_trials", [])])
         self. _dbg("SUBJECT", "root_dir", root_dir)
 
-        subj_dir = root_dir / f"S{subject_num}"
+        subj_dir = Path(job["subj_dir"])
         self. _dbg("SUBJECT", "subj_dir", subj_dir)
         self. _dbg("SUBJECT", "subj_dir exists?", subj_dir.exists())
 
@@ -150,19 +263,10 @@ class PipelineEngine:
             self.logger.warning("Subject %s directory not found; skipping.", subject_num)
             return False
 
-        # Deep-copy template and substitute '01' -> subject_num everywhere
-        adapted = json.loads(json.dumps(template))
-        for key, value in adapted.items():
-            if isinstance(value, str):
-                adapted[key] = replace_subject_in_path(value, "01", subject_num)
-            elif isinstance(value, list):
-                for item in value:
-                    if isinstance(item, dict):
-                        for k, v in item.items():
-                            if isinstance(v, str):
-                                item[k] = replace_subject_in_path(v, "01", subject_num)
-
-        self. _dbg("SUBJECT", "Adapted template keys", list(adapted.keys()))
+        # Paths were resolved for this subject when the manifest was compiled
+        adapted = job
+
+        self. _dbg("SUBJECT", "Manifest entry keys", list(adapted.keys()))
         self. _dbg("SUBJECT", "model path (adapted)", adapted.get("model", "NOT SET"))
         self. _dbg("SUBJECT", "model file exists?",
                   Path(adapted.get("model", "")).exists() if adapted.get("model") else "no path")
@@ -172,9 +276,20 @@ class PipelineEngine:
         self. _dbg("SUBJECT", "scale_xml (adapted)", adapted.get("scale_xml", "NOT SET"))
         self. _dbg("SUBJECT", "mapped_trials count", len(adapted.get("mapped_trials", [])))
 
+        # Optionally run against local copies instead of the shared root_dir
+        stage: Optional[ScratchStage] = None
+        if scratch:
+            stage = ScratchStage(root_dir, Path(scratch), subject_num, self.logger)
+            adapted = stage.stage_template(adapted)
+            subj_dir = stage.remap_path(subj_dir)
+            self. _dbg("SUBJECT", "scratch subj_dir", subj_dir)
+
         original_cwd = os.getcwd()
         self. _dbg("SUBJECT", "original working directory", original_cwd)
 
+        # Temporary plain-text copies of compressed inputs live until the subject ends
+        inputs = ExitStack()
+
         try:
             self.logger.info("Processing subject %s in %s", subject_num, subj_dir)
 
@@ -193,24 +308,24 @@ class PipelineEngine:
                 scale_dir.mkdir(exist_ok=True)
                 self. _dbg("SCALE", "scale_dir exists (after mkdir)?", scale_dir.exists())
 
-                scale_xml = Path(adapted.get("scale_xml", ""))
+                scale_xml = field_path(adapted, "scale_xml")
                 self. _dbg("SCALE", "scale_xml path", scale_xml)
-                self. _dbg("SCALE", "scale_xml exists (before setup)?", scale_xml.exists())
-                if not scale_xml.exists():
+                self. _dbg("SCALE", "scale_xml exists (before setup)?", scale_xml is not None and scale_xml.exists())
+                if scale_xml is None or not scale_xml.exists():
 
                     generate_setups_if_needed(
                         subject_num=subject_num,
                         subj_dir=subj_dir,
                         trial=0,
                         model_file=adapted.get("model", ""),
-                        xml=str(scale_xml),
+                        xml=str(scale_xml) if scale_xml is not None else "",
                         trial_name="scale",
                         logger=self.logger,
                     )
 
-                self. _dbg("SCALE", "scale_xml exists (after setup)?", scale_xml.exists())
+                self. _dbg("SCALE", "scale_xml exists (after setup)?", scale_xml is not None and scale_xml.exists())
 
-                if scale_xml.exists():
+                if scale_xml is not None and scale_xml.exists():
                     self. _dbg("SCALE", "Changing cwd to scale_xml parent", scale_xml.parent)
                     os.chdir(str(scale_xml.parent))
                     self. _dbg("SCALE", "Current working directory", os.getcwd())
@@ -230,10 +345,10 @@ class PipelineEngine:
                         scale_tool.getGenericModelMaker().setModelFileName(generic_model)
                         scale_tool.getMarkerPlacer().setMarkerFileName(static_trc)
                         scale_tool.getModelScaler().setMarkerFileName(static_trc)
-                        scale_tool.printToXML(str(scale_xml))
+                        print_to_xml_if_changed(scale_tool, scale_xml)
                         self. _dbg("SCALE", "ScaleTool XML saved, now running tool...")
 
-                        success = scale_tool.run()
+                        success = self._timed_run(scale_tool, subject_num, "", "scale")
                         self. _dbg("SCALE", "ScaleTool.run() returned", success)
 
                         if not success:
@@ -260,19 +375,14 @@ class PipelineEngine:
             mapped_trials = adapted.get("mapped_trials", [])
             self. _dbg("TRIALS", f"Total mapped trials to iterate", len(mapped_trials))
 
-            for trial_idx, trial in enumerate(mapped_trials):
-                trc = replace_subject_in_path(trial.get("trial_trc", ""), "01", subject_num)
-                trial_name = Path(trc).stem
+            for trial_idx, trial in enumerate(self._tracked_trials(subject_num, mapped_trials)):
+                trc = trial.get("trial_trc", "")
+                trial_name = trial["trial"]
 
                 self. _dbg("TRIAL", f"--- Trial [{trial_idx + 1}/{len(mapped_trials)}]: {trial_name} ---")
                 self. _dbg("TRIAL", "trial_trc path", trc)
                 self. _dbg("TRIAL", "trial_trc exists?", Path(trc).exists())
 
-                if selected_trials and trial_name not in selected_trials:
-                    self. _dbg("TRIAL", f"Skipping {trial_name} — not in selected_trials", selected_trials)
-                    self.logger.debug("Skipping trial %s (not in selection)", trial_name)
-                    continue
-
                 self.logger.info("Processing trial %s for subject %s", trial_name, subject_num)
 
                 model_for_trial = (
@@ -303,20 +413,20 @@ class PipelineEngine:
                 ik_tool = None
                 start = 3.0
                 end = 5.0
+                # Steps pre-flight blocked for this trial are not run
+                trial_steps = {s: on and s not in trial.get("skip_steps", ()) for s, on in enabled_steps.items()}
 
                 # ============================================================
                 # IK
                 # ============================================================
-                self. _dbg("IK", f"Step enabled? {enabled_steps.get('ik', True)}")
+                self. _dbg("IK", f"Step enabled? {trial_steps.get('ik', True)}")
 
-                if enabled_steps.get("ik", True):
-                    ik_xml = Path(
-                        replace_subject_in_path(trial.get("ik_xml", ""), "01", subject_num)
-                    )
+                if trial_steps.get("ik", True):
+                    ik_xml = field_path(trial, "ik_xml")
                     self. _dbg("IK", "ik_xml path", ik_xml)
-                    self. _dbg("IK", "ik_xml exists?", ik_xml.exists())
+                    self. _dbg("IK", "ik_xml exists?", ik_xml is not None and ik_xml.exists())
 
-                    if ik_xml.exists():
+                    if ik_xml is not None and ik_xml.exists():
                         self. _dbg("IK", "Changing cwd to ik_xml parent", ik_xml.parent)
                         os.chdir(str(ik_xml.parent))
                         self. _dbg("IK", "Current working directory", os.getcwd())
@@ -332,10 +442,12 @@ class PipelineEngine:
                             self. _dbg("IK", "Setting marker data file", marker_file)
                             self. _dbg("IK", "Marker file exists?", Path(marker_file).exists())
                             ik_tool.setMarkerDataFileName(marker_file)
-                            ik_tool.printToXML(str(ik_xml))
+                            print_to_xml_if_changed(ik_tool, ik_xml)
+                            # The setup keeps the dataset path; OpenSim runs on a plain-text copy
+                            ik_tool.setMarkerDataFileName(inputs.enter_context(plain_text(marker_file)))
 
                             self. _dbg("IK", "IK tool configured, running...")
-                            success = ik_tool.run()
+                            success = self._timed_run(ik_tool, subject_num, trial_name, "ik")
                             self. _dbg("IK", "IK.run() returned", success)
 
                             if not success:
@@ -351,6 +463,9 @@ class PipelineEngine:
                             self. _dbg("IK", "EXCEPTION during IK", str(exc))
                             self.logger.error("IK exception for trial %s: %s", trial_name, exc)
                             continue
+
+                        if not self._passes_gate("ik", subj_dir, adapted, trial_name, trial_steps):
+                            continue
                     else:
                         self. _dbg("IK", "ik_xml not found — IK skipped for this trial")
                         self.logger.warning("IK XML not found for %s; skipping.", trial_name)
@@ -359,21 +474,17 @@ class PipelineEngine:
                 # ============================================================
                 # ID
                 # ============================================================
-                self. _dbg("ID", f"Step enabled? {enabled_steps.get('id', True)}")
+                self. _dbg("ID", f"Step enabled? {trial_steps.get('id', True)}")
 
-                if enabled_steps.get("id", True):
-                    id_xml = Path(
-                        replace_subject_in_path(trial.get("id_xml", ""), "01", subject_num)
-                    )
-                    grf_xml = Path(
-                        replace_subject_in_path(trial.get("grf_xml", ""), "01", subject_num)
-                    )
+                if trial_steps.get("id", True):
+                    id_xml = field_path(trial, "id_xml")
+                    grf_xml = field_path(trial, "grf_xml")
                     self. _dbg("ID", "id_xml path", id_xml)
-                    self. _dbg("ID", "id_xml exists?", id_xml.exists())
+                    self. _dbg("ID", "id_xml exists?", id_xml is not None and id_xml.exists())
                     self. _dbg("ID", "grf_xml path", grf_xml)
-                    self. _dbg("ID", "grf_xml exists?", grf_xml.exists())
+                    self. _dbg("ID", "grf_xml exists?", grf_xml is not None and grf_xml.exists())
 
-                    if id_xml.exists():
+                    if id_xml is not None and id_xml.exists():
                         self. _dbg("ID", "Changing cwd to id_xml parent", id_xml.parent)
                         os.chdir(str(id_xml.parent))
                         self. _dbg("ID", "Loading InverseDynamicsTool from", id_xml)
@@ -382,7 +493,7 @@ class PipelineEngine:
                         self. _dbg("ID", "id_xml missing — creating empty InverseDynamicsTool")
                         id_tool = osim.InverseDynamicsTool()
 
-                    if grf_xml.exists():
+                    if grf_xml is not None and grf_xml.exists():
                         try:
                             self. _dbg("ID", "Setting model", model_for_trial)
                             id_tool.setModelFileName(model_for_trial)
@@ -401,17 +512,19 @@ class PipelineEngine:
                             id_tool.setEndTime(end)
 
                             if ik_tool:
-                                coord_path = str(Path(ik_xml.parent) / mot_file) if id_xml.exists() else mot_file
+                                coord_path = str(Path(ik_xml.parent) / mot_file) if id_xml is not None and id_xml.exists() else mot_file
                                 self. _dbg("ID", "setCoordinatesFileName", coord_path)
                                 self. _dbg("ID", "coordinates file exists?", Path(coord_path).exists())
                                 id_tool.setCoordinatesFileName(coord_path)
 
                             self. _dbg("ID", "setExternalLoadsFileName", grf_xml)
                             id_tool.setExternalLoadsFileName(str(grf_xml))
-                            id_tool.printToXML(str(id_xml))
+                            if id_xml is not None:
+                                print_to_xml_if_changed(id_tool, id_xml)
+                            id_tool.setExternalLoadsFileName(inputs.enter_context(plain_external_loads(grf_xml)))
 
                             self. _dbg("ID", "ID tool configured, running...")
-                            success = id_tool.run()
+                            success = self._timed_run(id_tool, subject_num, trial_name, "id")
                             self. _dbg("ID", "ID.run() returned", success)
 
                             if not success:
@@ -421,6 +534,9 @@ class PipelineEngine:
                             self. _dbg("ID", "EXCEPTION during ID", str(exc))
                             self.logger.error("ID exception for trial %s: %s", trial_name, exc)
                             continue
+
+                        if not self._passes_gate("id", subj_dir, adapted, trial_name, trial_steps):
+                            continue
                     else:
                         self. _dbg("ID", "grf_xml missing — ID skipped")
                         self.logger.info("GRF file missing for trial %s; skipping ID.", trial_name)
@@ -429,22 +545,21 @@ class PipelineEngine:
                 # ============================================================
                 # SO
                 # ============================================================
-                self. _dbg("SO", f"Step enabled? {enabled_steps.get('so', True)}")
+                self. _dbg("SO", f"Step enabled? {trial_steps.get('so', True)}")
 
-                if enabled_steps.get("so", True):
-                    so_xml = Path(
-                        replace_subject_in_path(trial.get("so_xml", ""), "01", subject_num)
-                    )
+                if trial_steps.get("so", True):
+                    so_xml = field_path(trial, "so_xml")
                     # Refresh grf_xml binding for SO (may not have been set if ID was skipped)
-                    grf_xml = Path(
-                        replace_subject_in_path(trial.get("grf_xml", ""), "01", subject_num)
-                    )
+                    grf_xml = field_path(trial, "grf_xml")
                     self. _dbg("SO", "so_xml path", so_xml)
-                    self. _dbg("SO", "so_xml exists?", so_xml.exists())
+                    self. _dbg("SO", "so_xml exists?", so_xml is not None and so_xml.exists())
                     self. _dbg("SO", "grf_xml path", grf_xml)
-                    self. _dbg("SO", "grf_xml exists?", grf_xml.exists())
+                    self. _dbg("SO", "grf_xml exists?", grf_xml is not None and grf_xml.exists())
 
-                    if so_xml.exists():
+                    if so_xml is not None and so_xml.exists():
+                        if grf_xml is None or not grf_xml.exists():
+                            self.logger.info("GRF file missing for trial %s; skipping SO.", trial_name)
+                            continue
                         self. _dbg("SO", "Changing cwd to so_xml parent", so_xml.parent)
                         os.chdir(str(so_xml.parent))
                         so_tool = osim.AnalyzeTool(str(so_xml))
@@ -471,14 +586,17 @@ class PipelineEngine:
                                 self. _dbg("SO", "ik_tool is None — coordinates not set from IK")
                                 pass
 
-                            so_tool.printToXML(str(so_xml))
+                            print_to_xml_if_changed(so_tool, so_xml)
+                            so_tool.setExternalLoadsFileName(inputs.enter_context(plain_external_loads(grf_xml)))
                             self. _dbg("SO", "SO tool configured, running...")
 
-                            success = so_tool.run()
+                            success = self._timed_run(so_tool, subject_num, trial_name, "so")
                             self. _dbg("SO", "SO.run() returned", success)
 
                             if not success:
                                 self.logger.error("SO failed for trial %s", trial_name)
+                            else:
+                                self._passes_gate("so", subj_dir, adapted, trial_name, trial_steps)
                         except Exception as exc:
                             self. _dbg("SO", "EXCEPTION during SO", str(exc))
                             self.logger.error("SO exception for trial %s: %s", trial_name, exc)
@@ -491,9 +609,19 @@ class PipelineEngine:
 
             self. _dbg("SUBJECT", f"===== END subject {subject_num} — all trials processed =====")
 
+            if compress:
+                compress_stage_outputs(subj_dir, compress, self.logger)
+
+            if stage is not None:
+                stage.sync_back()
+                stage.cleanup()
+
         finally:
             self. _dbg("SUBJECT", "Restoring original working directory", original_cwd)
             os.chdir(original_cwd)
+            inputs.close()
+            if stage is not None and stage.job_root.exists():
+                self.logger.warning("Scratch copy left for inspection: %s", stage.job_root)
 
         return True
 
@@ -504,10 +632,16 @@ class PipelineEngine:
 
 def _subject_worker(args: tuple) -> tuple:
     """
-    Executed in a spawned child process.
-    Returns (subject_num, success: bool, error_msg: str).
+    Executed in a spawned child process with one compiled manifest entry.
+    Returns (subject_num, success: bool, error_msg: str, gate rows, stage timings);
+    error_msg is run_state.CANCELLED when a cancel stopped the subject.
     """
-    subject_num, template_path_str, root_dir_str, steps, selected_trials, log_level = args
+    job, root_dir_str, steps, log_level, compress, scratch, gates, events, control = args
+    subject_num = job["subject"]
+
+    # A job still queued when the run was cancelled never starts
+    if control is not None and not control.wait_if_paused():
+        return (subject_num, False, CANCELLED, [], [])
 
     # Each worker configures its own logger (no shared state with parent)
     logger = logging.getLogger(f"S{subject_num}")
@@ -526,48 +660,48 @@ def _subject_worker(args: tuple) -> tuple:
     print(f"\n{sep}", flush=True)
     print(f"[WORKER] Process started for subject {subject_num}", flush=True)
     print(f"[WORKER]   PID           : {os.getpid()}", flush=True)
-    print(f"[WORKER]   template_path : {template_path_str}", flush=True)
     print(f"[WORKER]   root_dir      : {root_dir_str}", flush=True)
     print(f"[WORKER]   steps         : {steps}", flush=True)
-    print(f"[WORKER]   selected_trials: {selected_trials or 'all'}", flush=True)
+    print(f"[WORKER]   trials        : {[t['trial'] for t in job['mapped_trials']]}", flush=True)
     print(f"[WORKER]   log_level     : {log_level}", flush=True)
+    print(f"[WORKER]   compress      : {compress or 'none'}", flush=True)
+    print(f"[WORKER]   scratch       : {scratch or '(none)'}", flush=True)
     print(f"{sep}\n", flush=True)
 
+    engine = PipelineEngine(logger, gates, events, control)
     try:
-        print(f"[WORKER] Loading template from: {template_path_str}", flush=True)
-        with open(template_path_str, "r") as fh:
-            template = json.load(fh)
-        print(f"[WORKER] Template loaded OK — keys: {list(template.keys())}", flush=True)
-
-        engine = PipelineEngine(logger)
         print(f"[WORKER] PipelineEngine created, starting run_pipeline_for_subject...", flush=True)
 
         success = engine.run_pipeline_for_subject(
-            subject_num=subject_num,
-            template=template,
+            job=job,
             root_dir=Path(root_dir_str),
             enabled_steps=steps,
-            selected_trials=selected_trials,
+            compress=compress,
+            scratch=scratch,
         )
         print(f"\n[WORKER] run_pipeline_for_subject returned: {success}", flush=True)
-        return (subject_num, success, "")
+        if engine.cancelled:
+            return (subject_num, False, CANCELLED, engine.gate_rows, engine.stage_times)
+        return (subject_num, success, "", engine.gate_rows, engine.stage_times)
 
     except Exception as exc:
         import traceback
         tb = traceback.format_exc()
         print(f"\n[WORKER] UNHANDLED EXCEPTION for subject {subject_num}:\n{tb}", flush=True)
-        return (subject_num, False, str(exc))
+        return (subject_num, False, str(exc), engine.gate_rows, engine.stage_times)
 
 
 # ---------------------------------------------------------------------------
 # Subject discovery
 # ---------------------------------------------------------------------------
 
-def discover_subjects(root_dir: Path) -> List[str]:
+def discover_subjects(root_dir: Path, inventory=None) -> List[str]:
+    """Subject numbers of the Sxx folders in root_dir (from a FileInventory when given)."""
+    candidates = inventory.subdirs() if inventory else [p for p in root_dir.glob("S*") if p.is_dir()]
     subjects = [
         p.name.replace("S", "")
-        for p in sorted(root_dir.glob("S*"))
-        if p.is_dir() and p.name.replace("S", "").isdigit()
+        for p in candidates
+        if p.name.startswith("S") and p.name.replace("S", "").isdigit()
     ]
     return sorted(subjects, key=lambda x: int(x))
 
@@ -576,10 +710,25 @@ def discover_subjects(root_dir: Path) -> List[str]:
 # Runners
 # ---------------------------------------------------------------------------
 
-def run_parallel(jobs: List[tuple], cores: int, logger: logging.Logger) -> List[str]:
+def _log_result(logger: logging.Logger, done: int, total: int, subject_num: str, success: bool,
+                err: str, failed: List[str]) -> None:
+    if success:
+        logger.info("[%d/%d] Subject %s  DONE", done, total, subject_num)
+    elif err == CANCELLED:
+        logger.warning("[%d/%d] Subject %s  CANCELLED", done, total, subject_num)
+    else:
+        logger.error("[%d/%d] Subject %s  FAILED: %s", done, total, subject_num, err)
+        failed.append(subject_num)
+
+
+def run_parallel(jobs: List[tuple], cores: int, logger: logging.Logger, events=None,
+                 control: Optional[RunControl] = None) -> tuple:
     """
     Use 'spawn' multiprocessing context to avoid crashes from fork + OpenSim/Qt state.
     Physical cores are used directly — no thread pool overhead.
+    events: the progress queue also passed in the jobs; gets a subject_end per subject.
+    control: the RunControl also passed in the jobs; a hard cancel terminates the pool.
+    Returns (failed subjects, quality-gate rows, stage timings).
     """
     import multiprocessing as mp
 
@@ -587,36 +736,50 @@ def run_parallel(jobs: List[tuple], cores: int, logger: logging.Logger) -> List[
     total = len(jobs)
     done = 0
     failed: List[str] = []
+    gate_rows: List[dict] = []
+    timings: List[dict] = []
 
     logger.info(
         "Starting parallel run: %d subject(s) across %d physical core(s)", total, cores
     )
 
-    with ctx.Pool(processes=cores) as pool:
-        for subject_num, success, err in pool.imap_unordered(_subject_worker, jobs):
+    with ctx.Pool(processes=cores, initializer=ignore_sigint) as pool:
+        results = pool.imap_unordered(_subject_worker, jobs)
+        while done < total:
+            try:
+                subject_num, success, err, rows, times = results.next(timeout=1.0)
+            except mp.TimeoutError:
+                if control is not None and control.hard:
+                    logger.warning("Terminating %d worker(s); running trials are left incomplete", cores)
+                    pool.terminate()
+                    break
+                continue
             done += 1
-            if success:
-                logger.info("[%d/%d] Subject %s  DONE", done, total, subject_num)
-            else:
-                logger.error("[%d/%d] Subject %s  FAILED: %s", done, total, subject_num, err)
-                failed.append(subject_num)
+            gate_rows.extend(rows)
+            timings.extend(times)
+            if events is not None:
+                events.put(make_event("subject_end", subject_num, ok=success, error=err))
+            _log_result(logger, done, total, subject_num, success, err, failed)
 
-    return failed
+    return failed, gate_rows, timings
 
 
-def run_sequential(jobs: List[tuple], logger: logging.Logger) -> List[str]:
+def run_sequential(jobs: List[tuple], logger: logging.Logger, events=None) -> tuple:
+    """Run the jobs in this process; a cancel stops each remaining job before its next trial."""
     total = len(jobs)
     failed: List[str] = []
+    gate_rows: List[dict] = []
+    timings: List[dict] = []
 
     for idx, job in enumerate(jobs, 1):
-        subject_num, success, err = _subject_worker(job)
-        if success:
-            logger.info("[%d/%d] Subject %s  DONE", idx, total, subject_num)
-        else:
-            logger.error("[%d/%d] Subject %s  FAILED: %s", idx, total, subject_num, err)
-            failed.append(subject_num)
+        subject_num, success, err, rows, times = _subject_worker(job)
+        gate_rows.extend(rows)
+        timings.extend(times)
+        if events is not None:
+            events.put(make_event("subject_end", subject_num, ok=success, error=err))
+        _log_result(logger, idx, total, subject_num, success, err, failed)
 
-    return failed
+    return failed, gate_rows, timings
 
 
 # ---------------------------------------------------------------------------
@@ -629,7 +792,9 @@ def build_parser() -> argparse.ArgumentParser:
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog=__doc__,
     )
-    parser.add_argument("--template", required=True, help="Path to template JSON file")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--template", default="", help="Path to template JSON file")
+    source.add_argument("--manifest", default="", help="Compiled manifest JSON (instead of --template)")
     parser.add_argument(
         "--subjects",
         default="",
@@ -660,6 +825,52 @@ def build_parser() -> argparse.ArgumentParser:
         choices=["DEBUG", "INFO", "WARNING", "ERROR"],
     )
     parser.add_argument("--log-file", default="", help="Optional file path for log output")
+    parser.add_argument(
+        "--catalog",
+        default="",
+        help=f"Results catalog path (default: <root_dir>/{CATALOG_NAME})",
+    )
+    parser.add_argument(
+        "--no-catalog", action="store_true", help="Do not update the results catalog"
+    )
+    parser.add_argument(
+        "--compress-outputs",
+        default="none",
+        choices=["none", "gz", "zst"],
+        help="Compress IK/ID/SO results after each subject (default: none)",
+    )
+    parser.add_argument(
+        "--scratch",
+        default="",
+        help="Local scratch directory; stage inputs there and sync results back on success",
+    )
+    parser.add_argument(
+        "--preflight-report",
+        default="",
+        help=f"Pre-flight go/no-go table (default: <root_dir>/{DEFAULT_REPORT_NAME})",
+    )
+    parser.add_argument(
+        "--no-preflight", action="store_true", help="Skip pre-flight validation of trial inputs"
+    )
+    parser.add_argument(
+        "--gates", default="", help="JSON file overriding the default quality-gate limits"
+    )
+    parser.add_argument(
+        "--no-gates", action="store_true", help="Do not gate downstream steps on IK/ID/SO output quality"
+    )
+    parser.add_argument(
+        "--run-summary",
+        default="",
+        help=f"Quality-gate summary CSV (default: <root_dir>/{DEFAULT_SUMMARY_NAME})",
+    )
+    parser.add_argument(
+        "--run-state",
+        default="",
+        help=f"Per-trial run state JSON (default: <root_dir>/{DEFAULT_STATE_NAME})",
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="Run only the incomplete/pending trials of the last run state"
+    )
     return parser
 
 
@@ -670,8 +881,8 @@ def build_parser() -> argparse.ArgumentParser:
 def main():
     parser = build_parser()
     args = parser.parse_args()
-    if not args.template.strip():
-        print("Error: --template argument is required", file=sys.stderr)
+    if not (args.template.strip() or args.manifest.strip()):
+        print("Error: --template or --manifest argument is required", file=sys.stderr)
         parser.print_help()
         sys.exit(1)
 
@@ -684,7 +895,8 @@ def main():
     print(f"[MAIN]   Python        : {sys.version}", flush=True)
     print(f"[MAIN]   PID           : {os.getpid()}", flush=True)
     print(f"[MAIN]   CWD           : {os.getcwd()}", flush=True)
-    print(f"[MAIN]   --template    : {args.template}", flush=True)
+    print(f"[MAIN]   --template    : {args.template or '(none)'}", flush=True)
+    print(f"[MAIN]   --manifest    : {args.manifest or '(none)'}", flush=True)
     print(f"[MAIN]   --subjects    : {args.subjects or '(auto-discover)'}", flush=True)
     print(f"[MAIN]   --trials      : {args.trials or '(all)'}", flush=True)
     print(f"[MAIN]   --steps       : {args.steps}", flush=True)
@@ -692,10 +904,26 @@ def main():
     print(f"[MAIN]   --cores       : {args.cores or '(auto)'}", flush=True)
     print(f"[MAIN]   --log-level   : {args.log_level}", flush=True)
     print(f"[MAIN]   --log-file    : {log_file or '(none)'}", flush=True)
+    print(f"[MAIN]   --compress-outputs: {args.compress_outputs}", flush=True)
+    print(f"[MAIN]   --scratch     : {args.scratch or '(none)'}", flush=True)
+    print(f"[MAIN]   --no-preflight: {args.no_preflight}", flush=True)
+    print(f"[MAIN]   --gates       : {'off' if args.no_gates else args.gates or '(defaults)'}", flush=True)
     print(f"{sep}\n", flush=True)
 
-    # Load template
-    template_path = Path(args.template)
+    if args.compress_outputs == "zst" and zstandard is None:
+        logger.error("--compress-outputs zst requires the 'zstandard' package")
+        sys.exit(1)
+
+    gates = None
+    if not args.no_gates:
+        try:
+            gates = load_gates(args.gates or None)
+        except (OSError, ValueError) as exc:
+            logger.error("Quality gates: %s", exc)
+            sys.exit(1)
+
+    # Load template (or an already compiled manifest)
+    template_path = Path(args.template or args.manifest)
     print(f"[MAIN] Checking template path: {template_path}", flush=True)
     print(f"[MAIN] Template file exists? {template_path.is_file()}", flush=True)
 
@@ -703,9 +931,19 @@ def main():
         logger.error("Template file not found: %s", template_path)
         sys.exit(1)
 
-    with open(template_path, "r") as fh:
-        template = json.load(fh)
-    print(f"[MAIN] Template loaded OK — keys: {list(template.keys())}", flush=True)
+    compiled: Optional[dict] = None
+    if args.manifest:
+        try:
+            compiled = load_manifest(template_path)
+        except ValueError as exc:
+            logger.error("%s", exc)
+            sys.exit(1)
+        template = {"root_dir": compiled.get("root_dir", "")}
+        print(f"[MAIN] Manifest loaded OK — {len(compiled['subjects'])} subject(s)", flush=True)
+    else:
+        with open(template_path, "r") as fh:
+            template = json.load(fh)
+        print(f"[MAIN] Template loaded OK — keys: {list(template.keys())}", flush=True)
 
     root_dir_str = template.get("root_dir", "")
     print(f"[MAIN] root_dir from template: {root_dir_str!r}", flush=True)
@@ -722,12 +960,21 @@ def main():
         logger.error("root_dir does not exist: %s", root_dir)
         sys.exit(1)
 
+    if args.scratch:
+        Path(args.scratch).mkdir(parents=True, exist_ok=True)
+
+    # One indexed listing of the dataset serves discovery and pre-flight
+    inventory = FileInventory.open(root_dir, logger=logger)
+
     # Resolve subjects
     if args.subjects.strip():
         subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()]
         print(f"[MAIN] Subjects from --subjects arg: {subjects}", flush=True)
+    elif compiled is not None:
+        subjects = [e["subject"] for e in compiled["subjects"]]
+        print(f"[MAIN] Subjects from manifest: {subjects}", flush=True)
     else:
-        subjects = discover_subjects(root_dir)
+        subjects = discover_subjects(root_dir, inventory)
         print(f"[MAIN] Auto-discovered subjects: {subjects}", flush=True)
         logger.info("Auto-discovered subjects: %s", subjects)
 
@@ -760,34 +1007,163 @@ def main():
     logger.info("Steps     : %s", active_steps)
     logger.info("Parallel  : %s", args.parallel)
 
+    # Compile the template once; workers only ever see their own manifest entry
+    if compiled is not None:
+        missing = [s for s in subjects if s not in {e["subject"] for e in compiled["subjects"]}]
+        if missing:
+            logger.warning("Subject(s) %s not in manifest; skipped", missing)
+        manifest = dict(compiled)
+        manifest["subjects"] = [
+            restrict_trials(e, selected_trials) if selected_trials else e
+            for e in compiled["subjects"] if e["subject"] in subjects
+        ]
+        subjects = [e["subject"] for e in manifest["subjects"]]
+        if not subjects:
+            logger.error("No subjects found. Exiting.")
+            sys.exit(1)
+    else:
+        try:
+            manifest = compile_manifest(template, subjects, selected_trials)
+        except ValueError as exc:
+            logger.error("%s", exc)
+            sys.exit(1)
+    entries = manifest["subjects"]
+    print(f"[MAIN] Manifest compiled: {sum(len(e['mapped_trials']) for e in entries)} trial job(s)",
+          flush=True)
+
+    state_path = Path(args.run_state) if args.run_state else root_dir / DEFAULT_STATE_NAME
+    state: Optional[dict] = None
+    if args.resume:
+        try:
+            state = load_state(state_path)
+        except (OSError, ValueError) as exc:
+            logger.error("Cannot resume, no readable run state at %s: %s", state_path, exc)
+            sys.exit(1)
+        todo = resume_trials(state)
+        entries = [restrict_trials(e, todo[e["subject"]]) for e in entries if e["subject"] in todo]
+        entries = [e for e in entries if e["mapped_trials"]]
+        subjects = [e["subject"] for e in entries]
+        logger.info("Resuming run %s: %d trial(s) of %d subject(s) left",
+                    state.get("run_id", "?"), sum(len(e["mapped_trials"]) for e in entries), len(entries))
+        if not entries:
+            logger.info("Nothing left to resume.")
+            return
+
+    # Pre-flight: validate every trial's inputs so blocked steps never reach the solvers
+    if not args.no_preflight and any(steps[s] for s in ("ik", "id", "so")):
+        # Only the trials this run will start (on --resume, the unfinished ones)
+        checks = build_jobs({"subjects": entries}, steps, inventory)
+        check_cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+        rows = preflight_all(checks, cores=check_cores if args.parallel else 1, logger=logger)
+        report = Path(args.preflight_report) if args.preflight_report else root_dir / DEFAULT_REPORT_NAME
+        write_report(rows, report)
+        cleared = go_trials(rows)
+        partial = sum(1 for r in rows if r["decision"] == "partial")
+        logger.info("Pre-flight: %d/%d trial(s) cleared (%d with steps skipped); report written to %s",
+                    sum(len(t) for t in cleared.values()), len(rows), partial, report)
+
+        dropped = [s for s in subjects if s not in cleared]
+        if dropped:
+            logger.warning("No trial passed pre-flight for subject(s) %s; not running them", dropped)
+        subjects = [s for s in subjects if s in cleared]
+        entries = cleared_entries(entries, rows)
+        if not subjects:
+            logger.error("Every trial failed pre-flight (see %s). Exiting.", report)
+            sys.exit(1)
+
+    # Progress events and pause/cancel flags reach spawned workers through a Manager
+    parallel = args.parallel and len(entries) > 1
+    manager = None
+    if parallel:
+        manager = start_manager()
+        events = manager.Queue()
+    else:
+        import queue
+        events = queue.Queue()
+    control = RunControl(manager)
+
     # Build job list
     jobs = [
-        (s, str(template_path), str(root_dir), steps, selected_trials, args.log_level)
-        for s in subjects
+        (entry, str(root_dir), steps, args.log_level,
+         None if args.compress_outputs == "none" else args.compress_outputs,
+         args.scratch or None, gates, events, control)
+        for entry in entries
     ]
     print(f"[MAIN] Total jobs to run: {len(jobs)}", flush=True)
     for j in jobs:
-        print(f"[MAIN]   job -> subject={j[0]}  template={j[1]}", flush=True)
+        print(f"[MAIN]   job -> subject={j[0]['subject']}  trials={[t['trial'] for t in j[0]['mapped_trials']]}",
+              flush=True)
 
     # Run
+    run_id = time.strftime("%Y%m%d-%H%M%S")
+    logger.info("Run id    : %s", run_id)
     t0 = time.monotonic()
 
-    if args.parallel and len(jobs) > 1:
-        cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
-        cores = min(cores, len(jobs))
-        print(f"\n[MAIN] Parallel mode — physical cores available: {physical_core_count()}", flush=True)
-        print(f"[MAIN] Using {cores} core(s) for {len(jobs)} subject(s)", flush=True)
-        failed = run_parallel(jobs, cores, logger)
-    else:
-        if args.parallel:
-            logger.info("Only one subject; running sequentially.")
-        print(f"\n[MAIN] Sequential mode", flush=True)
-        failed = run_sequential(jobs, logger)
+    cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+    cores = min(cores, len(jobs)) if parallel else 1
+    monitor = RunMonitor({e["subject"]: [t["trial"] for t in e["mapped_trials"]] for e in entries},
+                         steps, workers=cores)
+    previous_sigint = install_sigint(control, logger, raise_on_hard=not parallel)
+    failed: List[str] = []
+    gate_rows: List[dict] = []
+    timings: List[dict] = []
+    status = "interrupted"
+    try:
+        if parallel:
+            print(f"\n[MAIN] Parallel mode — physical cores available: {physical_core_count()}", flush=True)
+            print(f"[MAIN] Using {cores} core(s) for {len(jobs)} subject(s)", flush=True)
+            failed, gate_rows, timings = run_parallel(jobs, cores, logger, events, control)
+        else:
+            if args.parallel:
+                logger.info("Only one subject; running sequentially.")
+            print(f"\n[MAIN] Sequential mode", flush=True)
+            failed, gate_rows, timings = run_sequential(jobs, logger, events)
+        status = "cancelled" if control.cancelled else "completed"
+    except KeyboardInterrupt:
+        logger.warning("Run interrupted")
+    finally:
+        signal.signal(signal.SIGINT, previous_sigint)
+        monitor.update(events)
+        try:
+            write_state(state_path, build_state(run_id, status, steps, monitor.trial_states(), state))
+            logger.info("Run state (%s) written to %s", status, state_path)
+        except OSError as exc:
+            logger.error("Could not write run state: %s", exc)
+        if manager is not None:
+            manager.shutdown()
 
     elapsed = time.monotonic() - t0
     logger.info("Finished in %.1f s", elapsed)
     print(f"\n[MAIN] Total elapsed time: {elapsed:.1f} s", flush=True)
 
+    # Stage durations feed the ETA of later runs (run_monitor.py)
+    try:
+        record_timings(root_dir / DEFAULT_TIMINGS_NAME, timings)
+    except OSError as exc:
+        logger.warning("Could not record stage timings: %s", exc)
+
+    if gates:
+        summary = Path(args.run_summary) if args.run_summary else root_dir / DEFAULT_SUMMARY_NAME
+        write_summary(gate_rows, summary, run_id)
+        log_summary(gate_rows, logger)
+        logger.info("Run summary written to %s", summary)
+
+    # Index whatever this run produced (also records partial output of failed subjects)
+    if not args.no_catalog:
+        try:
+            update_catalog(
+                root_dir,
+                Path(args.catalog) if args.catalog else root_dir / CATALOG_NAME,
+                run_id=run_id,
+                subjects=subjects,
+                logger=logger,
+            )
+        except Exception as exc:
+            logger.error("Results catalog update failed: %s", exc)
+
+    if status != "completed":
+        logger.warning("Run %s; continue it with --resume", status)
+        sys.exit(1)
     if failed:
         logger.error("Failed subjects: %s", failed)
         print(f"[MAIN] FAILED subjects: {failed}", flush=True)
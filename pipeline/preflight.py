@@ -0,0 +1,474 @@
+"""
+Pre-flight validation of every (subject, trial) job before any solver runs.
+
+Each trial's inputs are checked from file headers plus one vectorized scan of
+the marker and GRF data, in a spawn-context process pool:
+
+    markers   every marker the IKTaskSet applies is labelled in the TRC, and
+              none of them is missing (NaN or 0,0,0) for more than
+              MAX_GAP_FRACTION of the frames
+    timing    the TRC and GRF files hold as many rows as their headers claim,
+              the GRF rate is a whole multiple of the marker rate and the
+              GRF covers the marker time range
+    grf       every force/point/torque column the ExternalLoads XML refers to
+              exists in the .mot (or, before the XML is generated, every
+              force plate in the .mot is complete)
+    files     model, setup XMLs (or a target the engine renders them to) and
+              the SO actuator set exist
+
+Only the checks needed by the enabled steps run.  An error blocks the step
+it belongs to and the steps that need its outputs: marker/IK problems block
+IK, ID and SO, GRF problems ID and SO, SO setup/actuator problems only SO.
+A trial is 'go' when none of its enabled steps is blocked, 'partial' when
+some still run (the others are listed in skip_steps) and 'no-go' when none
+does; warnings never block.  pipeline_cli runs this before building its job
+list, so blocked steps never reach the solver pool, and writes the table to
+<root_dir>/preflight.csv:
+
+    subject,trial,decision,skip_steps,errors,warnings,trc_rate,grf_rate,...
+    S01,stw1,go,,,,200.0,1000.0,...
+    S01,stw2,partial,so,SO setup not found: ...,,200.0,1000.0,...
+    S02,stw3,no-go,ik id so,missing markers: LFMT5; GRF ends 0.412 s before markers,,...
+
+Usage:
+    python preflight.py --template path/to/template.json [--subjects 01,02] [--trials stw1]
+                        [--steps ik,id,so] [--cores N] [--out preflight.csv]
+"""
+
+import sys
+import csv
+import logging
+import argparse
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from batch_runner import run_jobs
+from generate_setup_files import ACTUATORS_SRC
+from manifest import TRIAL_FIELDS, restrict_trials
+from opensim_io import read_storage, read_trc, resolve_path
+
+
+DEFAULT_REPORT_NAME = "preflight.csv"
+
+# Largest share of frames a required marker may be missing before IK is refused
+MAX_GAP_FRACTION = 0.10
+# Markers missing in more frames than this are reported as a warning
+WARN_GAP_FRACTION = 0.01
+# Allowed shortfall of the GRF time range against the marker time range
+MAX_DURATION_GAP_S = 0.05
+
+ACTUATORS_NAME = "cmc_actuators.xml"
+
+SOLVER_STEPS = ("ik", "id", "so")
+
+PREFLIGHT_FIELDS = [
+    "subject", "trial", "decision", "skip_steps", "errors", "warnings",
+    "trc_rate", "grf_rate", "trc_duration", "grf_duration",
+    "missing_markers", "worst_marker", "worst_gap",
+]
+
+
+# ---------------------------------------------------------------------------
+# Setup file parsing
+# ---------------------------------------------------------------------------
+
+def ik_task_markers(ik_xml: Path) -> List[str]:
+    """Names of the IKMarkerTasks an IK setup applies (apply defaults to true)."""
+    root = ET.parse(str(ik_xml)).getroot()
+    markers = []
+    for task in root.iter("IKMarkerTask"):
+        apply = (task.findtext("apply") or "true").strip().lower()
+        if apply == "true":
+            markers.append(task.get("name", ""))
+    return markers
+
+
+def external_load_columns(grf_xml: Path) -> tuple:
+    """
+    GRF columns an ExternalLoads XML refers to, and its datafile.
+
+    OpenSim appends x/y/z to each identifier, so 'ground_force_2_v' needs
+    ground_force_2_vx/vy/vz.
+
+    Returns:
+        (column names, datafile path or None)
+    """
+    root = ET.parse(str(grf_xml)).getroot()
+    columns = []
+    for force in root.iter("ExternalForce"):
+        for tag in ("force_identifier", "point_identifier", "torque_identifier"):
+            ident = (force.findtext(tag) or "").strip()
+            if ident:
+                columns += [ident + axis for axis in "xyz"]
+    datafile = (root.findtext(".//datafile") or "").strip()
+    if not datafile or datafile.lower() == "unassigned":
+        return columns, None
+    path = Path(datafile)
+    return columns, path if path.is_absolute() else grf_xml.parent / path
+
+
+def plate_columns(columns: Sequence[str]) -> List[str]:
+    """Every column grf_setup may refer to for the force plates present in a .mot."""
+    from leg_assignment import plate_ids
+
+    needed = []
+    for plate in plate_ids(columns):
+        for ident in (f"ground_force_{plate}_v", f"ground_force_{plate}_p", f"ground_moment_{plate}_m"):
+            needed += [ident + axis for axis in "xyz"]
+    return needed
+
+
+def actuator_files(so_xml: Path) -> List[Path]:
+    """force_set_files of an SO setup, resolved against the setup's folder."""
+    root = ET.parse(str(so_xml)).getroot()
+    names = " ".join(e.text or "" for e in root.iter("force_set_files")).split()
+    return [Path(n) if Path(n).is_absolute() else so_xml.parent / n for n in names]
+
+
+# ---------------------------------------------------------------------------
+# Data scans
+# ---------------------------------------------------------------------------
+
+def gap_fractions(xyz: np.ndarray) -> np.ndarray:
+    """Share of frames each marker is missing (any NaN, or exactly 0,0,0): (markers,)."""
+    missing = np.isnan(xyz).any(axis=2) | (xyz == 0.0).all(axis=2)
+    return missing.mean(axis=0) if len(xyz) else np.ones(xyz.shape[1])
+
+
+def _exists(path_str: str, present: Optional[Dict[str, bool]] = None) -> bool:
+    """True if the file, or a compressed copy of it, exists (looked up in `present` first)."""
+    if present is not None and path_str in present:
+        return present[path_str]
+    return bool(path_str) and resolve_path(path_str).is_file()
+
+
+def _rows_short(header: Dict[str, str], key: str, n_rows: int) -> Optional[int]:
+    """Rows missing against the header's count, or None when the header has none."""
+    try:
+        expected = int(float(header.get(key, "")))
+    except ValueError:
+        return None
+    return expected - n_rows if n_rows < expected else None
+
+
+# ---------------------------------------------------------------------------
+# Checks
+# ---------------------------------------------------------------------------
+
+def check_trial(args: tuple) -> dict:
+    """
+    Validate one trial's inputs for the enabled steps, blocking per step.
+
+    Args (tuple, for process pools):
+        subject_num, manifest trial dict, model path, subject dir, steps dict,
+        and optionally {path: exists} precomputed from a FileInventory
+
+    Returns:
+        row dict with PREFLIGHT_FIELDS ('decision' is 'go', 'partial' or
+        'no-go'; 'skip_steps' lists the enabled steps that must not run)
+    """
+    subject_num, trial, model, subj_dir_str, steps = args[:5]
+    present = args[5] if len(args) > 5 else None
+    exists = lambda p: _exists(p, present)
+    trc_str = trial.get("trial_trc", "")
+    row = {field: "" for field in PREFLIGHT_FIELDS}
+    row.update(subject=f"S{subject_num}", trial=trial.get("trial") or Path(trc_str).stem)
+    errors: List[str] = []
+    warnings: List[str] = []
+    blocked = set()
+
+    def fail(message: str, *blocks: str) -> None:
+        errors.append(message)
+        blocked.update(blocks)
+
+    try:
+        needs_ik = steps.get("ik", True)
+        needs_grf = steps.get("id", True) or steps.get("so", True)
+
+        # ---- files ---------------------------------------------------
+        if not (model and exists(model)) and not steps.get("scale", True):
+            fail(f"model not found: {model or '(not set)'}", *SOLVER_STEPS)
+        if not exists(trc_str):
+            fail(f"TRC not found: {trc_str or '(not set)'}", *SOLVER_STEPS)
+
+        ik_xml = Path(trial.get("ik_xml", ""))
+        has_ik_xml = exists(trial.get("ik_xml", ""))
+        # Missing IK/ID/SO setups with a target path are rendered by the engine before the trial runs
+        if needs_ik and not has_ik_xml:
+            if trial.get("ik_xml"):
+                warnings.append("IK setup not found; it is rendered at run time (marker checks skipped)")
+            else:
+                fail("IK setup not found: (not set)", *SOLVER_STEPS)
+        if steps.get("id", True) and not exists(trial.get("id_xml", "")):
+            warnings.append("ID setup not found; it is rendered at run time" if trial.get("id_xml")
+                            else "ID setup not set; a default InverseDynamicsTool will be used")
+
+        if steps.get("so", True):
+            so_str = trial.get("so_xml", "")
+            if not so_str:
+                fail("SO setup not found: (not set)", "so")
+            else:
+                # A rendered SO setup uses the subject's SO/cmc_actuators.xml
+                default_actuators = [Path(subj_dir_str) / "SO" / ACTUATORS_NAME]
+                if exists(so_str):
+                    actuators = actuator_files(Path(so_str)) or default_actuators
+                else:
+                    warnings.append("SO setup not found; it is rendered at run time")
+                    actuators = default_actuators
+                missing = [p for p in actuators if not exists(str(p))]
+                # The engine copies cmc_actuators.xml into the subject's SO folder before SO runs
+                copied = [p for p in missing if p.name == ACTUATORS_NAME and ACTUATORS_SRC.exists()]
+                if copied:
+                    warnings.append(f"{ACTUATORS_NAME} not found; it is copied from {ACTUATORS_SRC} at run time")
+                missing = [p.name for p in missing if p not in copied]
+                if missing:
+                    fail(f"actuator file(s) not found: {', '.join(missing)}", "so")
+
+        # ---- markers -------------------------------------------------
+        markers = None
+        if exists(trc_str):
+            markers = read_trc(trc_str)
+            duration = float(markers.time[-1] - markers.time[0]) if len(markers.time) else 0.0
+            row.update(trc_rate=markers.rate, trc_duration=round(duration, 4))
+
+            short = _rows_short(markers.header, "NumFrames", len(markers.time))
+            if short:
+                fail(f"TRC truncated: {short} frame(s) short of NumFrames", *SOLVER_STEPS)
+
+            if needs_ik and has_ik_xml:
+                required = ik_task_markers(ik_xml)
+                absent = [m for m in required if m not in markers.labels]
+                if absent:
+                    row["missing_markers"] = " ".join(absent)
+                    fail(f"missing markers: {', '.join(absent)}", *SOLVER_STEPS)
+
+                labelled = [m for m in required if m in markers.labels]
+                if labelled:
+                    idx = [markers.labels.index(m) for m in labelled]
+                    gaps = gap_fractions(markers.xyz[:, idx, :])
+                    worst = int(np.argmax(gaps))
+                    row.update(worst_marker=labelled[worst], worst_gap=round(float(gaps[worst]), 4))
+                    bad = [f"{m} {g:.0%}" for m, g in zip(labelled, gaps) if g > MAX_GAP_FRACTION]
+                    thin = [f"{m} {g:.1%}" for m, g in zip(labelled, gaps)
+                            if WARN_GAP_FRACTION < g <= MAX_GAP_FRACTION]
+                    if bad:
+                        fail(f"marker gaps: {', '.join(bad)}", *SOLVER_STEPS)
+                    if thin:
+                        warnings.append(f"marker gaps: {', '.join(thin)}")
+
+        # ---- GRF -----------------------------------------------------
+        if needs_grf:
+            grf_xml = Path(trial.get("grf_xml", ""))
+            referenced, datafile = (
+                external_load_columns(grf_xml) if exists(trial.get("grf_xml", "")) else ([], None)
+            )
+            mot_str = trial.get("trial_mot", "") or (str(datafile) if datafile else "")
+
+            if not exists(mot_str):
+                fail(f"GRF data not found: {mot_str or '(not set)'}", "id", "so")
+            else:
+                grf = read_storage(mot_str)
+                grf_duration = float(grf.time[-1] - grf.time[0]) if len(grf.time) else 0.0
+                row.update(grf_rate=round(grf.rate, 3), grf_duration=round(grf_duration, 4))
+
+                short = _rows_short(grf.header, "nRows", len(grf.time))
+                if short:
+                    fail(f"GRF truncated: {short} row(s) short of nRows", "id", "so")
+
+                needed = referenced or plate_columns(grf.columns)
+                if not needed:
+                    fail("no force plate columns in GRF data", "id", "so")
+                absent = [c for c in needed if c not in grf.columns]
+                if absent:
+                    fail(f"GRF columns not found: {', '.join(absent)}", "id", "so")
+
+                if markers is not None and len(markers.time) and len(grf.time):
+                    if markers.rate > 0 and grf.rate > 0:
+                        ratio = grf.rate / markers.rate
+                        if ratio < 1.0 - 1e-3:
+                            fail(f"GRF rate {grf.rate:.1f} Hz below marker rate {markers.rate:.1f} Hz", "id", "so")
+                        elif abs(ratio - round(ratio)) > 1e-3:
+                            warnings.append(f"GRF rate {grf.rate:.1f} Hz is not a multiple of "
+                                            f"marker rate {markers.rate:.1f} Hz")
+                    early = grf.time[0] - markers.time[0]
+                    late = markers.time[-1] - grf.time[-1]
+                    if early > MAX_DURATION_GAP_S:
+                        fail(f"GRF starts {early:.3f} s after markers", "id", "so")
+                    if late > MAX_DURATION_GAP_S:
+                        fail(f"GRF ends {late:.3f} s before markers", "id", "so")
+
+    except Exception as exc:
+        fail(f"pre-flight check failed: {exc}", *SOLVER_STEPS)
+
+    enabled = [step for step in SOLVER_STEPS if steps.get(step, True)]
+    skip = [step for step in enabled if step in blocked]
+    row["errors"] = "; ".join(errors)
+    row["warnings"] = "; ".join(warnings)
+    row["skip_steps"] = " ".join(skip)
+    if not skip:
+        row["decision"] = "go"
+    else:
+        row["decision"] = "partial" if len(skip) < len(enabled) else "no-go"
+    return row
+
+
+# ---------------------------------------------------------------------------
+# Batch
+# ---------------------------------------------------------------------------
+
+def build_jobs(manifest: dict, steps: Dict[str, bool], inventory=None) -> List[tuple]:
+    """
+    One check_trial job per trial of a compiled manifest (see manifest.py).
+
+    With a file_inventory.FileInventory, file existence is looked up once
+    in the parent instead of stat'ed by every worker.
+    """
+    jobs = []
+    for entry in manifest["subjects"]:
+        model = entry.get("model") or ""
+        for trial in entry["mapped_trials"]:
+            job = (entry["subject"], trial, model, entry["subj_dir"], steps)
+            if inventory is not None:
+                paths = [model, str(Path(entry["subj_dir"]) / "SO" / ACTUATORS_NAME)]
+                paths += [v for k, v in trial.items() if k in TRIAL_FIELDS]
+                job += ({p: inventory.exists(inventory.resolve(p)) for p in paths if p},)
+            jobs.append(job)
+    return jobs
+
+
+def preflight_all(
+    jobs: List[tuple],
+    cores: int = 1,
+    logger: Optional[logging.Logger] = None,
+) -> List[dict]:
+    """Run check_trial for every job, in a spawn-context process pool when cores > 1."""
+    return run_jobs(check_trial, jobs, cores, _log_row, logger or logging.getLogger("preflight"),
+                    key=lambda r: (r["subject"], r["trial"]))
+
+
+def _log_row(logger: logging.Logger, done: int, total: int, row: dict) -> None:
+    if row["decision"] == "go":
+        logger.info("[%d/%d] %s %s  go%s", done, total, row["subject"], row["trial"],
+                    f"  ({row['warnings']})" if row["warnings"] else "")
+    elif row["decision"] == "partial":
+        logger.warning("[%d/%d] %s %s  go without %s: %s", done, total, row["subject"], row["trial"],
+                       row["skip_steps"].upper(), row["errors"])
+    else:
+        logger.error("[%d/%d] %s %s  NO-GO: %s", done, total, row["subject"], row["trial"], row["errors"])
+
+
+def go_trials(rows: List[dict]) -> Dict[str, List[str]]:
+    """Subject number -> trials cleared to run (go or partial); subjects with none are left out."""
+    cleared: Dict[str, List[str]] = {}
+    for row in rows:
+        if row["decision"] != "no-go":
+            cleared.setdefault(row["subject"][1:], []).append(row["trial"])
+    return cleared
+
+
+def cleared_entries(entries: List[dict], rows: List[dict]) -> List[dict]:
+    """
+    Manifest entries restricted to their cleared trials.  The trial dict of
+    a partial trial gets "skip_steps", the steps the engine must not run.
+    """
+    cleared = go_trials(rows)
+    skips = {(row["subject"][1:], row["trial"]): row["skip_steps"].split()
+             for row in rows if row["skip_steps"]}
+    out = []
+    for entry in entries:
+        if entry["subject"] not in cleared:
+            continue
+        entry = restrict_trials(entry, cleared[entry["subject"]])
+        trials = []
+        for t in entry["mapped_trials"]:
+            key = (entry["subject"], t["trial"])
+            trials.append(dict(t, skip_steps=skips[key]) if key in skips else t)
+        entry["mapped_trials"] = trials
+        out.append(entry)
+    return out
+
+
+def write_report(rows: List[dict], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=PREFLIGHT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Pre-flight validation of pipeline inputs (go/no-go table)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--template", required=True, help="Path to template JSON file")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--trials", default="", help="Comma-separated trial names (default: all)")
+    parser.add_argument("--steps", default="scale,ik,id,so", help="Steps the run will enable")
+    parser.add_argument("--cores", type=int, default=0, help="Worker processes (default: physical_cores - 1)")
+    parser.add_argument("--out", default="", help=f"Report CSV (default: <root_dir>/{DEFAULT_REPORT_NAME})")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from file_inventory import FileInventory
+    from manifest import compile_manifest, load_template
+    from pipeline_cli import discover_subjects, physical_core_count, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    template_path = Path(args.template)
+    if not template_path.is_file():
+        logger.error("Template file not found: %s", template_path)
+        sys.exit(1)
+    template = load_template(template_path)
+    root_dir = Path(template.get("root_dir") or "")
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    inventory = FileInventory.open(root_dir, logger=logger)
+    subjects = ([s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()]
+                or discover_subjects(root_dir, inventory))
+    trials = [t.strip() for t in args.trials.split(",") if t.strip()] or None
+    requested = {s.strip().lower() for s in args.steps.split(",") if s.strip()}
+    steps = {s: (s in requested) for s in ("scale", "ik", "id", "so")}
+
+    try:
+        jobs = build_jobs(compile_manifest(template, subjects, trials), steps, inventory)
+    except ValueError as exc:
+        logger.error("%s", exc)
+        sys.exit(1)
+    if not jobs:
+        logger.error("No trials to check")
+        sys.exit(1)
+
+    cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+    t0 = time.monotonic()
+    rows = preflight_all(jobs, cores=cores, logger=logger)
+    out_path = Path(args.out or root_dir / DEFAULT_REPORT_NAME)
+    write_report(rows, out_path)
+
+    no_go = [r for r in rows if r["decision"] != "go"]
+    partial = [r for r in no_go if r["decision"] == "partial"]
+    logger.info("%d/%d trial(s) go, %d partial; report written to %s in %.1f s",
+                len(rows) - len(no_go), len(rows), len(partial), out_path, time.monotonic() - t0)
+    if no_go:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # Required on Windows with frozen/spawn executables
+    main()
@@ -0,0 +1,360 @@
+"""
+Quality gates between pipeline stages.
+
+A bad IK solution (large marker errors, a flipped pelvis) used to flow on
+into ID and the expensive SO, and only showed up later in the plots.  After
+each stage the engine now checks the stage output of the trial; a trial that
+fails a gate skips its remaining stages and is recorded in the run summary.
+
+    ik   *_ik_marker_errors.sto    mean per-frame marker RMS, peak marker error (m)
+         ik_output_*.mot           |pelvis_tilt / list| (deg) and the largest frame-to-frame
+                                   jump of pelvis_rotation (deg) - a flip shows as ~180.
+                                   The heading itself is not limited: trials walking
+                                   along -X sit at about +-180
+    id   id_output_*.sto           RMS pelvis residual forces (x body weight) and
+                                   moments (x body weight x height); needs the
+                                   subject's mass/height (manifest "details")
+    so   *_StaticOptimization_activation.sto
+                                   fraction of muscle-frames at or above the
+                                   saturation level (the reserve and residual
+                                   actuators of SO/cmc_actuators.xml are not muscles)
+
+Every check is one vectorised expression over the parsed output.  Limits come
+from DEFAULT_GATES, overridden per key by a JSON file:
+
+    {"ik": {"rms_mean": 0.015}, "id": {"force_rms_bw": null}, "so": {"saturation_fraction": 0.1}}
+
+A null limit disables that check.  A check whose input is missing (no errors
+file, no body mass) is noted but does not fail the trial.  A gate that cannot
+be evaluated at all (unreadable output) is recorded with gate "error" and
+does not block the remaining stages either: the stage itself succeeded, only
+its check is unknown.
+
+Usage:
+    python quality_gates.py --root D:/RESEARCH/STW_dataset/Extracted [--subjects 01,02] [--gates gates.json]
+                            [--out run_summary.csv]
+"""
+
+import sys
+import csv
+import json
+import logging
+import argparse
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from cohort_store import find_dir, trial_from_filename
+from opensim_io import PathLike, Storage, plain_name, read_storage
+from preflight import ACTUATORS_NAME
+from results_catalog import ARTIFACT_DIRS
+
+
+GRAVITY = 9.80665
+
+STAGE_ORDER = ("ik", "id", "so")
+
+DEFAULT_GATES: Dict[str, Dict[str, Optional[float]]] = {
+    "ik": {
+        "rms_mean": 0.02,            # m, mean of the per-frame marker RMS
+        "max_error": 0.08,           # m, largest marker error in any frame
+        "pelvis_angle_deg": 90.0,    # |pelvis tilt/list| in any frame
+        "heading_jump_deg": 45.0,    # pelvis_rotation change between consecutive frames
+    },
+    "id": {
+        "force_rms_bw": 0.05,        # RMS pelvis residual force / body weight
+        "moment_rms_bwh": 0.01,      # RMS pelvis residual moment / (body weight x height)
+    },
+    "so": {
+        "saturation_level": 0.99,    # activation counted as saturated
+        "saturation_fraction": 0.05, # largest allowed share of saturated muscle-frames
+    },
+}
+
+# stage -> filename glob of the output each gate reads (in the stage's ARTIFACT_DIRS folder)
+GATE_OUTPUTS = {
+    "ik_errors": ("ik", "*_ik_marker_errors.sto"),
+    "ik_motion": ("ik", "ik_output_*.mot"),
+    "id": ("id", "id_output_*.sto"),
+    "so": ("so", "*_StaticOptimization_activation.sto"),
+}
+
+PELVIS_ANGLES = ("pelvis_tilt", "pelvis_list")
+PELVIS_HEADING = "pelvis_rotation"
+PELVIS_FORCES = ("pelvis_tx_force", "pelvis_ty_force", "pelvis_tz_force")
+PELVIS_MOMENTS = ("pelvis_tilt_moment", "pelvis_list_moment", "pelvis_rotation_moment")
+
+DEFAULT_SUMMARY_NAME = "run_summary.csv"
+SUMMARY_FIELDS = ["run_id", "subject", "trial", "stage", "gate", "skipped", "reasons", "metrics"]
+
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+def load_gates(path: Optional[PathLike] = None) -> Dict[str, Dict[str, Optional[float]]]:
+    """
+    DEFAULT_GATES overridden by a JSON file.
+
+    Raises:
+        ValueError: unknown stage or limit in the file
+    """
+    gates = {stage: dict(limits) for stage, limits in DEFAULT_GATES.items()}
+    if not path:
+        return gates
+    overrides = json.loads(Path(path).read_text(encoding="utf-8"))
+    for stage, limits in overrides.items():
+        if stage not in gates:
+            raise ValueError(f"Unknown gate stage '{stage}' (known: {', '.join(gates)})")
+        unknown = set(limits) - set(gates[stage])
+        if unknown:
+            raise ValueError(f"Unknown {stage} gate limit(s): {sorted(unknown)}")
+        gates[stage].update(limits)
+    return gates
+
+
+def downstream(stage: str, enabled_steps: Dict[str, bool]) -> List[str]:
+    """Enabled stages after `stage`."""
+    return [s for s in STAGE_ORDER[STAGE_ORDER.index(stage) + 1:] if enabled_steps.get(s, True)]
+
+
+# ---------------------------------------------------------------------------
+# Stage outputs
+# ---------------------------------------------------------------------------
+
+def latest_output(subj_dir: PathLike, kind: str, trial: str) -> Optional[Path]:
+    """Most recently written output of a kind (GATE_OUTPUTS) for one trial, if any."""
+    stage, pattern = GATE_OUTPUTS[kind]
+    out_dir = find_dir(Path(subj_dir), ARTIFACT_DIRS[stage])
+    if out_dir is None:
+        return None
+    matches = [
+        p for p in out_dir.glob(pattern + "*")
+        if plain_name(p).match(pattern) and trial_from_filename(plain_name(p).name) == trial
+    ]
+    return max(matches, key=lambda p: p.stat().st_mtime) if matches else None
+
+
+def force_set_names(path: PathLike) -> List[str]:
+    """Names of the actuators in an OpenSim ForceSet file."""
+    objects = ET.parse(str(path)).getroot().find(".//objects")
+    return [e.get("name") for e in objects if e.get("name")] if objects is not None else []
+
+
+def _rms(block: np.ndarray) -> np.ndarray:
+    return np.sqrt(np.mean(block ** 2, axis=0))
+
+
+# ---------------------------------------------------------------------------
+# Gates
+# ---------------------------------------------------------------------------
+
+def check_ik(errors: Optional[Storage], motion: Optional[Storage], limits: Dict[str, Optional[float]]) -> dict:
+    metrics, reasons, notes = {}, [], []
+    if errors is not None:
+        metrics["rms_mean"] = float(np.mean(errors.column("marker_error_RMS")))
+        metrics["max_error"] = float(np.max(errors.column("marker_error_max")))
+    else:
+        notes.append("no marker errors file")
+    if motion is not None:
+        in_radians = motion.header.get("inDegrees", "yes").lower() == "no"
+        cols = [c for c in PELVIS_ANGLES if c in motion.columns]
+        if cols:
+            angles = np.abs(motion.block(cols))
+            if in_radians:
+                angles = np.degrees(angles)
+            metrics["pelvis_angle_deg"] = float(np.max(angles))
+        if PELVIS_HEADING in motion.columns and len(motion.time) > 1:
+            heading = motion.column(PELVIS_HEADING)
+            if in_radians:
+                heading = np.degrees(heading)
+            # wrapped to [-180, 180) so crossing +-180 while walking along -X is no jump
+            jumps = (np.diff(heading) + 180.0) % 360.0 - 180.0
+            metrics["heading_jump_deg"] = float(np.max(np.abs(jumps)))
+    else:
+        notes.append("no IK motion file")
+    return _verdict("ik", metrics, limits, reasons, notes)
+
+
+def check_id(gen_forces: Optional[Storage], details: Optional[Dict[str, Any]],
+             limits: Dict[str, Optional[float]]) -> dict:
+    metrics, reasons, notes = {}, [], []
+    mass = (details or {}).get("mass")
+    height = (details or {}).get("height")
+    if gen_forces is None:
+        notes.append("no ID output")
+    elif not mass:
+        notes.append("no body mass")
+    else:
+        weight = float(mass) * GRAVITY
+        forces = [c for c in PELVIS_FORCES if c in gen_forces.columns]
+        moments = [c for c in PELVIS_MOMENTS if c in gen_forces.columns]
+        if forces:
+            metrics["force_rms_bw"] = float(np.max(_rms(gen_forces.block(forces)))) / weight
+        if moments and height:
+            metrics["moment_rms_bwh"] = float(np.max(_rms(gen_forces.block(moments)))) / (weight * float(height))
+    return _verdict("id", metrics, limits, reasons, notes)
+
+
+def check_so(activation: Optional[Storage], limits: Dict[str, Optional[float]],
+             actuators: Optional[Sequence[str]] = None) -> dict:
+    """actuators: the non-muscle columns (reserves, residuals); None when the force set is unknown."""
+    metrics, reasons, notes = {}, [], []
+    level = limits.get("saturation_level")
+    if activation is None:
+        notes.append("no activation output")
+    elif level is not None:
+        if actuators is None:
+            notes.append("no force set file; every activation column counted as a muscle")
+        excluded = set(actuators or ())
+        muscles = [c for c in activation.columns[1:] if c not in excluded]
+        if muscles:
+            metrics["saturation_fraction"] = float(np.mean(activation.block(muscles) >= level))
+        else:
+            notes.append("no muscle columns in activation output")
+    return _verdict("so", metrics, {"saturation_fraction": limits.get("saturation_fraction")}, reasons, notes)
+
+
+def _verdict(stage: str, metrics: Dict[str, float], limits: Dict[str, Optional[float]],
+             reasons: List[str], notes: List[str]) -> dict:
+    for key, value in metrics.items():
+        limit = limits.get(key)
+        if limit is not None and value > limit:
+            reasons.append(f"{key} {value:.4g} > {limit:g}")
+    return {"stage": stage, "passed": not reasons, "metrics": metrics,
+            "reasons": reasons, "notes": notes}
+
+
+def evaluate_gate(
+    stage: str,
+    subj_dir: PathLike,
+    trial: str,
+    gates: Dict[str, Dict[str, Optional[float]]],
+    details: Optional[Dict[str, Any]] = None,
+) -> dict:
+    """
+    Gate result of one stage for one trial, read from the trial's newest output:
+    {"stage", "passed", "metrics", "reasons", "notes"}.
+    """
+    def load(kind):
+        path = latest_output(subj_dir, kind, trial)
+        return read_storage(path) if path is not None else None
+
+    limits = gates.get(stage, {})
+    if stage == "ik":
+        return check_ik(load("ik_errors"), load("ik_motion"), limits)
+    if stage == "id":
+        return check_id(load("id"), details, limits)
+    if stage == "so":
+        so_dir = find_dir(Path(subj_dir), "SO")
+        force_set = so_dir / ACTUATORS_NAME if so_dir is not None else None
+        actuators = force_set_names(force_set) if force_set is not None and force_set.is_file() else None
+        return check_so(load("so"), limits, actuators)
+    raise ValueError(f"Unknown gate stage: {stage}")
+
+
+# ---------------------------------------------------------------------------
+# Run summary
+# ---------------------------------------------------------------------------
+
+def summary_row(subject: str, trial: str, result: dict, skipped: List[str]) -> dict:
+    """Flat run-summary row of one gate result."""
+    return {
+        "subject": subject,
+        "trial": trial,
+        "stage": result["stage"],
+        "gate": "pass" if result["passed"] else "fail",
+        "skipped": ",".join(skipped),
+        "reasons": "; ".join(result["reasons"] + result["notes"]),
+        "metrics": "; ".join(f"{k}={v:.4g}" for k, v in result["metrics"].items()),
+    }
+
+
+def error_row(subject: str, trial: str, stage: str, exc: Exception) -> dict:
+    """Run-summary row of a gate that could not be evaluated; it skips nothing."""
+    return {"subject": subject, "trial": trial, "stage": stage, "gate": "error",
+            "skipped": "", "reasons": str(exc), "metrics": ""}
+
+
+def write_summary(rows: List[dict], path: Path, run_id: str = "") -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for row in sorted(rows, key=lambda r: (r["subject"], r["trial"], STAGE_ORDER.index(r["stage"]))):
+            writer.writerow({"run_id": run_id, **row})
+
+
+def log_summary(rows: List[dict], logger: logging.Logger) -> None:
+    failed = [r for r in rows if r["gate"] == "fail"]
+    errors = [r for r in rows if r["gate"] == "error"]
+    logger.info("Quality gates: %d check(s), %d failed, %d not evaluated", len(rows), len(failed), len(errors))
+    for r in failed:
+        logger.warning("  S%s %s  %s gate failed (%s)%s", r["subject"], r["trial"], r["stage"],
+                       r["reasons"], f"; skipped {r['skipped']}" if r["skipped"] else "")
+    for r in errors:
+        logger.warning("  S%s %s  %s gate not evaluated (%s)", r["subject"], r["trial"], r["stage"], r["reasons"])
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Evaluate the IK/ID/SO quality gates on existing outputs",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--gates", default="", help="JSON file overriding the default gate limits")
+    parser.add_argument("--out", default="", help=f"Summary CSV (default: <root>/{DEFAULT_SUMMARY_NAME})")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from pipeline_cli import discover_subjects, setup_logging
+    from subject_registry import default_registry
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+    try:
+        gates = load_gates(args.gates or None)
+    except (OSError, ValueError) as exc:
+        logger.error("%s", exc)
+        sys.exit(1)
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()] or discover_subjects(root_dir)
+    rows = []
+    for idx, subject in enumerate(subjects, 1):
+        subj_dir = root_dir / f"S{subject}"
+        motions = find_dir(subj_dir, ARTIFACT_DIRS["ik"])
+        trials = sorted({trial_from_filename(plain_name(p).name) for p in motions.glob("ik_output_*")}
+                        - {None}) if motions else []
+        for trial in trials:
+            for stage in STAGE_ORDER:
+                try:
+                    result = evaluate_gate(stage, subj_dir, trial, gates, default_registry().get(subject))
+                except Exception as exc:
+                    rows.append(error_row(subject, trial, stage, exc))
+                    continue
+                rows.append(summary_row(subject, trial, result, []))
+        logger.info("[%d/%d] S%s  %d trial(s)", idx, len(subjects), subject, len(trials))
+
+    out_path = Path(args.out or root_dir / DEFAULT_SUMMARY_NAME)
+    write_summary(rows, out_path)
+    log_summary(rows, logger)
+    logger.info("Summary written to %s", out_path)
+
+
+if __name__ == "__main__":
+    main()
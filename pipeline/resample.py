@@ -0,0 +1,169 @@
+"""
+Multirate resampling and timestamp alignment for marker / force / EMG data.
+
+Cross-modal comparisons (COP vs heel markers, GRF vs EMG) used to decimate
+with fixed strides such as cop[::5] and then truncate to the shorter signal,
+which silently assumes an exact integer rate ratio and a common start time.
+This module instead:
+
+  * takes sampling rates from the file headers / time columns (rate_of),
+  * resamples with a polyphase anti-aliasing FIR (scipy resample_poly) whose
+    rational up/down factors and taps are cached per (fs_in, fs_out),
+  * aligns on timestamps over the overlapping time span, and
+  * puts any number of signals onto one common time grid in a single call,
+    stacking signals that share a rate and length into one resample.
+
+    grid, (cop, heels) = to_common_grid(
+        [(grf.time, grf.block(cop_cols)), (trc.time, trc.xyz)], fs_out=trc.rate
+    )
+"""
+
+from fractions import Fraction
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.signal import firwin, resample_poly
+
+from opensim_io import PathLike, data_suffix, read_storage, read_trc_header
+from signal_filters import fill_gaps
+
+
+# Rates closer than this are treated as identical (no resampling)
+RATE_TOLERANCE = 1e-6
+
+Signal = Tuple[np.ndarray, np.ndarray]   # (time, data) with time along axis 0
+
+
+# ---------------------------------------------------------------------------
+# Rates
+# ---------------------------------------------------------------------------
+
+def rate_of(path: PathLike) -> float:
+    """
+    Sampling rate of a .trc (DataRate header) or .mot/.sto (time column).
+    """
+    if data_suffix(path) == ".trc":
+        header, _ = read_trc_header(path)
+        return float(header["DataRate"])
+    return read_storage(path).rate
+
+
+def estimate_rate(time: np.ndarray) -> float:
+    """Sampling rate from a time column (median step, robust to a dropped frame)."""
+    steps = np.diff(np.asarray(time, dtype=float))
+    return float(1.0 / np.median(steps)) if len(steps) else 0.0
+
+
+# ---------------------------------------------------------------------------
+# Polyphase plans
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def resample_plan(fs_in: float, fs_out: float, max_denominator: int = 1000) -> Tuple[int, int, np.ndarray]:
+    """
+    Cached (up, down, taps) for resampling fs_in -> fs_out.
+
+    The ratio is reduced to a fraction (1000 -> 200 Hz gives 1/5; 1778 ->
+    1259 Hz is approximated within 1/max_denominator).  The taps are the
+    Kaiser-windowed low-pass resample_poly would design itself, built once.
+    """
+    ratio = Fraction(fs_out / fs_in).limit_denominator(max_denominator)
+    up, down = ratio.numerator, ratio.denominator
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    taps = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    return up, down, taps
+
+
+def resample(data: np.ndarray, fs_in: float, fs_out: float, axis: int = 0) -> np.ndarray:
+    """
+    Anti-aliased polyphase resampling along `axis`.
+
+    NaN gaps are bridged before filtering and re-inserted at the output
+    samples whose nearest input sample was missing.
+    """
+    data = np.asarray(data, dtype=float)
+    if abs(fs_in - fs_out) < RATE_TOLERANCE:
+        return data.copy()
+
+    up, down, taps = resample_plan(float(fs_in), float(fs_out))
+    missing = np.isnan(data)
+    if missing.any():
+        moved = np.moveaxis(data, axis, 0)
+        data = np.moveaxis(fill_gaps(moved.reshape(moved.shape[0], -1)).reshape(moved.shape), 0, axis)
+
+    out = resample_poly(data, up, down, axis=axis, window=taps)
+
+    if missing.any():
+        n_in = data.shape[axis]
+        nearest = np.minimum(np.round(np.arange(out.shape[axis]) * down / up).astype(int), n_in - 1)
+        out[np.take(missing, nearest, axis=axis)] = np.nan
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Timestamp alignment
+# ---------------------------------------------------------------------------
+
+def overlap(times: Sequence[np.ndarray]) -> Tuple[float, float]:
+    """Common [start, end] span of several time columns."""
+    start = max(float(t[0]) for t in times)
+    end = min(float(t[-1]) for t in times)
+    if end <= start:
+        raise ValueError(f"Signals do not overlap in time ({start:.4f} >= {end:.4f})")
+    return start, end
+
+
+def sample_at(data: np.ndarray, t0: float, fs: float, grid: np.ndarray) -> np.ndarray:
+    """
+    Linearly interpolate a uniformly sampled block (time on axis 0, starting
+    at t0) at the timestamps in `grid`.  Vectorized over all channels.
+    """
+    pos = np.clip((np.asarray(grid) - t0) * fs, 0.0, data.shape[0] - 1)
+    i0 = np.floor(pos).astype(int)
+    i1 = np.minimum(i0 + 1, data.shape[0] - 1)
+    frac = (pos - i0).reshape((-1,) + (1,) * (data.ndim - 1))
+    return data[i0] * (1.0 - frac) + data[i1] * frac
+
+
+def to_common_grid(
+    signals: Sequence[Signal],
+    fs_out: float,
+    t_start: Optional[float] = None,
+    t_end: Optional[float] = None,
+    rates: Optional[Sequence[float]] = None,
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Resample and align several signals onto one uniform time grid.
+
+    Args:
+        signals: (time, data) pairs; data has time on axis 0 and any trailing shape
+        fs_out: Grid rate in Hz
+        t_start, t_end: Grid span (default: the overlap of all signals)
+        rates: Input rates (default: estimated from each time column)
+
+    Returns:
+        (grid, blocks) with blocks[i] shaped (len(grid),) + data_i.shape[1:]
+    """
+    times = [np.asarray(t, dtype=float) for t, _ in signals]
+    span_start, span_end = overlap(times)
+    t_start = span_start if t_start is None else t_start
+    t_end = span_end if t_end is None else t_end
+    n = int(np.floor((t_end - t_start) * fs_out + 1e-9)) + 1
+    grid = t_start + np.arange(n) / fs_out
+
+    rates = list(rates) if rates is not None else [estimate_rate(t) for t in times]
+
+    # Signals sharing (rate, shape) are resampled as one stacked block
+    groups: dict = {}
+    for i, (_, data) in enumerate(signals):
+        groups.setdefault((round(rates[i], 6), np.shape(data)), []).append(i)
+
+    blocks: List[np.ndarray] = [np.empty(0)] * len(signals)
+    for (fs_in, _), indices in groups.items():
+        stacked = np.stack([np.asarray(signals[i][1], dtype=float) for i in indices], axis=-1)
+        resampled = resample(stacked, fs_in, fs_out, axis=0)
+        for k, i in enumerate(indices):
+            blocks[i] = sample_at(resampled[..., k], times[i][0], fs_out, grid)
+    return grid, blocks
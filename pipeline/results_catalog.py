@@ -0,0 +1,341 @@
+"""
+Results catalog: a SQLite index of every pipeline output artifact.
+
+Each .mot/.sto under S*/IK/results_stw, S*/ID/results_id and S*/SO/result_SO
+is recorded with subject, trial, stage, kind, path, row count, time range,
+SHA-1, size/mtime and the run id that last indexed it.  'Subject Details.csv'
+is loaded into a `subjects` table so queries can join on metadata:
+
+    rows = query(db, stage="so", kind="activation", trial="stw3",
+                 age_group="older", sex="F")
+
+Updates are incremental: files whose size and mtime are unchanged are not
+re-read or re-hashed.  Compressed outputs (.mot.gz, .sto.zst) are indexed
+like plain ones; the SHA-1 is taken over the decompressed text.
+
+Usage:
+    python results_catalog.py --root D:/RESEARCH/STW_dataset/Extracted [--db path] [--run-id ID]
+    python results_catalog.py --root ... --query stage=so,kind=activation,age_group=older,sex=F
+"""
+
+import sys
+import hashlib
+import logging
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from cohort_store import find_dir, trial_from_filename
+from opensim_io import data_suffix, read_bytes
+from subject_registry import DEFAULT_SUBJECT_CSV, load_subject_details
+
+
+CATALOG_NAME = "results_catalog.sqlite"
+
+# stage -> output directory relative to Sxx
+ARTIFACT_DIRS: Dict[str, str] = {
+    "ik": "IK/results_stw",
+    "id": "ID/results_id",
+    "so": "SO/result_SO",
+}
+
+# filename fragment -> artifact kind (first match wins)
+ARTIFACT_KINDS = [
+    ("_ik_marker_errors", "marker_errors"),
+    ("_ik_model_marker_locations", "marker_locations"),
+    ("StaticOptimization_activation", "activation"),
+    ("StaticOptimization_force", "force"),
+    ("_controls", "controls"),
+    ("ik_output_", "motion"),
+    ("id_output_", "generalized_forces"),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path        TEXT PRIMARY KEY,
+    subject     TEXT NOT NULL,
+    trial       TEXT,
+    stage       TEXT NOT NULL,
+    kind        TEXT,
+    n_rows      INTEGER,
+    t_start     REAL,
+    t_end       REAL,
+    sha1        TEXT,
+    size        INTEGER,
+    mtime       REAL,
+    run_id      TEXT,
+    indexed_at  TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_artifacts_lookup ON artifacts (stage, kind, trial, subject);
+CREATE TABLE IF NOT EXISTS subjects (
+    subject       TEXT PRIMARY KEY,
+    sex           TEXT,
+    age           REAL,
+    mass          REAL,
+    height        REAL,
+    dominant_foot TEXT,
+    age_group     TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    root_dir    TEXT,
+    started_at  TEXT,
+    n_indexed   INTEGER
+);
+"""
+
+
+# ---------------------------------------------------------------------------
+# File helpers
+# ---------------------------------------------------------------------------
+
+def file_sha1(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_kind(name: str) -> str:
+    for fragment, kind in ARTIFACT_KINDS:
+        if fragment in name:
+            return kind
+    return "other"
+
+
+def summarize_storage(path: Path) -> dict:
+    """Row count, time range and SHA-1 of a .mot/.sto from a single read."""
+    raw = read_bytes(path)
+    lines = raw.decode("utf-8", errors="replace").splitlines()
+    start = next(
+        (i + 2 for i, l in enumerate(lines) if l.strip().lower() == "endheader"), None
+    )
+    info = {"sha1": hashlib.sha1(raw).hexdigest(), "n_rows": 0, "t_start": None, "t_end": None}
+    if start is None:
+        return info
+    data = [l for l in lines[start:] if l.strip()]
+    info["n_rows"] = len(data)
+    if data:
+        info["t_start"] = float(data[0].split()[0])
+        info["t_end"] = float(data[-1].split()[0])
+    return info
+
+
+def iter_artifacts(root_dir: Path, subjects: Optional[Iterable[str]] = None):
+    """Yield (subject, stage, path) for every .mot/.sto output under root_dir."""
+    wanted = {f"S{s}" if not str(s).startswith("S") else s for s in subjects} if subjects else None
+    for subj_dir in sorted(root_dir.glob("S*")):
+        if not (subj_dir.is_dir() and subj_dir.name[1:].isdigit()):
+            continue
+        if wanted and subj_dir.name not in wanted:
+            continue
+        for stage, rel in ARTIFACT_DIRS.items():
+            out_dir = find_dir(subj_dir, rel)
+            if out_dir is None:
+                continue
+            for path in sorted(out_dir.iterdir()):
+                if path.is_file() and data_suffix(path) in (".mot", ".sto"):
+                    yield subj_dir.name, stage, path
+
+
+# ---------------------------------------------------------------------------
+# Catalog maintenance
+# ---------------------------------------------------------------------------
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def load_subjects(conn: sqlite3.Connection, subject_csv: Path = DEFAULT_SUBJECT_CSV) -> int:
+    details = load_subject_details(subject_csv)
+    conn.executemany(
+        "INSERT OR REPLACE INTO subjects VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (s, d["sex"], d["age"], d["mass"], d["height"], d["dominant_foot"], d["age_group"])
+            for s, d in details.items()
+        ],
+    )
+    return len(details)
+
+
+def update_catalog(
+    root_dir: Path,
+    db_path: Optional[Path] = None,
+    run_id: Optional[str] = None,
+    subjects: Optional[Iterable[str]] = None,
+    subject_csv: Path = DEFAULT_SUBJECT_CSV,
+    logger: Optional[logging.Logger] = None,
+) -> Path:
+    """
+    Index (or re-index) the outputs under root_dir.
+
+    Args:
+        root_dir: Dataset root containing Sxx folders
+        db_path: SQLite file (default: <root_dir>/results_catalog.sqlite)
+        run_id: Identifier stored with new/changed rows (default: timestamp)
+        subjects: Restrict the scan to these subjects ('01' or 'S01')
+        subject_csv: Subject Details CSV joined as the `subjects` table
+        logger: Logger instance
+
+    Returns:
+        Path to the catalog
+    """
+    logger = logger or logging.getLogger("results_catalog")
+    db_path = Path(db_path) if db_path else root_dir / CATALOG_NAME
+    run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = connect(db_path)
+    try:
+        if subject_csv and Path(subject_csv).is_file():
+            load_subjects(conn, Path(subject_csv))
+
+        known = {
+            r["path"]: (r["size"], r["mtime"])
+            for r in conn.execute("SELECT path, size, mtime FROM artifacts")
+        }
+        seen = set()
+        scanned_subjects = set()
+        changed = 0
+
+        for subject, stage, path in iter_artifacts(root_dir, subjects):
+            scanned_subjects.add(subject)
+            key = str(path)
+            seen.add(key)
+            st = path.stat()
+            if known.get(key) == (st.st_size, st.st_mtime):
+                continue
+            try:
+                info = summarize_storage(path)
+            except (OSError, ValueError) as exc:
+                logger.warning("Could not index %s: %s", path, exc)
+                continue
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key, subject, trial_from_filename(path.name), stage, artifact_kind(path.name),
+                    info["n_rows"], info["t_start"], info["t_end"], info["sha1"],
+                    st.st_size, st.st_mtime, run_id, now,
+                ),
+            )
+            changed += 1
+
+        # Drop rows for files that disappeared from the scanned subjects
+        stale = [
+            p for p in known
+            if p not in seen and Path(p).parents[2].name in scanned_subjects
+        ]
+        conn.executemany("DELETE FROM artifacts WHERE path = ?", [(p,) for p in stale])
+
+        conn.execute(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)",
+            (run_id, str(root_dir), now, changed),
+        )
+        conn.commit()
+        logger.info("Catalog %s: %d artifact(s) indexed, %d removed", db_path, changed, len(stale))
+    finally:
+        conn.close()
+    return db_path
+
+
+# ---------------------------------------------------------------------------
+# Query API
+# ---------------------------------------------------------------------------
+
+_ARTIFACT_FILTERS = ("stage", "kind", "trial", "subject", "run_id")
+_SUBJECT_FILTERS = ("sex", "age_group", "dominant_foot")
+
+
+def query(db_path: Path, **filters) -> List[dict]:
+    """
+    Return artifacts joined with subject metadata, filtered by equality.
+
+    Artifact filters: stage, kind, trial, subject, run_id
+    Subject filters : sex, age_group, dominant_foot
+    Any filter may be a single value or a list/tuple of values.
+    """
+    clauses = []
+    params: list = []
+    for key, value in filters.items():
+        if value is None:
+            continue
+        if key in _ARTIFACT_FILTERS:
+            column = f"a.{key}"
+        elif key in _SUBJECT_FILTERS:
+            column = f"s.{key}"
+        else:
+            raise ValueError(f"Unknown filter: {key}")
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+        params += values
+
+    sql = (
+        "SELECT a.*, s.sex, s.age, s.mass, s.height, s.dominant_foot, s.age_group "
+        "FROM artifacts a LEFT JOIN subjects s ON s.subject = a.subject"
+    )
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY a.subject, a.trial, a.stage, a.kind"
+
+    conn = connect(Path(db_path))
+    try:
+        return [dict(r) for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def paths(db_path: Path, **filters) -> List[Path]:
+    """Convenience wrapper: just the artifact paths matching the filters."""
+    return [Path(r["path"]) for r in query(db_path, **filters)]
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Index pipeline outputs into a SQLite catalog",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--db", default="", help=f"Catalog path (default: <root>/{CATALOG_NAME})")
+    parser.add_argument("--run-id", default="", help="Run identifier (default: timestamp)")
+    parser.add_argument("--subjects", default="", help="Comma-separated subjects to rescan (default: all)")
+    parser.add_argument("--query", default="", help="key=value[,key=value] filters; prints matching paths")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from pipeline_cli import setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    db_path = Path(args.db) if args.db else root_dir / CATALOG_NAME
+
+    if args.query:
+        filters = dict(kv.split("=", 1) for kv in args.query.split(",") if "=" in kv)
+        for row in query(db_path, **filters):
+            print(row["path"])
+        return
+
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()] or None
+    update_catalog(root_dir, db_path, run_id=args.run_id or None, subjects=subjects, logger=logger)
+
+
+if __name__ == "__main__":
+    main()
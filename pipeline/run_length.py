@@ -0,0 +1,166 @@
+"""
+Run-length primitives for threshold-based event detection.
+
+Replaces the per-sample Python loops used for force-plate onsets and stance
+detection with cumulative-sum / diff arithmetic that works on whole arrays:
+
+    first_sustained(mask, min_len)      first run of >= min_len True samples
+    find_runs(mask, min_len)            every True run of >= min_len samples
+    baseline_threshold(signal, ...)     mean + k * std over a quiet baseline
+    detect_onsets(signal, fs, ...)      adaptive-threshold sustained onset
+    stance_events(force, ...)           heel-strike / toe-off masks from a plate
+
+Time is axis 0 by default, matching signal_filters: a 1-D signal, a
+(frames x channels) block or (frames x channels x trials) stack are all
+handled in one call; pass `axis` for other layouts.
+"""
+
+from typing import Tuple, Union
+
+import numpy as np
+
+
+BaselineWindow = Union[slice, Tuple[int, int]]
+
+
+# ---------------------------------------------------------------------------
+# Run lengths
+# ---------------------------------------------------------------------------
+
+def run_lengths(mask: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    Length of the True run ending at each sample (0 where mask is False).
+
+        [0, 1, 1, 0, 1, 1, 1] -> [0, 1, 2, 0, 1, 2, 3]
+    """
+    mask = np.asarray(mask, dtype=bool)
+    counts = np.cumsum(mask, axis=axis)
+    # cumulative count at the most recent False sample, carried forward
+    reset = np.maximum.accumulate(np.where(mask, 0, counts), axis=axis)
+    return counts - reset
+
+
+def first_sustained(mask: np.ndarray, min_len: int, axis: int = 0) -> np.ndarray:
+    """
+    Start index of the first run of at least `min_len` True samples.
+
+    Returns:
+        Array over the non-time axes (a scalar for 1-D input); -1 where no
+        such run exists
+    """
+    min_len = max(1, int(min_len))
+    hits = run_lengths(mask, axis=axis) >= min_len
+    first = np.argmax(hits, axis=axis) - (min_len - 1)
+    return np.where(hits.any(axis=axis), first, -1)
+
+
+def find_runs(
+    mask: np.ndarray, min_len: int = 1, axis: int = 0
+) -> Tuple[np.ndarray, np.ndarray, Tuple[np.ndarray, ...]]:
+    """
+    Every run of at least `min_len` True samples.
+
+    Returns:
+        (starts, ends, index) with `ends` exclusive.  `index` is a tuple of
+        arrays (as from np.nonzero) giving each run's position on the non-time
+        axes; it is empty for 1-D input.  Runs are ordered by channel, then time.
+    """
+    mask = np.moveaxis(np.asarray(mask, dtype=bool), axis, -1)
+    lead = mask.shape[:-1]
+    flat = mask.reshape(-1, mask.shape[-1])
+    padded = np.pad(flat, ((0, 0), (1, 1))).astype(np.int8)
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    keep = (ends - starts) >= max(1, int(min_len))
+    rows, starts, ends = rows[keep], starts[keep], ends[keep]
+    index = np.unravel_index(rows, lead) if lead else ()
+    return starts, ends, index
+
+
+# ---------------------------------------------------------------------------
+# Thresholds
+# ---------------------------------------------------------------------------
+
+def _window(baseline: BaselineWindow) -> slice:
+    return baseline if isinstance(baseline, slice) else slice(*baseline)
+
+
+def baseline_threshold(
+    signal: np.ndarray,
+    baseline: BaselineWindow,
+    noise_mult: float = 5.0,
+    axis: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Adaptive noise threshold from a quiet baseline window.
+
+    Returns:
+        (mean, threshold) per channel, threshold = mean + noise_mult * std
+    """
+    window = np.take(signal, np.arange(signal.shape[axis])[_window(baseline)], axis=axis)
+    mean = np.nanmean(window, axis=axis)
+    return mean, mean + noise_mult * np.nanstd(window, axis=axis)
+
+
+def detect_onsets(
+    signal: np.ndarray,
+    fs: float,
+    baseline_sec: float = 0.5,
+    noise_mult: float = 5.0,
+    min_dur_ms: float = 100.0,
+    axis: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    First frame where |signal| exceeds mean + noise_mult * std of the first
+    `baseline_sec` and stays above it for at least `min_dur_ms`.
+
+    Returns:
+        (onset frames, thresholds), one per channel; onset is -1 if none
+    """
+    magnitude = np.abs(np.asarray(signal, dtype=float))
+    n_base = max(10, int(baseline_sec * fs))
+    _, thresh = baseline_threshold(magnitude, (0, n_base), noise_mult, axis=axis)
+    min_fr = max(3, int(min_dur_ms / 1000.0 * fs))
+    above = magnitude > np.expand_dims(thresh, axis)
+    return first_sustained(above, min_fr, axis=axis), thresh
+
+
+def _runs_ahead(mask: np.ndarray, axis: int) -> np.ndarray:
+    """Length of the True run starting at each sample."""
+    return np.flip(run_lengths(np.flip(mask, axis=axis), axis=axis), axis=axis)
+
+
+def _previous(mask: np.ndarray, axis: int) -> np.ndarray:
+    """mask shifted one sample forward in time; False at frame 0."""
+    prev = np.roll(mask, 1, axis=axis)
+    first = [slice(None)] * mask.ndim
+    first[axis] = 0
+    prev[tuple(first)] = False
+    return prev
+
+
+def stance_events(
+    force: np.ndarray,
+    threshold: float = 20.0,
+    min_width: int = 15,
+    axis: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Heel-strike and toe-off masks from vertical force.
+
+    A heel strike is the first loaded sample after an unloaded one, followed
+    by at least `min_width` loaded samples; a toe-off is the first unloaded
+    sample after a loaded one, followed by at least `min_width` unloaded
+    samples.  A plate already loaded at frame 0 has no heel strike there.
+
+    Returns:
+        (heel_strike, toe_off) boolean arrays shaped like `force`; use
+        np.flatnonzero for a 1-D signal or first_sustained(mask, 1) for the
+        first event per channel
+    """
+    above = np.asarray(force) > threshold
+    below = ~above
+    hs = above & _previous(below, axis) & (_runs_ahead(above, axis) >= min_width)
+    to = below & _previous(above, axis) & (_runs_ahead(below, axis) >= min_width)
+    return hs, to
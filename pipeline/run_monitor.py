@@ -0,0 +1,351 @@
+"""
+Live progress, throughput and ETA for a pipeline run.
+
+The engine in pipeline_cli.py reports what it is doing as small dict events
+(put on a queue when one is given - a multiprocessing Manager queue for a
+spawn pool).  A RunMonitor in the parent folds them into a view of the run:
+
+    stage_start / stage_end   one OpenSim tool (scale, ik, id, so) of a trial
+    trial_start / trial_end   one trial of a subject, whatever its outcome
+    subject_end               the subject's job returned (closes any trial a
+                              failure or exception left open; a cancelled
+                              subject leaves them open - see run_state.py)
+
+    {"event": "stage_end", "subject": "05", "trial": "stw1", "stage": "ik",
+     "pid": 4312, "time": 1718022345.2, "seconds": 41.7, "ok": True}
+
+The ETA is the remaining stage work of every unfinished trial, costed with
+the median stage time of this run (or of earlier runs, kept in
+<root_dir>/stage_timings.json, until this run has its own), divided over
+the workers.
+
+Usage:
+    python run_monitor.py --root D:/RESEARCH/STW_dataset/Extracted [--trials 120] [--cores 7]
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from run_state import CANCELLED
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+STAGES = ("scale", "ik", "id", "so")
+TRIAL_STAGES = ("ik", "id", "so")
+
+DEFAULT_TIMINGS_NAME = "stage_timings.json"
+TIMINGS_KEPT = 200  # most recent durations kept per stage
+
+
+# ---------------------------------------------------------------------------
+# Events
+# ---------------------------------------------------------------------------
+
+def make_event(event: str, subject: str, trial: str = "", stage: str = "", **extra) -> dict:
+    """One progress event, stamped with the reporting process and wall time."""
+    return {"event": event, "subject": subject, "trial": trial, "stage": stage,
+            "pid": os.getpid(), "time": time.time(), **extra}
+
+
+def drain(events, limit: int = 10000) -> List[dict]:
+    """Every event currently waiting on a queue, without blocking."""
+    out: List[dict] = []
+    while len(out) < limit:
+        try:
+            out.append(events.get_nowait())
+        except (queue.Empty, EOFError, OSError):
+            break
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Recorded stage timings
+# ---------------------------------------------------------------------------
+
+def load_timings(path: Path) -> Dict[str, List[float]]:
+    """stage -> durations (s) of earlier runs; empty when nothing was recorded yet."""
+    try:
+        with open(path, "r") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return {stage: [float(s) for s in data.get(stage, [])] for stage in STAGES}
+
+
+def record_timings(path: Path, timings: List[dict]) -> None:
+    """Append this run's successful stage durations to the recorded timings."""
+    if not timings:
+        return
+    data = load_timings(path)
+    for row in timings:
+        data.setdefault(row["stage"], []).append(round(float(row["seconds"]), 2))
+    data = {stage: values[-TIMINGS_KEPT:] for stage, values in data.items() if values}
+    tmp = Path(path).with_suffix(".tmp")
+    with open(tmp, "w") as fh:
+        json.dump(data, fh, indent=1)
+    os.replace(tmp, path)
+
+
+def stage_medians(timings: Dict[str, List[float]]) -> Dict[str, float]:
+    return {stage: float(np.median(v)) for stage, v in timings.items() if v}
+
+
+# ---------------------------------------------------------------------------
+# Formatting / system
+# ---------------------------------------------------------------------------
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {secs:02d}s"
+    return f"{secs}s"
+
+
+def core_utilisation() -> Optional[float]:
+    """Machine-wide CPU use in % (psutil preferred, load average as fallback)."""
+    if psutil is not None:
+        return float(psutil.cpu_percent(interval=None))
+    if hasattr(os, "getloadavg"):
+        return min(100.0, 100.0 * os.getloadavg()[0] / (os.cpu_count() or 1))
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Monitor
+# ---------------------------------------------------------------------------
+
+class RunMonitor:
+    """
+    Folds progress events into running jobs, completed trials and an ETA.
+
+    planned  subject -> trial names the run was started with
+    steps    enabled steps, as passed to the engine
+    workers  processes running subjects side by side
+    history  recorded stage durations (load_timings) used until this run has its own
+    """
+
+    def __init__(
+        self,
+        planned: Dict[str, List[str]],
+        steps: Dict[str, bool],
+        workers: int = 1,
+        history: Optional[Dict[str, List[float]]] = None,
+    ):
+        self.planned = {s: list(t) for s, t in planned.items()}
+        self.steps = dict(steps)
+        self.trial_stages = [s for s in TRIAL_STAGES if steps.get(s)]
+        self.scale = bool(steps.get("scale"))
+        self.workers = max(1, workers)
+        self.history = stage_medians(history or {})
+        self.started = time.time()
+
+        self.durations: Dict[str, List[float]] = {}
+        self.timings: List[dict] = []                        # successful stages, for record_timings
+        self.running: Dict[Tuple[str, str], dict] = {}       # (subject, trial) -> current stage
+        self.stages_done: Dict[Tuple[str, str], set] = {}    # (subject, trial) -> finished stages
+        self.finished: set = set()                           # (subject, trial) trials no longer pending
+        self.started_trials: set = set()
+        self.failed_trials: set = set()
+        self.last_stage: Dict[Tuple[str, str], str] = {}
+        self.failed_stages = 0
+        self.subjects_done: set = set()
+
+    # -- events --------------------------------------------------------
+
+    def handle(self, event: dict) -> None:
+        kind = event.get("event")
+        key = (event.get("subject", ""), event.get("trial", ""))
+        if kind == "trial_start":
+            self.started_trials.add(key)
+            self.running[key] = {"stage": "setup", "pid": event.get("pid"),
+                                 "since": event.get("time", time.time())}
+        elif kind == "stage_start":
+            self.last_stage[key] = event["stage"]
+            self.running[key] = {"stage": event["stage"], "pid": event.get("pid"),
+                                 "since": event.get("time", time.time())}
+        elif kind == "stage_end":
+            self.running.pop(key, None)
+            self.stages_done.setdefault(key, set()).add(event["stage"])
+            if event.get("ok"):
+                self.durations.setdefault(event["stage"], []).append(event["seconds"])
+                self.timings.append({"stage": event["stage"], "seconds": event["seconds"]})
+            else:
+                self.failed_stages += 1
+                self.failed_trials.add(key)
+        elif kind == "trial_end":
+            self.running.pop(key, None)
+            self.finished.add(key)
+        elif kind == "subject_end":
+            subject = key[0]
+            self.subjects_done.add(subject)
+            if event.get("error") != CANCELLED:
+                for trial in self.planned.get(subject, []):
+                    if (subject, trial) not in self.finished:
+                        self.failed_trials.add((subject, trial))
+                        self.finished.add((subject, trial))
+            for k in [k for k in self.running if k[0] == subject]:
+                del self.running[k]
+
+    def update(self, events) -> int:
+        """Handle every event waiting on the queue; returns how many there were."""
+        batch = drain(events)
+        for event in batch:
+            self.handle(event)
+        return len(batch)
+
+    # -- view ----------------------------------------------------------
+
+    @property
+    def total_trials(self) -> int:
+        return sum(len(t) for t in self.planned.values())
+
+    @property
+    def completed_trials(self) -> int:
+        return len(self.finished)
+
+    def stage_estimate(self, stage: str) -> Optional[float]:
+        if self.durations.get(stage):
+            return float(np.median(self.durations[stage]))
+        return self.history.get(stage)
+
+    def running_jobs(self) -> List[dict]:
+        now = time.time()
+        return [
+            {"subject": s, "trial": t or "-", "stage": job["stage"], "pid": job["pid"],
+             "elapsed": now - job["since"]}
+            for (s, t), job in sorted(self.running.items())
+        ]
+
+    def throughput(self) -> Optional[float]:
+        """Completed trials per minute so far."""
+        minutes = (time.time() - self.started) / 60.0
+        if not self.finished or minutes <= 0:
+            return None
+        return len(self.finished) / minutes
+
+    def remaining_work(self) -> Optional[float]:
+        """Estimated stage seconds still to run, or None before any stage has a timing."""
+        estimates = {s: self.stage_estimate(s) for s in STAGES}
+        known = [v for v in estimates.values() if v is not None]
+        if not known:
+            return None
+        fallback = float(np.mean(known))
+        cost = {s: fallback if v is None else v for s, v in estimates.items()}
+
+        now = time.time()
+        total = 0.0
+        for subject, trials in self.planned.items():
+            if subject in self.subjects_done:
+                continue
+            if self.scale and "scale" not in self.stages_done.get((subject, ""), set()):
+                total += cost["scale"]
+            for trial in trials:
+                key = (subject, trial)
+                if key in self.finished:
+                    continue
+                done = self.stages_done.get(key, set())
+                total += sum(cost[s] for s in self.trial_stages if s not in done)
+        for (subject, trial), job in self.running.items():
+            total -= min(cost.get(job["stage"], 0.0), now - job["since"])
+        return max(0.0, total)
+
+    def eta(self) -> Optional[float]:
+        remaining = self.remaining_work()
+        if remaining is None:
+            return None
+        pending = sum(1 for s in self.planned if s not in self.subjects_done)
+        return remaining / max(1, min(self.workers, pending))
+
+    def trial_states(self) -> Dict[str, Dict[str, dict]]:
+        """subject -> trial -> {"status", "stage"} for run_state.build_state."""
+        out: Dict[str, Dict[str, dict]] = {}
+        for subject, trials in self.planned.items():
+            for trial in trials:
+                key = (subject, trial)
+                if key in self.finished:
+                    status = "failed" if key in self.failed_trials else "done"
+                elif key in self.started_trials:
+                    status = "incomplete"
+                else:
+                    status = "pending"
+                out.setdefault(subject, {})[trial] = {"status": status, "stage": self.last_stage.get(key, "")}
+        return out
+
+    def status_line(self) -> str:
+        rate = self.throughput()
+        cpu = core_utilisation()
+        return "  |  ".join([
+            f"{self.completed_trials}/{self.total_trials} trials",
+            f"{len(self.running)} running",
+            f"{rate:.2f} trials/min" if rate is not None else "-- trials/min",
+            f"CPU {cpu:.0f}%" if cpu is not None else "CPU --",
+            f"elapsed {format_duration(time.time() - self.started)}",
+            f"ETA {format_duration(self.eta())}",
+        ])
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Recorded stage timings and a run-time estimate",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root (holds stage_timings.json)")
+    parser.add_argument("--timings", default="", help=f"Timings file (default: <root>/{DEFAULT_TIMINGS_NAME})")
+    parser.add_argument("--trials", type=int, default=0, help="Estimate a run of this many trials")
+    parser.add_argument("--subjects", type=int, default=0, help="Subjects of that run (adds one scaling each)")
+    parser.add_argument("--cores", type=int, default=1, help="Workers of that run")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from pipeline_cli import setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    path = Path(args.timings or Path(args.root) / DEFAULT_TIMINGS_NAME)
+    timings = load_timings(path)
+    if not any(timings.values()):
+        logger.error("No stage timings recorded in %s", path)
+        sys.exit(1)
+    for stage in STAGES:
+        values = timings.get(stage, [])
+        if values:
+            logger.info("%-5s  n=%-4d median %-8s  p90 %s", stage, len(values),
+                        format_duration(float(np.median(values))),
+                        format_duration(float(np.percentile(values, 90))))
+
+    if args.trials:
+        medians = stage_medians(timings)
+        work = args.trials * sum(medians.get(s, 0.0) for s in TRIAL_STAGES)
+        work += args.subjects * medians.get("scale", 0.0)
+        logger.info("%d trial(s) on %d core(s): about %s", args.trials, args.cores,
+                    format_duration(work / max(1, args.cores)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Cooperative pause / cancel of a pipeline run and the run-state file for resuming it.
+
+A RunControl is handed to every worker with its job (pipeline_cli.py).  The
+engine checks it before each trial: while paused it waits, once cancelled
+it stops starting trials and the subject returns as CANCELLED.  A soft
+cancel lets running tools finish their trial; a hard cancel also terminates
+the pool's worker processes, so tools are killed mid-run.
+
+In the CLI the first Ctrl-C is a soft cancel and the second a hard one.
+
+When the run ends, however it ends, <root_dir>/run_state.json records
+every planned trial as
+
+    done         its trial loop finished (outputs may still have failed a gate)
+    failed       a stage failed or the subject raised
+    incomplete   it was started but cut off - its outputs are partial
+    pending      it never started
+
+and `pipeline_cli.py --resume` (or "Resume unfinished" in the GUI) runs
+only the incomplete and pending trials of the last run again.
+
+Usage:
+    python run_state.py --root D:/RESEARCH/STW_dataset/Extracted
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+DEFAULT_STATE_NAME = "run_state.json"
+
+CANCELLED = "cancelled"  # error string of a subject that stopped on a cancel
+TRIAL_STATUSES = ("done", "failed", "incomplete", "pending")
+RESUMABLE = ("incomplete", "pending")
+
+
+# ---------------------------------------------------------------------------
+# Control
+# ---------------------------------------------------------------------------
+
+class RunControl:
+    """
+    Pause / cancel flags shared by the parent and its workers.
+
+    With a multiprocessing Manager the flags are proxies that survive being
+    sent to spawned workers; without one they are threading events for a
+    run in this process.  `hard` is only read by the parent's runner.
+    """
+
+    def __init__(self, manager=None):
+        make = manager.Event if manager is not None else threading.Event
+        self._cancel = make()
+        self._running = make()
+        self._running.set()
+        self.hard = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def cancel(self, hard: bool = False) -> None:
+        self.hard = self.hard or hard
+        self._cancel.set()
+        self._running.set()
+
+    def pause(self) -> None:
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def wait_if_paused(self, poll: float = 0.5) -> bool:
+        """Block while paused; False once the run is cancelled."""
+        while not self._running.wait(poll):
+            pass
+        return not self.cancelled
+
+
+def ignore_sigint() -> None:
+    """Pool initializer: Ctrl-C is handled by the parent, not by each worker."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def start_manager():
+    """A spawn-context Manager for RunControl flags and event queues that survives Ctrl-C."""
+    import multiprocessing as mp
+    from multiprocessing.managers import SyncManager
+
+    manager = SyncManager(ctx=mp.get_context("spawn"))
+    manager.start(ignore_sigint)
+    return manager
+
+
+def install_sigint(control: RunControl, logger: logging.Logger, raise_on_hard: bool = False):
+    """
+    First Ctrl-C cancels softly, the second hard (raise_on_hard: by raising
+    KeyboardInterrupt, for a run in this process).  Returns the old handler.
+    """
+    def handler(signum, frame):
+        if not control.cancelled:
+            logger.warning("Cancelling: no new trials are started. Press Ctrl-C again to stop running tools.")
+            control.cancel()
+            return
+        logger.warning("Cancelling hard: stopping running tools.")
+        control.cancel(hard=True)
+        if raise_on_hard:
+            raise KeyboardInterrupt
+
+    return signal.signal(signal.SIGINT, handler)
+
+
+# ---------------------------------------------------------------------------
+# State file
+# ---------------------------------------------------------------------------
+
+def build_state(run_id: str, status: str, steps: Dict[str, bool], trials: Dict[str, Dict[str, dict]],
+                previous: Optional[dict] = None) -> dict:
+    """
+    trials: subject -> trial -> {"status", "stage"} as from RunMonitor.trial_states().
+    previous: state of the run this one resumed; its other trials are kept.
+    """
+    if previous is not None:
+        merged = {subject: dict(per_subject) for subject, per_subject in previous.get("subjects", {}).items()}
+        for subject, per_subject in trials.items():
+            merged.setdefault(subject, {}).update(per_subject)
+        trials = merged
+    counts = {s: 0 for s in TRIAL_STATUSES}
+    for per_subject in trials.values():
+        for row in per_subject.values():
+            counts[row["status"]] += 1
+    return {
+        "run_id": run_id,
+        "status": status,
+        "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "steps": [s for s, on in steps.items() if on],
+        "counts": counts,
+        "subjects": trials,
+    }
+
+
+def write_state(path: Path, state: dict) -> None:
+    tmp = Path(path).with_suffix(".tmp")
+    with open(tmp, "w") as fh:
+        json.dump(state, fh, indent=1)
+    os.replace(tmp, path)
+
+
+def load_state(path: Path) -> dict:
+    with open(path, "r") as fh:
+        return json.load(fh)
+
+
+def resume_trials(state: dict) -> Dict[str, List[str]]:
+    """subject -> trials of a recorded run still to be run (incomplete or pending)."""
+    out: Dict[str, List[str]] = {}
+    for subject, per_subject in state.get("subjects", {}).items():
+        trials = [t for t, row in per_subject.items() if row["status"] in RESUMABLE]
+        if trials:
+            out[subject] = trials
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Show the recorded state of the last pipeline run",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root (holds run_state.json)")
+    parser.add_argument("--state", default="", help=f"State file (default: <root>/{DEFAULT_STATE_NAME})")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from pipeline_cli import setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    path = Path(args.state or Path(args.root) / DEFAULT_STATE_NAME)
+    try:
+        state = load_state(path)
+    except (OSError, ValueError) as exc:
+        logger.error("Cannot read run state %s: %s", path, exc)
+        sys.exit(1)
+
+    logger.info("Run %s  %s  (updated %s)  steps %s", state["run_id"], state["status"].upper(),
+                state["updated"], ",".join(state["steps"]))
+    logger.info("Trials: %s", "  ".join(f"{k} {v}" for k, v in state["counts"].items()))
+    for subject, per_subject in sorted(state["subjects"].items()):
+        for trial, row in per_subject.items():
+            if row["status"] != "done":
+                logger.info("  S%s %-8s %-10s %s", subject, trial, row["status"], row.get("stage") or "")
+    todo = resume_trials(state)
+    if todo:
+        logger.info("%d trial(s) left for --resume", sum(len(t) for t in todo.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Local scratch staging for runs whose dataset lives on a network/USB drive.
+
+A ScratchStage mirrors one subject job under a fast local directory (e.g. a
+tmpfs or local SSD): every input the adapted template references (model,
+static/trial TRC, GRF .mot, setup XMLs) plus the subject's cmc_actuators.xml
+and leg_assignment.json is copied once, the OpenSim tools run against the
+local copies, and after the job succeeds every new or modified file is copied
+back to root_dir in one pass.  Absolute root_dir references inside XML files are rewritten both ways
+so setups synced back still point at the dataset, not the scratch tree.
+
+    stage = ScratchStage(root_dir, Path("/dev/shm/stw"), "03", logger)
+    adapted = stage.stage_template(adapted)
+    ...  run tools under stage.remap_path(subj_dir) ...
+    stage.sync_back()
+    stage.cleanup()
+"""
+
+import os
+import shutil
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from opensim_io import resolve_path
+
+
+# Subject-relative inputs staged even when the template does not reference them
+EXTRA_INPUTS = ("SO/cmc_actuators.xml", "leg_assignment.json")
+
+# Staged files whose text may embed absolute root_dir paths
+_REWRITE_SUFFIXES = (".xml", ".osim")
+
+
+class ScratchStage:
+    """Copy-in / run / copy-back mirror of one subject under a scratch directory."""
+
+    def __init__(
+        self,
+        root_dir: Path,
+        scratch_dir: Path,
+        subject_num: str,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.root = Path(os.path.abspath(root_dir))
+        # Deterministic, so a retried job reuses the same scratch tree
+        self.job_root = Path(os.path.abspath(scratch_dir)) / f"stw_job_S{subject_num}"
+        self.subject_num = subject_num
+        self.logger = logger or logging.getLogger("scratch_staging")
+        self._staged: Dict[Path, Tuple[int, float]] = {}
+
+    # ------------------------------------------------------------------
+    # Path mapping
+    # ------------------------------------------------------------------
+
+    def _relative(self, path: Path) -> Optional[Path]:
+        try:
+            return Path(os.path.abspath(path)).relative_to(self.root)
+        except ValueError:
+            return None
+
+    def remap_path(self, path: Path) -> Path:
+        """root_dir/... -> job_root/...; paths outside root_dir are unchanged."""
+        rel = self._relative(Path(path))
+        return self.job_root / rel if rel is not None else Path(path)
+
+    def remap(self, path_str: str) -> str:
+        if not path_str:
+            return path_str
+        return str(self.remap_path(Path(path_str)))
+
+    def _rewrite(self, path: Path, old: Path, new: Path) -> None:
+        """Replace absolute `old` prefixes with `new` inside a text setup file."""
+        if path.suffix.lower() not in _REWRITE_SUFFIXES:
+            return
+        text = path.read_text(encoding="utf-8", errors="surrogateescape")
+        updated = text
+        for variant in {str(old), old.as_posix()}:
+            updated = updated.replace(variant, str(new))
+        if updated != text:
+            stat = path.stat()
+            path.write_text(updated, encoding="utf-8", errors="surrogateescape")
+            os.utime(path, (stat.st_atime, stat.st_mtime))
+
+    # ------------------------------------------------------------------
+    # Copy in
+    # ------------------------------------------------------------------
+
+    def _stage_file(self, src: Path) -> None:
+        src = resolve_path(src)   # a compressed sibling is staged as-is
+        dst = self.remap_path(src)
+        if dst == src or dst in self._staged or not src.is_file():
+            return
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(src, dst)
+        self._rewrite(dst, self.root, self.job_root)
+        st = dst.stat()
+        self._staged[dst] = (st.st_size, st.st_mtime)
+
+    def stage_template(self, adapted: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Copy every existing input referenced by an adapted template into scratch.
+
+        Returns:
+            A copy of the template with all root_dir paths remapped to scratch
+        """
+        staged: Dict[str, Any] = {}
+        for key, value in adapted.items():
+            if isinstance(value, str):
+                if value:
+                    self._stage_file(Path(value))
+                staged[key] = self.remap(value)
+            elif isinstance(value, list):
+                items = []
+                for item in value:
+                    if isinstance(item, dict):
+                        for v in item.values():
+                            if isinstance(v, str) and v:
+                                self._stage_file(Path(v))
+                        item = {k: self.remap(v) if isinstance(v, str) else v for k, v in item.items()}
+                    items.append(item)
+                staged[key] = items
+            else:
+                staged[key] = value
+
+        subj_dir = self.root / f"S{self.subject_num}"
+        for rel in EXTRA_INPUTS:
+            self._stage_file(subj_dir / rel)
+        self.remap_path(subj_dir).mkdir(parents=True, exist_ok=True)
+
+        self.logger.info(
+            "Staged %d input file(s) for S%s into %s",
+            len(self._staged), self.subject_num, self.job_root,
+        )
+        return staged
+
+    # ------------------------------------------------------------------
+    # Copy back
+    # ------------------------------------------------------------------
+
+    def sync_back(self) -> int:
+        """Copy every new or modified scratch file back to root_dir; returns the count."""
+        copied = 0
+        for dirpath, _, filenames in os.walk(self.job_root):
+            for name in filenames:
+                src = Path(dirpath) / name
+                st = src.stat()
+                if self._staged.get(src) == (st.st_size, st.st_mtime):
+                    continue
+                dst = self.root / src.relative_to(self.job_root)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(src, dst)
+                self._rewrite(dst, self.job_root, self.root)
+                copied += 1
+        self.logger.info("Synced %d file(s) for S%s back to %s", copied, self.subject_num, self.root)
+        return copied
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.job_root, ignore_errors=True)
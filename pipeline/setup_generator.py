@@ -0,0 +1,223 @@
+"""
+Render OpenSim setup XMLs in-process, writing only what changed.
+
+Every setup file used to come from a separate `python xx_setup.py ...`
+process per trial (interpreter start, imports, argv parsing, one write), and
+the engines then rewrote the same XMLs with printToXML on every run.  Both
+wrote identical bytes most of the time, bumping mtimes and defeating any
+mtime-based caching downstream.
+
+Here the templates of setup_files/*.py are imported once per process and
+rendered directly; the result is compared with the file on disk and only
+written when the bytes differ (opensim_io.write_if_changed).  The same
+applies to tools re-saved by the engines (print_to_xml_if_changed).
+
+Kinds and the manifest field holding their target path:
+
+    scale -> scale_xml   (mass/height from the subject registry)
+    grf   -> grf_xml     (ExternalLoads from the cached plate assignment)
+    ik    -> ik_xml
+    id    -> id_xml
+    so    -> so_xml
+
+Usage:
+    python setup_generator.py --template path/to/template.json [--subjects 01,02] [--trials stw1]
+                              [--kinds grf,ik,id,so,scale]
+    python setup_generator.py --manifest path/to/manifest.json
+"""
+
+import sys
+import logging
+import importlib
+import argparse
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from opensim_io import PathLike, write_if_changed
+from subject_registry import default_registry
+
+
+SETUP_DIR = Path(__file__).resolve().parent.parent / "setup_files"
+
+SETUP_FIELDS = {"scale": "scale_xml", "grf": "grf_xml", "ik": "ik_xml", "id": "id_xml", "so": "so_xml"}
+SETUP_SCRIPTS = {"scale": "scale_setup", "grf": "grf_setup", "ik": "ik_setup", "id": "id_setup", "so": "SO_setup"}
+SETUP_KINDS = tuple(SETUP_FIELDS)
+
+
+# ---------------------------------------------------------------------------
+# Templates
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def _script(kind: str):
+    """The setup_files module of one kind, imported once per process."""
+    if str(SETUP_DIR) not in sys.path:
+        sys.path.insert(0, str(SETUP_DIR))
+    return importlib.import_module(SETUP_SCRIPTS[kind])
+
+
+def render_setup(
+    kind: str,
+    subj_dir: PathLike,
+    trial: Dict[str, Any],
+    model_file: PathLike,
+    details: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    """
+    Setup XML text of one kind for one trial (`trial` is ignored for scale).
+    `details` is the subject's registry record (a manifest entry's "details");
+    looked up in the default registry when not given.  None when there is
+    nothing to render (subject not in the registry, no force plate assigned
+    to a foot).
+    """
+    subj_dir = Path(subj_dir)
+    trial_name = trial.get("trial") or Path(trial.get("trial_trc", "")).stem
+    if kind == "scale":
+        details = details or default_registry().get(subj_dir.name)
+        if not details:
+            return None
+        return _script(kind).render(subj_dir.name, details["mass"], details["height"], model_file)
+    if kind == "grf":
+        return _script(kind).render(subj_dir, trial.get("trial_mot", ""), trial.get("trial_trc", ""))
+    if kind == "ik":
+        return _script(kind).render(subj_dir, trial_name, model_file, trial.get("trial_trc", ""))
+    if kind in ("id", "so"):
+        return _script(kind).render(subj_dir, trial_name, model_file)
+    raise ValueError(f"Unknown setup kind: {kind}")
+
+
+def write_setup(
+    kind: str,
+    subj_dir: PathLike,
+    trial: Dict[str, Any],
+    model_file: PathLike,
+    path: Optional[PathLike] = None,
+    details: Optional[Dict[str, Any]] = None,
+) -> Optional[bool]:
+    """
+    Render and write one setup file (default target: the trial's field for
+    `kind`).  True when written, False when the file already had exactly this
+    content, None when there was no target or nothing to render.
+    """
+    path = path or trial.get(SETUP_FIELDS[kind], "")
+    if not path:
+        return None
+    text = render_setup(kind, subj_dir, trial, model_file, details)
+    if text is None:
+        return None
+    return write_if_changed(path, text)
+
+
+def print_to_xml_if_changed(tool: Any, path: PathLike) -> bool:
+    """tool.printToXML(path), keeping the existing file (and its mtime) when identical."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tool.printToXML(str(tmp))
+    try:
+        if path.is_file() and path.read_bytes() == tmp.read_bytes():
+            return False
+        tmp.replace(path)
+        return True
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+# ---------------------------------------------------------------------------
+# Batch
+# ---------------------------------------------------------------------------
+
+def generate_setups(
+    manifest: Dict[str, Any],
+    kinds=SETUP_KINDS,
+    logger: Optional[logging.Logger] = None,
+) -> Dict[str, int]:
+    """
+    Render every requested setup of every subject/trial of a compiled
+    manifest in this process.  Returns counts of written, unchanged,
+    skipped (no target / nothing to render) and failed files.
+    """
+    logger = logger or logging.getLogger(__name__)
+    counts = {"written": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+    entries = manifest.get("subjects", [])
+    for idx, entry in enumerate(entries, 1):
+        subj_dir = Path(entry["subj_dir"])
+        model_file = entry.get("model", "")
+        targets = [("scale", {}, entry.get("scale_xml", ""))] if "scale" in kinds else []
+        targets += [(k, t, None) for t in entry.get("mapped_trials", []) for k in kinds if k != "scale"]
+
+        before = dict(counts)
+        for kind, trial, path in targets:
+            try:
+                wrote = write_setup(kind, subj_dir, trial, model_file, path, entry.get("details"))
+            except Exception as exc:
+                logger.error("S%s %s %s setup failed: %s", entry["subject"],
+                             trial.get("trial", ""), kind, exc)
+                counts["failed"] += 1
+                continue
+            counts["skipped" if wrote is None else "written" if wrote else "unchanged"] += 1
+        logger.info("[%d/%d] S%s  %d written, %d unchanged, %d skipped, %d failed", idx, len(entries),
+                    entry["subject"], *(counts[k] - before[k] for k in counts))
+    return counts
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Render setup XMLs for a manifest in one process, writing only changed files",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--template", default="", help="Path to template JSON file")
+    source.add_argument("--manifest", default="", help="Compiled manifest JSON (instead of --template)")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--trials", default="", help="Comma-separated trial names (default: all)")
+    parser.add_argument("--kinds", default=",".join(SETUP_KINDS),
+                        help=f"Comma-separated setup kinds: {','.join(SETUP_KINDS)} (default: all)")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from manifest import compile_manifest, load_manifest, load_template, restrict_trials
+    from pipeline_cli import discover_subjects, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    kinds = [k.strip().lower() for k in args.kinds.split(",") if k.strip()]
+    unknown = set(kinds) - set(SETUP_KINDS)
+    if unknown:
+        logger.error("Unknown setup kind(s): %s", sorted(unknown))
+        sys.exit(1)
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()]
+    trials = [t.strip() for t in args.trials.split(",") if t.strip()] or None
+    try:
+        if args.manifest:
+            manifest = load_manifest(Path(args.manifest))
+            manifest["subjects"] = [
+                restrict_trials(e, trials) if trials else e
+                for e in manifest["subjects"] if not subjects or e["subject"] in subjects
+            ]
+        else:
+            template = load_template(Path(args.template))
+            root_dir = Path(template.get("root_dir") or "")
+            manifest = compile_manifest(template, subjects or discover_subjects(root_dir), trials)
+    except (OSError, ValueError) as exc:
+        logger.error("%s", exc)
+        sys.exit(1)
+
+    counts = generate_setups(manifest, kinds, logger)
+    logger.info("Setup files: %d written, %d unchanged, %d skipped, %d failed",
+                counts["written"], counts["unchanged"], counts["skipped"], counts["failed"])
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
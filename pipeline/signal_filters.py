@@ -0,0 +1,141 @@
+"""
+Zero-phase Butterworth filtering shared by the event, leg-assignment and
+plotting code.
+
+Filters whole blocks in one call: a 1-D signal, a (frames x channels) block or
+a (trials x frames x channels) stack are all filtered along `axis` by a single
+sosfiltfilt pass.  Designs are second-order sections (stable at low
+cutoff/fs ratios where (b, a) polynomials are not) and cached by
+(order, cutoff, fs, btype), so per-trial calls never redesign the filter.
+
+NaN gaps (occluded markers, unloaded plates) are bridged by linear
+interpolation before filtering and put back afterwards, so one missing sample
+no longer turns a whole channel into NaN.
+
+    xyz_f = lowpass(markers.xyz, cutoff=6.0, fs=200.0)           # (frames, markers, 3)
+    grf_f = lowpass(grf.block(cols), cutoff=20.0, fs=1000.0)     # (frames, channels)
+    trials_f = filter_trials([a, b, c], cutoff=6.0, fs=200.0)    # ragged lengths
+"""
+
+from functools import lru_cache
+from typing import List, Sequence
+
+import numpy as np
+from scipy.signal import butter, sosfiltfilt
+
+
+# ---------------------------------------------------------------------------
+# Filter design
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def butter_sos(order: int, cutoff: float, fs: float, btype: str = "low") -> np.ndarray:
+    """
+    Cached Butterworth design in second-order sections.
+
+    The cutoff is clamped to 95 % of Nyquist so a high cutoff on a low-rate
+    signal degrades gracefully instead of raising.
+    """
+    nyq = 0.5 * fs
+    wn = min(float(cutoff), 0.95 * nyq) / nyq
+    return butter(int(order), wn, btype=btype, output="sos")
+
+
+# ---------------------------------------------------------------------------
+# NaN handling
+# ---------------------------------------------------------------------------
+
+def fill_gaps(block: np.ndarray) -> np.ndarray:
+    """
+    Linearly interpolate NaNs along axis 0 of a (frames x channels) block.
+
+    Leading/trailing gaps hold the nearest valid sample; all-NaN channels
+    become zeros.  Only channels that actually contain NaNs are touched.
+    """
+    out = np.array(block, dtype=float, copy=True)
+    missing = np.isnan(out)
+    frames = np.arange(out.shape[0])
+    for ch in np.flatnonzero(missing.any(axis=0)):
+        valid = ~missing[:, ch]
+        if valid.any():
+            out[:, ch] = np.interp(frames, frames[valid], out[valid, ch])
+        else:
+            out[:, ch] = 0.0
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Filtering
+# ---------------------------------------------------------------------------
+
+def _filter(data: np.ndarray, sos: np.ndarray, axis: int) -> np.ndarray:
+    data = np.asarray(data, dtype=float)
+    missing = np.isnan(data)
+    if not missing.any():
+        return sosfiltfilt(sos, data, axis=axis)
+
+    # Bridge gaps on a (frames x everything-else) view, filter, restore NaNs
+    moved = np.moveaxis(data, axis, 0)
+    flat = fill_gaps(moved.reshape(moved.shape[0], -1)).reshape(moved.shape)
+    out = sosfiltfilt(sos, flat, axis=0)
+    out[np.moveaxis(missing, axis, 0)] = np.nan
+    return np.moveaxis(out, 0, axis)
+
+
+def lowpass(
+    data: np.ndarray,
+    cutoff: float,
+    fs: float,
+    order: int = 4,
+    axis: int = 0,
+) -> np.ndarray:
+    """
+    Zero-phase low-pass Butterworth filter along `axis` (time).
+
+    Args:
+        data: 1-D signal, (frames x channels) block or any N-d array
+        cutoff: Cut-off frequency in Hz
+        fs: Sampling rate in Hz
+        order: Design order (the zero-phase pass doubles the effective order)
+        axis: Time axis of `data`
+
+    Returns:
+        Filtered array with the shape of `data`; NaN samples stay NaN
+    """
+    return _filter(data, butter_sos(order, cutoff, fs, "low"), axis)
+
+
+def highpass(
+    data: np.ndarray,
+    cutoff: float,
+    fs: float,
+    order: int = 4,
+    axis: int = 0,
+) -> np.ndarray:
+    """Zero-phase high-pass counterpart of lowpass()."""
+    return _filter(data, butter_sos(order, cutoff, fs, "high"), axis)
+
+
+def filter_trials(
+    trials: Sequence[np.ndarray],
+    cutoff: float,
+    fs: float,
+    order: int = 4,
+    btype: str = "low",
+) -> List[np.ndarray]:
+    """
+    Filter a batch of trials (each frames x ...) of possibly different lengths.
+
+    Trials sharing a shape are stacked and filtered in one call; the result
+    list is in the input order.
+    """
+    sos = butter_sos(order, cutoff, fs, btype)
+    out: List[np.ndarray] = [np.empty(0)] * len(trials)
+    groups: dict = {}
+    for i, trial in enumerate(trials):
+        groups.setdefault(np.shape(trial), []).append(i)
+    for indices in groups.values():
+        stacked = _filter(np.stack([np.asarray(trials[i], dtype=float) for i in indices]), sos, axis=1)
+        for i, filtered in zip(indices, stacked):
+            out[i] = filtered
+    return out
@@ -0,0 +1,330 @@
+"""
+Sit-to-walk phase segmentation from GRF and marker arrays.
+
+Each trial is cut into the phases the analysis notebooks use, from one
+filtered block of every plate's vertical force and one block of the foot
+markers:
+
+    initiation         foot-plate load leaves its quiet-sitting level
+                       (graph.ipynb detect_intiation_force, without the
+                       hard-coded 210 N / [200:frame-50] window)
+    seat_off           peak load on the foot plate between initiation and the
+                       first step (whole body weight transferred to the feet)
+    first_toe_off      first toe marker lifted TOE_LIFT_M above its seated
+                       height (the leading foot leaves the ground)
+    first_heel_strike  first heel strike on a walking plate
+    gait_end           first toe off from the last walking plate
+                       (graph.ipynb detect_gait_end)
+
+    quiet_sitting  [0, initiation)     initiation  [initiation, seat_off)
+    transition     [seat_off, first_heel_strike)
+    steady_gait    [first_heel_strike, gait_end]
+
+The foot plate is the one carrying load at the start of the trial; walking
+plates are those first loaded later.  All times are in seconds; convert with
+phase_frames() for IK/ID (200 Hz) or GRF (1000 Hz) rows.
+
+    row = segment_trial(trc, mot)
+    start, end = phase_frames(row, rate=200.0)["steady_gait"]
+
+Usage:
+    python stw_phases.py --root D:/RESEARCH/STW_dataset/Extracted [--subjects 01,02] [--cores N]
+                         [--out stw_phases.csv]
+"""
+
+import sys
+import csv
+import logging
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from batch_runner import run_jobs
+from leg_assignment import FOOT_MARKERS, TrialInputs, discover_trials, plate_ids
+from opensim_io import MarkerData, PathLike, Storage, read_storage, read_trc
+from run_length import baseline_threshold, first_sustained, stance_events
+from signal_filters import lowpass
+
+
+EVENTS = ("initiation", "seat_off", "first_toe_off", "first_heel_strike", "gait_end")
+
+# phase -> (start event, end event); None is the start of the trial
+PHASES = {
+    "quiet_sitting": (None, "initiation"),
+    "initiation": ("initiation", "seat_off"),
+    "transition": ("seat_off", "first_heel_strike"),
+    "steady_gait": ("first_heel_strike", "gait_end"),
+}
+
+GRF_LOWPASS_HZ = 20.0
+MARKER_LOWPASS_HZ = 6.0
+
+# Quiet-sitting reference window (s); the first 0.2 s is skipped as in graph.ipynb
+QUIET_WINDOW_S = (0.2, 1.0)
+
+# Initiation: the baseline ends INITIATION_GAP_S before the load first exceeds
+# RISE_FACTOR x the quiet level; onset is mean + INITIATION_NOISE_MULT x std
+RISE_FACTOR = 1.25
+INITIATION_GAP_S = 0.05
+INITIATION_NOISE_MULT = 2.0
+
+# Stance on a plate (same defaults as detect_gait_end)
+STANCE_THRESHOLD_N = 20.0
+STANCE_MIN_WIDTH = 15
+
+# A toe lifted this far (m) above its seated height for TOE_MIN_S is off the ground
+TOE_LIFT_M = 0.02
+TOE_MIN_S = 0.05
+
+# Vertical axis of the OpenSim frame (Y up)
+VERTICAL = 1
+
+PHASE_FIELDS = ["subject", "trial"] + [f"{e}_s" for e in EVENTS] + [
+    "first_toe_off_side", "first_heel_strike_plate", "foot_plate", "status", "error",
+]
+
+
+# ---------------------------------------------------------------------------
+# Events
+# ---------------------------------------------------------------------------
+
+def _seconds(time: np.ndarray, frame) -> Optional[float]:
+    frame = int(frame)
+    return round(float(time[frame]), 4) if frame >= 0 else None
+
+
+def grf_events(grf: Storage) -> dict:
+    """
+    initiation, seat_off, first_heel_strike and gait_end from every plate's
+    vertical force, filtered and scanned as one (frames x plates) block.
+    """
+    plates = plate_ids(grf.columns)
+    if not plates:
+        raise ValueError(f"No ground_force_N_vy columns in {grf.name or 'GRF data'}")
+    fs, t = grf.rate, grf.time
+    fz = lowpass(grf.block([f"ground_force_{p}_vy" for p in plates]), GRF_LOWPASS_HZ, fs)
+
+    quiet = (int(QUIET_WINDOW_S[0] * fs), int(QUIET_WINDOW_S[1] * fs))
+    quiet_level, _ = baseline_threshold(fz, quiet, noise_mult=0.0)
+    foot = int(np.argmax(quiet_level))
+    if quiet_level[foot] <= STANCE_THRESHOLD_N:
+        raise ValueError("No plate is loaded while sitting")
+
+    hs, to = stance_events(fz, STANCE_THRESHOLD_N, STANCE_MIN_WIDTH)
+    walking = [i for i in range(len(plates)) if i != foot and hs[:, i].any()]
+    first_hs = first_sustained(hs, 1)                        # per plate, -1 if none
+    first_to = first_sustained(to, 1)
+
+    events = {"foot_plate": plates[foot], "first_heel_strike_plate": None}
+    load = fz[:, foot]
+
+    # Initiation: adaptive threshold over the quiet part before the load rises
+    rise = int(first_sustained(load > RISE_FACTOR * quiet_level[foot], 1))
+    initiation = -1
+    if rise > quiet[0] + int(INITIATION_GAP_S * fs):
+        _, thresh = baseline_threshold(load, (quiet[0], rise - int(INITIATION_GAP_S * fs)),
+                                       noise_mult=INITIATION_NOISE_MULT)
+        initiation = int(first_sustained(load > thresh, 1))
+    events["initiation"] = _seconds(t, initiation)
+
+    step = -1
+    gait_end = -1
+    if walking:
+        order = sorted(walking, key=lambda i: first_hs[i])
+        step = int(first_hs[order[0]])
+        events["first_heel_strike_plate"] = plates[order[0]]
+        # toe off from the last walking plate, after its own heel strike
+        last = order[-1]
+        offs = np.flatnonzero(to[first_hs[last]:, last])
+        gait_end = int(first_hs[last] + offs[0]) if len(offs) else int(first_to[last])
+    events["first_heel_strike"] = _seconds(t, step)
+    events["gait_end"] = _seconds(t, gait_end)
+
+    # Seat-off: peak foot-plate load between initiation and the first step
+    seat_off = -1
+    if initiation >= 0:
+        stop = step if step > initiation else len(load)
+        seat_off = initiation + int(np.argmax(load[initiation:stop]))
+    events["seat_off"] = _seconds(t, seat_off)
+    return events
+
+
+def marker_events(markers: MarkerData, after_s: Optional[float] = None) -> dict:
+    """
+    first_toe_off (time and side) from both toe markers' height above their
+    seated level, filtered and scanned as one (frames x 2) block.
+    """
+    sides = list(FOOT_MARKERS)
+    toes = np.stack([markers.marker(FOOT_MARKERS[s][1])[:, VERTICAL] for s in sides], axis=1)
+    toes = lowpass(toes, MARKER_LOWPASS_HZ, markers.rate)
+    fs, t = markers.rate, markers.time
+
+    quiet = (int(QUIET_WINDOW_S[0] * fs), int(QUIET_WINDOW_S[1] * fs))
+    seated, _ = baseline_threshold(toes, quiet, noise_mult=0.0)
+    lifted = toes > seated + TOE_LIFT_M
+    if after_s is not None:
+        lifted[t < after_s] = False
+    lift = first_sustained(lifted, max(1, int(TOE_MIN_S * fs)))    # per side
+
+    if (lift < 0).all():
+        return {"first_toe_off": None, "first_toe_off_side": None}
+    valid = np.where(lift >= 0, lift, np.iinfo(int).max)
+    side = int(np.argmin(valid))
+    return {"first_toe_off": _seconds(t, lift[side]), "first_toe_off_side": sides[side]}
+
+
+# ---------------------------------------------------------------------------
+# Trial
+# ---------------------------------------------------------------------------
+
+def segment_from_data(markers: MarkerData, grf: Storage) -> dict:
+    """Event times (s) and metadata for one parsed trial."""
+    events = grf_events(grf)
+    events.update(marker_events(markers, after_s=events["initiation"]))
+    return events
+
+
+def segment_trial(trc_file: PathLike, mot_file: PathLike) -> dict:
+    """Event times (s) for one trial; each file is parsed once."""
+    return segment_from_data(read_trc(trc_file), read_storage(mot_file))
+
+
+def phase_intervals(row: dict) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """{phase: (start_s, end_s)} from a segment_trial() result or a phase-table row."""
+    def value(event):
+        if event is None:
+            return 0.0
+        v = row.get(event, row.get(f"{event}_s"))
+        return None if v in (None, "") else float(v)
+    return {phase: (value(start), value(end)) for phase, (start, end) in PHASES.items()}
+
+
+def phase_frames(row: dict, rate: float) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """phase_intervals() as frame indices at `rate` Hz (e.g. 200 for IK/ID rows)."""
+    return {
+        phase: tuple(None if s is None else int(round(s * rate)) for s in span)
+        for phase, span in phase_intervals(row).items()
+    }
+
+
+# ---------------------------------------------------------------------------
+# Per-trial worker
+# ---------------------------------------------------------------------------
+
+def segment_job(args: TrialInputs) -> dict:
+    subj_dir, trial, trc_file, mot_file = args
+    row = {"subject": Path(subj_dir).name, "trial": trial, "status": "", "error": ""}
+    try:
+        events = segment_trial(trc_file, mot_file)
+        row.update({f"{e}_s": events[e] for e in EVENTS})
+        row.update({k: events[k] for k in ("first_toe_off_side", "first_heel_strike_plate", "foot_plate")})
+        missing = [e for e in EVENTS if events[e] is None]
+        row["status"] = "partial" if missing else "ok"
+        if missing:
+            row["error"] = "not found: " + ", ".join(missing)
+    except Exception as exc:
+        row["status"] = "failed"
+        row["error"] = str(exc)
+    return row
+
+
+def segment_all(
+    trials: List[TrialInputs],
+    cores: int = 1,
+    logger: Optional[logging.Logger] = None,
+) -> List[dict]:
+    """Segment every trial, in a spawn-context process pool when cores > 1."""
+    return run_jobs(segment_job, trials, cores, _log_row, logger or logging.getLogger("stw_phases"),
+                    key=lambda r: (r["subject"], r["trial"]))
+
+
+def _log_row(logger: logging.Logger, done: int, total: int, row: dict) -> None:
+    if row["status"] == "failed":
+        logger.error("[%d/%d] %s %s  FAILED: %s", done, total, row["subject"], row["trial"], row["error"])
+    elif row["status"] == "partial":
+        logger.warning("[%d/%d] %s %s  %s", done, total, row["subject"], row["trial"], row["error"])
+    else:
+        logger.info("[%d/%d] %s %s  seat-off %.3f s, gait end %.3f s", done, total,
+                    row["subject"], row["trial"], row["seat_off_s"], row["gait_end_s"])
+
+
+# ---------------------------------------------------------------------------
+# Phase table
+# ---------------------------------------------------------------------------
+
+def write_phase_table(rows: List[dict], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=PHASE_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def load_phase_table(path: Path) -> Dict[Tuple[str, str], dict]:
+    """{(subject, trial): row} with event times as floats (None when missing)."""
+    table = {}
+    with open(path, newline="") as fh:
+        for row in csv.DictReader(fh):
+            for event in EVENTS:
+                value = row.get(f"{event}_s", "")
+                row[f"{event}_s"] = float(value) if value else None
+            table[(row["subject"], row["trial"])] = row
+    return table
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Sit-to-walk phase segmentation into one phase table",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--root", required=True, help="Dataset root containing Sxx folders")
+    parser.add_argument("--subjects", default="", help="Comma-separated subject numbers (default: all)")
+    parser.add_argument("--cores", type=int, default=0, help="Worker processes (default: physical_cores - 1)")
+    parser.add_argument("--out", default="", help="Phase table CSV (default: <root>/stw_phases.csv)")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser
+
+
+def main():
+    from file_inventory import FileInventory
+    from pipeline_cli import physical_core_count, setup_logging
+
+    args = build_parser().parse_args()
+    logger = setup_logging(args.log_level)
+
+    root_dir = Path(args.root)
+    if not root_dir.is_dir():
+        logger.error("root_dir does not exist: %s", root_dir)
+        sys.exit(1)
+
+    subjects = [s.strip().zfill(2) for s in args.subjects.split(",") if s.strip()] or None
+    trials = discover_trials(root_dir, subjects, FileInventory.open(root_dir, logger=logger))
+    if not trials:
+        logger.error("No TRC / GRF trial pairs found under %s", root_dir)
+        sys.exit(1)
+
+    cores = args.cores if args.cores > 0 else max(1, physical_core_count() - 1)
+    t0 = time.monotonic()
+    rows = segment_all(trials, cores=cores, logger=logger)
+    out_path = Path(args.out or root_dir / "stw_phases.csv")
+    write_phase_table(rows, out_path)
+    logger.info("%d trial(s) written to %s in %.1f s", len(rows), out_path, time.monotonic() - t0)
+
+    failed = [r for r in rows if r["status"] == "failed"]
+    if failed:
+        logger.error("Failed trials: %s", [f"{r['subject']}/{r['trial']}" for r in failed])
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # Required on Windows with frozen/spawn executables
+    main()
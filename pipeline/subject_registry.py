@@ -0,0 +1,202 @@
+"""
+Subject metadata registry: one indexed lookup of 'Subject Details.csv'.
+
+Scale setups, mass normalisation of ID moments and cohort grouping each
+used to open the CSV and scan every row for the one subject they needed
+(scale_setup.py even chdir'ed to find it, once per subject, in a new
+process).  The registry reads the file once into {subject_id: record}:
+
+    {"sex": "M", "age": 21.0, "mass": 64.5, "height": 1.72,
+     "dominant_foot": "Right", "age_group": "young"}
+
+Records are plain dicts, so a registry (or one subject's record) pickles
+cheaply into worker processes.  Lookups accept 'S01', '01' or 1.
+
+Cohorts are queries instead of hard-coded lists:
+
+    reg = SubjectRegistry.load()
+    reg.where(age_group="older", sex="F")                  # ['S31', 'S36', ...]
+    reg.numbers(age_group="young", selection="abstract")   # [3, 6, 8, 17, 23, 35]
+    reg.mass("S01")                                         # 64.5
+
+Named selections (SELECTIONS) are subject subsets picked by hand, e.g. the
+three men and three women per age group used in the abstract.
+
+Usage:
+    python subject_registry.py [--csv "Subject Details.csv"] [--age-group older] [--sex F]
+                               [--selection abstract]
+"""
+
+import csv
+import sys
+import argparse
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+from opensim_io import Storage
+
+
+DEFAULT_SUBJECT_CSV = Path(__file__).resolve().parent.parent / "Subject Details.csv"
+
+# Age groups used in the abstract (years, inclusive)
+AGE_GROUPS = {
+    "young": (19, 35),
+    "middle": (36, 55),
+    "older": (56, 200),
+}
+
+# Hand-picked subsets; every member must also satisfy the query it is used with
+SELECTIONS: Dict[str, List[str]] = {
+    "abstract": [
+        "S08", "S06", "S23", "S03", "S17", "S35",      # young:  M 08,06,23  F 03,17,35
+        "S29", "S65", "S52", "S34", "S30", "S43",      # middle: M 29,65,52  F 34,30,43
+        "S53", "S55", "S45", "S54", "S42", "S56",      # older:  M 53,55,45  F 54,42,56
+    ],
+}
+
+SubjectKey = Union[str, int]
+
+
+def age_group(age: float) -> str:
+    for name, (lo, hi) in AGE_GROUPS.items():
+        if lo <= age <= hi:
+            return name
+    return ""
+
+
+def subject_id(subject: SubjectKey) -> str:
+    """'S01' for 'S01', 's1', '01' or 1."""
+    text = str(subject).strip()
+    digits = text[1:] if text[:1] in ("S", "s") else text
+    return f"S{int(digits):02d}" if digits.isdigit() else text
+
+
+def load_subject_details(csv_path: Path = DEFAULT_SUBJECT_CSV) -> Dict[str, dict]:
+    """Read 'Subject Details.csv' into {subject_id: metadata}."""
+    details: Dict[str, dict] = {}
+    with open(csv_path, "r", newline="") as fh:
+        for row in csv.DictReader(fh):
+            age = float(row["Age (Years)"])
+            details[row["Subject Number"]] = {
+                "sex": row["Sex"],
+                "age": age,
+                "mass": float(row["Weight (kg)"]),
+                "height": float(row["Height (m)"]),
+                "dominant_foot": row["Dominant Foot"],
+                "age_group": age_group(age),
+            }
+    return details
+
+
+class SubjectRegistry:
+    """Subject metadata keyed by subject id, with cohort queries."""
+
+    def __init__(self, details: Dict[str, dict]):
+        self.details = {subject_id(s): d for s, d in details.items()}
+
+    @classmethod
+    def load(cls, csv_path: Path = DEFAULT_SUBJECT_CSV) -> "SubjectRegistry":
+        return cls(load_subject_details(Path(csv_path)))
+
+    def __contains__(self, subject: SubjectKey) -> bool:
+        return subject_id(subject) in self.details
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.subjects)
+
+    def __len__(self) -> int:
+        return len(self.details)
+
+    @property
+    def subjects(self) -> List[str]:
+        return sorted(self.details, key=lambda s: (len(s), s))
+
+    def get(self, subject: SubjectKey) -> Optional[dict]:
+        return self.details.get(subject_id(subject))
+
+    def __getitem__(self, subject: SubjectKey) -> dict:
+        record = self.get(subject)
+        if record is None:
+            raise KeyError(f"Subject {subject_id(subject)} not in subject registry")
+        return record
+
+    def mass(self, subject: SubjectKey) -> float:
+        return self[subject]["mass"]
+
+    def height(self, subject: SubjectKey) -> float:
+        return self[subject]["height"]
+
+    def where(self, selection: Optional[str] = None, **criteria) -> List[str]:
+        """
+        Subject ids whose record matches every criterion, e.g.
+        where(age_group="older", sex="F"), optionally within a named selection.
+
+        Raises:
+            KeyError: unknown selection
+        """
+        pool = self.subjects
+        if selection is not None:
+            members = {subject_id(s) for s in SELECTIONS[selection]}
+            pool = [s for s in pool if s in members]
+        return [s for s in pool if all(self.details[s].get(k) == v for k, v in criteria.items())]
+
+    def numbers(self, selection: Optional[str] = None, **criteria) -> List[int]:
+        """where() as subject numbers (S08 -> 8), as the plotting notebooks index them."""
+        return [int(s[1:]) for s in self.where(selection, **criteria)]
+
+    def groups(self, selection: Optional[str] = None, **criteria) -> Dict[str, List[str]]:
+        """{age group: subject ids} for every age group."""
+        return {g: self.where(selection, age_group=g, **criteria) for g in AGE_GROUPS}
+
+    def per_kg(self, subject: SubjectKey, storage: Storage) -> Storage:
+        """Copy of an ID result with every *_moment / *_force column divided by body mass."""
+        mass = self.mass(subject)
+        data = storage.data.copy()
+        cols = [i for i, c in enumerate(storage.columns) if c.endswith(("_moment", "_force"))]
+        data[:, cols] /= mass
+        return Storage(columns=list(storage.columns), data=data,
+                       header=dict(storage.header), name=storage.name)
+
+
+@lru_cache(maxsize=None)
+def default_registry(csv_path: str = str(DEFAULT_SUBJECT_CSV)) -> SubjectRegistry:
+    """The registry of the project's CSV, read once per process (empty when the file is missing)."""
+    if not Path(csv_path).is_file():
+        return SubjectRegistry({})
+    return SubjectRegistry.load(Path(csv_path))
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Query subject metadata",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--csv", default=str(DEFAULT_SUBJECT_CSV), help="Subject Details CSV")
+    parser.add_argument("--age-group", default="", choices=["", *AGE_GROUPS], help="Only this age group")
+    parser.add_argument("--sex", default="", help="Only this sex (M/F)")
+    parser.add_argument("--selection", default="", choices=["", *SELECTIONS], help="Only this named selection")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if not Path(args.csv).is_file():
+        print(f"Error: CSV file '{args.csv}' not found", file=sys.stderr)
+        sys.exit(1)
+
+    registry = SubjectRegistry.load(Path(args.csv))
+    criteria = {k: v for k, v in (("age_group", args.age_group), ("sex", args.sex)) if v}
+    for s in registry.where(args.selection or None, **criteria):
+        d = registry[s]
+        print(f"{s}  {d['sex']}  {d['age']:5.0f}  {d['mass']:6.2f} kg  {d['height']:.2f} m  "
+              f"{d['dominant_foot']:<5}  {d['age_group']}")
+
+
+if __name__ == "__main__":
+    main()
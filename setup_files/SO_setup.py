@@ -1,6 +1,7 @@
-import os
 import sys
 from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pipeline"))
+from opensim_io import write_if_changed
 
 # Template XML content
 xml_template = '''<?xml version="1.0" encoding="UTF-8" ?>
@@ -78,31 +79,34 @@ xml_template = '''<?xml version="1.0" encoding="UTF-8" ?>
 
 '''
 
-# Create output directory if it doesn't exist
-if len(sys.argv) < 3:
-	print("Usage: python SO_setup.py <sub_directory> <trial_name> <model_file>")
-	sys.exit(1)
-     
-subjdir = Path(sys.argv[1])
-trial = Path(sys.argv[2]).name.removesuffix('.trc').removeprefix('stw')  # Extract trial from filename
-model_file = Path(sys.argv[3])
-filepath = Path(sys.argv[4])
-# Create output directory if it doesn't exist
-output_dir = filepath.parent
-os.makedirs(output_dir, exist_ok=True)
-subject = subjdir.name
+def render(subjdir, trial_name, model_file):
+	"""SO (AnalyzeTool) setup XML for one trial."""
+	trial = Path(str(trial_name)).name.removesuffix('.trc').removeprefix('stw')  # Extract trial from filename
+	return xml_template.format(trial=trial, subject=Path(subjdir).name, model_file=model_file)
 
-xml_content = xml_template.format(trial=trial,subject=subject, model_file=model_file)
 
-# Create filename
-# filename = rf"so_setup_{subject.lower()}_stw{trial}.xml"
-# filepath = os.path.join(output_dir, filename)
+def main():
+	if len(sys.argv) < 3:
+		print("Usage: python SO_setup.py <sub_directory> <trial_name> <model_file>")
+		sys.exit(1)
 
-# Write to file
-with open(filepath, 'w', encoding='UTF-8') as f:
-	f.write(xml_content)
+	subjdir = Path(sys.argv[1])
+	model_file = Path(sys.argv[3])
+	filepath = Path(sys.argv[4])
 
-print(f"Created: {filepath}")
+	# Create filename
+	# filename = rf"so_setup_{subject.lower()}_stw{trial}.xml"
+	# filepath = os.path.join(output_dir, filename)
+
+	# Write to file (creates the folder; left untouched when the content is the same)
+	if write_if_changed(filepath, render(subjdir, sys.argv[2], model_file)):
+		print(f"Created: {filepath}")
+	else:
+		print(f"Unchanged: {filepath}")
+
+
+if __name__ == "__main__":
+	main()
 # Generate files for trials 1 through 5
 # for trial in range(1, 6):
 #     # Fill in the template with current trial number
@@ -28,9 +28,15 @@ TRC fs  : 200 Hz
 GRF fs  : 1000 Hz
 """
 
+import sys
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
-from scipy.signal import butter, filtfilt
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pipeline"))
+from signal_filters import lowpass
+from run_length import detect_onsets
 
 # ── Hardcoded paths ──────────────────────────────────────────────────────────
 TRC_PATH = r"D:\RESEARCH\STW_dataset\Extracted\S30\S30\Mocap\trcResults\stw4.trc"
@@ -130,14 +136,6 @@ def parse_grf(filepath: str):
 
 # ── Signal utilities ──────────────────────────────────────────────────────────
 
-def lowpass(data: np.ndarray, cutoff: float, fs: float, order: int = 4) -> np.ndarray:
-    """Zero-phase Butterworth low-pass filter."""
-    nyq    = 0.5 * fs
-    cutoff = min(cutoff, nyq * 0.95)
-    b, a   = butter(order, cutoff / nyq, btype="low")
-    return filtfilt(b, a, data)
-
-
 def find_onset(signal: np.ndarray, fs: float,
                baseline_sec: float = 0.5,
                noise_mult:   float = 5.0,
@@ -148,21 +146,8 @@ def find_onset(signal: np.ndarray, fs: float,
 
     Returns (onset_frame_index, threshold_value).
     """
-    n_base = max(10, int(baseline_sec * fs))
-    base   = np.abs(signal[:n_base])
-    thresh = float(base.mean() + noise_mult * base.std())
-    min_fr = max(3, int(min_dur_ms / 1000.0 * fs))
-
-    above = np.abs(signal) > thresh
-    count = 0
-    for i, val in enumerate(above):
-        if val:
-            count += 1
-            if count >= min_fr:
-                return i - min_fr + 1, thresh
-        else:
-            count = 0
-    return -1, thresh
+    onset, thresh = detect_onsets(signal, fs, baseline_sec, noise_mult, min_dur_ms)
+    return int(onset), float(thresh)
 
 
 # ── Swing leg detection ───────────────────────────────────────────────────────
@@ -193,8 +178,8 @@ def detect_swing_leg(left_pos: np.ndarray, right_pos: np.ndarray,
                         "error": "Window too short"},
         }
 
-    lw = lowpass(left_pos,  MARKER_LOWPASS_HZ, trc_fs)[ws:we]
-    rw = lowpass(right_pos, MARKER_LOWPASS_HZ, trc_fs)[ws:we]
+    feet = lowpass(np.column_stack([left_pos, right_pos]), MARKER_LOWPASS_HZ, trc_fs)[ws:we]
+    lw, rw = feet[:, 0], feet[:, 1]
     dt = 1.0 / trc_fs
 
     # Metrics (positions in metres -> convert to mm for readability only)
@@ -280,17 +265,18 @@ def assign_legs(TRC_PATH = TRC_PATH, GRF_PATH = GRF_PATH) -> dict:
     left_pos  = df_trc[f"{LEFT_MARKER}_{AP_AXIS}"].values.astype(float)
     right_pos = df_trc[f"{RIGHT_MARKER}_{AP_AXIS}"].values.astype(float)
 
-    # Detect GRF onset for each plate
+    # Filter every plate's vertical force in one pass, then detect onsets
+    grf_flt = lowpass(
+        np.abs(df_grf[list(FP_COLS.values())].values.astype(float)), GRF_LOWPASS_HZ, grf_fs
+    )
+    onset_frs, threshs = detect_onsets(
+        grf_flt, grf_fs,
+        baseline_sec=BASELINE_SEC,
+        noise_mult=NOISE_MULTIPLIER,
+        min_dur_ms=MIN_CONTACT_MS,
+    )
     onsets = {}
-    for fp_label, col in FP_COLS.items():
-        sig_raw = np.abs(df_grf[col].values.astype(float))
-        sig_flt = lowpass(sig_raw, GRF_LOWPASS_HZ, grf_fs)
-        onset_fr, thresh = find_onset(
-            sig_flt, grf_fs,
-            baseline_sec=BASELINE_SEC,
-            noise_mult=NOISE_MULTIPLIER,
-            min_dur_ms=MIN_CONTACT_MS,
-        )
+    for fp_label, onset_fr, thresh in zip(FP_COLS, onset_frs.tolist(), threshs.tolist()):
         if onset_fr < 0:
             raise RuntimeError(
                 f"{fp_label}: no sustained activation found above threshold "
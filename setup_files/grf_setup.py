@@ -2,17 +2,15 @@ import os
 # import first_leg_using_just_acc as fl
 import sys
 from pathlib import Path
-import setup_files.assign_leg_to_forceplate_decreptated as assign_leg_to_forceplate_decreptated
-import first_leg_detection
+# import assign_leg_to_forceplate_decreptated
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pipeline"))
+from leg_assignment import plate_mapping
+from opensim_io import write_if_changed
 BOLD_RED = "\033[1;91m" # Bold and bright red for extra attention
 END = "\033[0m" # Reset code
 
-# Template XML content
-xml_template = '''<?xml version="1.0" encoding="UTF-8" ?>
-<OpenSimDocument Version="40500">
-	<ExternalLoads name="externalloads">
-		<objects>
-			<ExternalForce name="{leg}_cal">
+# Template XML content: one ExternalForce block per assigned force plate
+force_template = '''			<ExternalForce name="{name}">
 				<!--Name of the body the force is applied to.-->
 				<applied_to_body>calcn_{leg}</applied_to_body>
 				<!--Name of the body the force is expressed in (default is ground).-->
@@ -20,70 +18,88 @@ xml_template = '''<?xml version="1.0" encoding="UTF-8" ?>
 				<!--Name of the body the point is expressed in (default is ground).-->
 				<point_expressed_in_body>ground</point_expressed_in_body>
 				<!--Identifier (string) to locate the force to be applied in the data source.-->
-				<force_identifier>ground_force_2_v</force_identifier>
-				<!--Identifier (string) to locate the point to be applied in the data source.-->
-				<point_identifier>ground_force_2_p</point_identifier>
-				<!--Identifier (string) to locate the torque to be applied in the data source.-->
-				<torque_identifier>ground_moment_2_m</torque_identifier>
-				<!--Name of the data source (Storage) that will supply the force data.-->
-				<data_source_name>stw{trial}.mot</data_source_name>
-			</ExternalForce>
-			<ExternalForce name="{leg1}_cal">
-				<!--Name of the body the force is applied to.-->
-				<applied_to_body>calcn_{leg1}</applied_to_body>
-				<!--Name of the body the force is expressed in (default is ground).-->
-				<force_expressed_in_body>ground</force_expressed_in_body>
-				<!--Name of the body the point is expressed in (default is ground).-->
-				<point_expressed_in_body>ground</point_expressed_in_body>
-				<!--Identifier (string) to locate the force to be applied in the data source.-->
-				<force_identifier>ground_force_3_v</force_identifier>
+				<force_identifier>ground_force_{plate}_v</force_identifier>
 				<!--Identifier (string) to locate the point to be applied in the data source.-->
-				<point_identifier>ground_force_3_p</point_identifier>
+				<point_identifier>ground_force_{plate}_p</point_identifier>
 				<!--Identifier (string) to locate the torque to be applied in the data source.-->
-				<torque_identifier>ground_moment_3_m</torque_identifier>
+				<torque_identifier>ground_moment_{plate}_m</torque_identifier>
 				<!--Name of the data source (Storage) that will supply the force data.-->
 				<data_source_name>stw{trial}.mot</data_source_name>
 			</ExternalForce>
-		</objects>
+'''
+
+xml_template = '''<?xml version="1.0" encoding="UTF-8" ?>
+<OpenSimDocument Version="40500">
+	<ExternalLoads name="externalloads">
+		<objects>
+{forces}		</objects>
 		<groups />
 		<!--Storage file (.sto) containing (3) components of force and/or torque and point of application.Note: this file overrides the data source specified by the individual external forces if specified.-->
 		<datafile>{grf}</datafile>
 	</ExternalLoads>
 </OpenSimDocument>
 
-''' 
-if len(sys.argv) < 6:
-        print("Usage: python grf_setup.py subject trial trc_file grf_file filepath")
-        sys.exit(1)
+'''
+
+
+def external_forces(plates, trial):
+	"""ExternalForce blocks for a {plate: 'l'|'r'} mapping; names stay '<leg>_cal' unless a foot has several plates."""
+	per_leg = {leg: sum(1 for l in plates.values() if l == leg) for leg in set(plates.values())}
+	blocks = []
+	for plate, leg in sorted(plates.items()):
+		name = f"{leg}_cal" if per_leg[leg] == 1 else f"{leg}_cal_{plate}"
+		blocks.append(force_template.format(name=name, leg=leg, plate=plate, trial=trial))
+	return "".join(blocks)
+
+
+def render(subjdir, grf, trc_file):
+	"""
+	ExternalLoads XML for one trial, or None when no plate could be assigned
+	to a foot.
+	"""
+	trc_file = Path(trc_file)
+	# _,leg = fl.calculate_marker_acceleration(trc_path=trc_file)
+	# leg = assign_leg_to_forceplate.run(trc_file, grf)
+	# leg = first_leg_detection.detect_first_leg(trc_file, grf)
+	# Every ground_force_N plate owned by one foot (cached per trial)
+	plates = plate_mapping(Path(subjdir), trc_file.stem, trc_file, Path(grf))
+	if not plates:
+		return None
+	# Fill in the template with current trial number
+	return xml_template.format(forces=external_forces(plates, str(trc_file.stem)[-1]), grf=grf)
 
 
-subject = int(sys.argv[1])
-subjdir = Path(sys.argv[2])
-grf = Path(sys.argv[3])
-trc_file = Path(sys.argv[4])
-filepath = Path(sys.argv[5])
-# Create output directory if it doesn't exist
-output_dir = rf"{subjdir}\ID\grf"
-os.makedirs(output_dir, exist_ok=True)
+def main():
+	if len(sys.argv) < 6:
+		print("Usage: python grf_setup.py subject trial trc_file grf_file filepath")
+		sys.exit(1)
 
+	subjdir = Path(sys.argv[2])
+	grf = Path(sys.argv[3])
+	trc_file = Path(sys.argv[4])
+	filepath = Path(sys.argv[5])
+	# Create output directory if it doesn't exist
+	output_dir = rf"{subjdir}\ID\grf"
+	os.makedirs(output_dir, exist_ok=True)
 
-c3d_file = trc_file.parent.parent / f"{trc_file.stem}.c3d"
+	xml_content = render(subjdir, grf, trc_file)
+	if xml_content is None:
+		print(f"{BOLD_RED}No force plate could be assigned to a foot for {trc_file.stem}{END}")
+		sys.exit(1)
 
-# _,leg = fl.calculate_marker_acceleration(trc_path=trc_file)
-# leg = assign_leg_to_forceplate.run(trc_file, grf)
-leg = first_leg_detection.detect_first_leg(trc_file, grf)
-# Fill in the template with current trial number
-xml_content = xml_template.format(trial=str(trc_file.stem)[-1],leg=leg[0].lower(),leg1='r' if leg[0].lower() == 'l' else 'l',grf=grf)
+	# Create filename
+	# filename = f"grf_{subject:02d}_stw{trial}.xml"
+	# filepath = os.path.join(output_dir, filename)
 
-# Create filename
-# filename = f"grf_{subject:02d}_stw{trial}.xml"
-# filepath = os.path.join(output_dir, filename)
+	# Write to file (left untouched when the content is the same)
+	if write_if_changed(filepath, xml_content):
+		print(f"Created: {filepath}")
+	else:
+		print(f"Unchanged: {filepath}")
 
-# Write to file
-with open(filepath, 'w', encoding='UTF-8') as f:
-	f.write(xml_content)
 
-print(f"Created: {filepath}")
+if __name__ == "__main__":
+	main()
 
 
 # for trial in range(1, 6):
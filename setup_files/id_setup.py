@@ -1,6 +1,8 @@
 import os
 import sys
 from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pipeline"))
+from opensim_io import write_if_changed
 
 # Template XML content
 xml_template = '''<?xml version="1.0" encoding="UTF-8" ?>
@@ -30,31 +32,39 @@ xml_template = '''<?xml version="1.0" encoding="UTF-8" ?>
 </OpenSimDocument>
 '''
 
-if len(sys.argv) < 4:
-	print("Usage: python id_setup.py <sub_directory> <trial_filename> <model_file>")
-	sys.exit(1)
-     
-subjdir = Path(sys.argv[1])
-trial = Path(sys.argv[2]).name.removesuffix('.trc').removeprefix('stw')  # Extract trial from filename
-model_file = Path(sys.argv[3])
-filepath = Path(sys.argv[4])
-# Create output directory if it doesn't exist
-output_dir = rf"{subjdir}\ID\results_id"
-os.makedirs(output_dir, exist_ok=True)
-subject = (subjdir.name)
+def render(subjdir, trial_name, model_file):
+	"""ID setup XML for one trial."""
+	subjdir = Path(subjdir)
+	trial = Path(str(trial_name)).name.removesuffix('.trc').removeprefix('stw')  # Extract trial from filename
+	output_dir = rf"{subjdir}\ID\results_id"
+	return xml_template.format(trial=trial, subject=subjdir.name, model_file=model_file, output_dir=output_dir)
 
 
-xml_content = xml_template.format(trial=trial,subject=subject, model_file=model_file,output_dir=output_dir)
+def main():
+	if len(sys.argv) < 4:
+		print("Usage: python id_setup.py <sub_directory> <trial_filename> <model_file>")
+		sys.exit(1)
 
-# Create filename
-# filename = rf"id_setup_{subject.lower()}_stw{trial}.xml"
-# filepath = os.path.join(output_dir, filename)
+	subjdir = Path(sys.argv[1])
+	model_file = Path(sys.argv[3])
+	filepath = Path(sys.argv[4])
+	# Create output directory if it doesn't exist
+	output_dir = rf"{subjdir}\ID\results_id"
+	os.makedirs(output_dir, exist_ok=True)
 
-# Write to file
-with open(filepath, 'w', encoding='UTF-8') as f:
-	f.write(xml_content)
+	# Create filename
+	# filename = rf"id_setup_{subject.lower()}_stw{trial}.xml"
+	# filepath = os.path.join(output_dir, filename)
 
-print(f"Created: {filepath}")
+	# Write to file (left untouched when the content is the same)
+	if write_if_changed(filepath, render(subjdir, sys.argv[2], model_file)):
+		print(f"Created: {filepath}")
+	else:
+		print(f"Unchanged: {filepath}")
+
+
+if __name__ == "__main__":
+	main()
 
 # Generate files for trials 1 through 5
 # for trial in range(1, 6):
@@ -1,6 +1,8 @@
 import os
 import sys
 from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pipeline"))
+from opensim_io import write_if_changed
 
 # Template XML content
 xml_template = '''<?xml version="1.0" encoding="UTF-8" ?>
@@ -229,31 +231,39 @@ xml_template = '''<?xml version="1.0" encoding="UTF-8" ?>
 
 '''
 
-# Create output directory if it doesn't exist
-if len(sys.argv) < 3:
-	print("Usage: python ik_setup.py <subject_directory> <trial_name> <model_file>")
-	sys.exit(1)
-     
-subjdir = Path(sys.argv[1])
-trial = (sys.argv[2])
-model_file = Path(sys.argv[3])
-trial_trc = Path(sys.argv[4])
-filepath = Path(sys.argv[5])
-# Create output directory if it doesn't exist
-output_dir = rf"{subjdir}\IK"
-os.makedirs(output_dir, exist_ok=True)
-subject = (subjdir.name)
-xml_content = xml_template.format(trial=trial,subject=subject, model_file=model_file, subjdir=subjdir, trial_trc=trial_trc)
+def render(subjdir, trial, model_file, trial_trc):
+	"""IK setup XML for one trial (trial is the full name, e.g. 'stw1')."""
+	subjdir = Path(subjdir)
+	return xml_template.format(trial=trial, subject=subjdir.name, model_file=model_file, subjdir=subjdir, trial_trc=trial_trc)
 
-# Create filename
-# filename = f"ik_setup_{subject}_{trial}.xml"
-# filepath = os.path.join(output_dir, filename)
 
-# Write to file
-with open(filepath, 'w', encoding='UTF-8') as f:
-	f.write(xml_content)
+def main():
+	if len(sys.argv) < 3:
+		print("Usage: python ik_setup.py <subject_directory> <trial_name> <model_file>")
+		sys.exit(1)
 
-print(f"Created: {filepath}")
+	subjdir = Path(sys.argv[1])
+	trial = (sys.argv[2])
+	model_file = Path(sys.argv[3])
+	trial_trc = Path(sys.argv[4])
+	filepath = Path(sys.argv[5])
+	# Create output directory if it doesn't exist
+	output_dir = rf"{subjdir}\IK"
+	os.makedirs(output_dir, exist_ok=True)
+
+	# Create filename
+	# filename = f"ik_setup_{subject}_{trial}.xml"
+	# filepath = os.path.join(output_dir, filename)
+
+	# Write to file (left untouched when the content is the same)
+	if write_if_changed(filepath, render(subjdir, trial, model_file, trial_trc)):
+		print(f"Created: {filepath}")
+	else:
+		print(f"Unchanged: {filepath}")
+
+
+if __name__ == "__main__":
+	main()
 
 # # Generate files for trials 1 through 5
 # for trial in range(1, 6):
@@ -1,14 +1,11 @@
-import os
 import sys
-import csv
-from xml.etree import ElementTree as ET
 from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pipeline"))
+from opensim_io import write_if_changed
+from subject_registry import DEFAULT_SUBJECT_CSV, default_registry
 
-def create_scale_setup(subject_id, mass, height, subj_dir, model_file, output_file):
-    """Create a scale setup XML file for a subject."""
-    
-    # Template XML structure
-    xml_template = """<?xml version="1.0" encoding="UTF-8" ?>
+# Template XML structure
+xml_template = """<?xml version="1.0" encoding="UTF-8" ?>
 <OpenSimDocument Version="40500">
     <ScaleTool name="{subject_id}">
         <!--Mass of the subject in kg.  Subject-specific model generated by scaling step will have this total mass.-->
@@ -473,62 +470,55 @@ def create_scale_setup(subject_id, mass, height, subj_dir, model_file, output_fi
             <max_marker_movement>-1</max_marker_movement>
         </MarkerPlacer>
     </ScaleTool>
-</OpenSimDocument>"""-
-    
-    # Format the XML with subject data
-    xml_content = xml_template.format(
+</OpenSimDocument>"""
+
+
+def render(subject_id, mass, height, model_file):
+    """Scale setup XML for one subject."""
+    return xml_template.format(
         subject_id=subject_id,
         mass=mass,
         height=height,
         model_file=model_file
     )
+
+
+def subject_row(subject_id, registry=None):
+    """(mass, height) of a subject from the subject registry, or None."""
+    details = (registry or default_registry()).get(subject_id)
+    if details is None:
+        return None
+    return details['mass'], details['height']
+
+
+def create_scale_setup(subject_id, mass, height, subj_dir, model_file, output_file):
+    """Create a scale setup XML file for a subject."""
     
-    # Write to file
+    # Write to file (left untouched when the content is the same)
     # output_file = Path(os.path.join(subj_dir,"scale", f"scale_{subject_id}_setup.xml"))
     # os.makedirs(output_file.parent, exist_ok=True)
     
-    with open(output_file, 'w') as f:
-        f.write(xml_content)
-    
-    print(f"Created: {output_file}")
+    if write_if_changed(output_file, render(subject_id, mass, height, model_file)):
+        print(f"Created: {output_file}")
+    else:
+        print(f"Unchanged: {output_file}")
 
 def main():
-    if len(sys.argv) < 4:
-        print("Usage: python scale_setup.py <subject_num>, <subj_dir>, <model_file>")
+    if len(sys.argv) < 5:
+        print("Usage: python scale_setup.py <subject_num>, <subj_dir>, <model_file>, <output_file>")
         sys.exit(1)
-    os.chdir(Path(__file__).parent)  # Change to the directory of the script to ensure relative paths work
-    csv_file = '../Subject Details.csv'  # CSV file with subject_id, mass, height
     subj_dir = Path(sys.argv[2])
     model_file = Path(sys.argv[3])
     filepath = Path(sys.argv[4])
 
-    
-    # Read CSV file
-    try:
-        with open(csv_file, 'r') as f:
-            reader = csv.DictReader(f)
-            print(reader.fieldnames)
-            for row in reader:
-                if row['Subject Number'] == Path(subj_dir).name:
-                    subject_id = row['Subject Number']
-                    mass = row['Weight (kg)']
-                    height = row['Height (m)']
-                    
-                    # subj_dir = os.path.join(subj_dir, subject_id)
-                    create_scale_setup(subject_id, mass, height, subj_dir, model_file, filepath)
-        # for row in reader:
-        #     subject_id = row['subject_id']
-        #     mass = row['mass']
-        #     height = row['height']
-            
-        #     subj_dir = os.path.join(subj_dir, subject_id)
-        #     create_scale_setup(subject_id, mass, height, subj_dir)
-    except FileNotFoundError:
-        print(f"Error: CSV file '{csv_file}' not found")
+    if not DEFAULT_SUBJECT_CSV.is_file():
+        print(f"Error: CSV file '{DEFAULT_SUBJECT_CSV}' not found")
+        sys.exit(1)
+    row = subject_row(subj_dir.name)
+    if row is None:
+        print(f"Error: subject {subj_dir.name} not in '{DEFAULT_SUBJECT_CSV}'")
         sys.exit(1)
-    # except KeyError as e:
-    #     print(f"Error: Missing required column {e} in CSV file")
-    #     sys.exit(1)
+    create_scale_setup(subj_dir.name, *row, subj_dir, model_file, filepath)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file